@@ -0,0 +1,82 @@
+"""
+Latency of CLI commands run in-process against the same commands forwarded to a warm daemon.
+
+Sets up an isolated HOME, state dir, daemon socket and a local fake GitHub
+(fake_github.py), then times each command as a fresh `python -m pylibup`
+process: first with PYLIB_DAEMON=false, then with a running daemon.
+
+Usage:
+    python benchmarks/bench_daemon.py [--runs 7] [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+root = Path(__file__).parent.parent
+sys.path.insert(0, Path(__file__).parent.as_posix())
+
+from fake_github import FakeGithub
+
+
+def get_commands(workdir: Path) -> list:
+    return [
+        ['state', 'local'],
+        ['state', 'merged'],
+        ['repo', 'meta'],
+        ['repo', 'plan', '--no-diff'],
+        # Writes a new metadata.yaml, so in a dir of its own
+        ['repo', 'init', 'other', workdir.joinpath('other').as_posix(), '--overwrite'],
+    ]
+
+
+def timeit(args: list, env: dict, cwd: Path, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-m', 'pylibup', *args], env = env, cwd = cwd, capture_output = True, text = True)
+        timings.append(time.perf_counter() - start)
+        if proc.returncode != 0: raise RuntimeError(f'pylibup {" ".join(args)} failed:\n{proc.stderr[-2000:]}')
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type = int, default = 7)
+    parser.add_argument('--json', dest = 'json_path', default = None, help = 'Write the results to this file')
+    opts = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix = 'pylibup-daemon-'))
+    github = FakeGithub(workdir.joinpath('remotes')).start()
+    project = workdir.joinpath('demo')
+    project.mkdir()
+    shutil.copy(root.joinpath('example', 'metadata_example.yaml'), project.joinpath('metadata.yaml'))
+    env = dict(os.environ, PYTHONPATH = root.as_posix(), HOME = workdir.as_posix(), GITHUB_API_URL = github.url, GITHUB_TOKEN = 'bench-token',
+               PYLIB_STATE_DIR = workdir.joinpath('state').as_posix(), PYLIB_DAEMON_SOCKET = workdir.joinpath('daemon.sock').as_posix())
+    commands, results = get_commands(workdir), []
+    try:
+        inprocess = {' '.join(args): timeit(args, dict(env, PYLIB_DAEMON = 'false'), project, opts.runs) for args in commands}
+        subprocess.run([sys.executable, '-m', 'pylibup', 'daemon', 'start'], env = env, check = True, capture_output = True)
+        try: forwarded = {' '.join(args): timeit(args, env, project, opts.runs) for args in commands}
+        finally: subprocess.run([sys.executable, '-m', 'pylibup', 'daemon', 'stop'], env = env, capture_output = True)
+    finally:
+        github.stop()
+        shutil.rmtree(workdir, ignore_errors = True)
+
+    names = {' '.join(args): args[:3] if args[1] == 'init' else args for args in commands}
+    print(f'{"command":<28}{"in-process ms":>15}{"daemon ms":>11}{"speedup":>9}')
+    for name in inprocess:
+        results.append({'command': ' '.join(names[name]), 'inprocess_ms': inprocess[name] * 1e3, 'daemon_ms': forwarded[name] * 1e3})
+        print(f'{" ".join(names[name]):<28}{inprocess[name] * 1e3:>15.1f}{forwarded[name] * 1e3:>11.1f}{inprocess[name] / forwarded[name]:>8.1f}x')
+
+    if opts.json_path: Path(opts.json_path).write_text(json.dumps({'runs': opts.runs, 'results': results}, indent = 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""
+Offline end-to-end benchmark: init, build, publish and the repo/state CLI
+for 1, 10 and 100 projects, against a local fake GitHub (fake_github.py).
+
+Each size runs in a fresh worker process with its own HOME, state dir and
+workspace, pointed at the fake server (GITHUB_API_URL) and at a dir of
+bare repos as the git remote (PYLIB_GIT_URL). Phases, in order:
+
+- init:      PylibClient.init writes metadata.yaml for every project
+- build:     PylibClient.build with auto_publish (create repo, push, secrets)
+- publish:   PylibClient.publish (commit, push again)
+- cli ...:   `repo plan`, `repo build-many --incremental` over all projects,
+             then `state set`, `state merged` and `repo release` in each project
+             (one CLI process per invocation, as a user would run them)
+
+Per phase it reports wall time, GitHub API calls (by route) and bytes, bytes
+written (wchar/write_bytes from /proc/self/io, including waited-for git and
+CLI processes), peak RSS of the worker and of the largest CLI process.
+Afterwards every bare remote must have the project's HEAD and every project
+a release, or the run fails.
+
+Results are written as JSON; --compare prints the change against an earlier run.
+
+Usage:
+    python benchmarks/bench_e2e.py [--sizes 1 10 100] [--json e2e.json] [--compare baseline.json] [--keep]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import contextlib
+import urllib.request
+from pathlib import Path
+
+root = Path(__file__).parent.parent
+sys.path.insert(0, root.as_posix())
+
+secret_names = ['AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_REGION']
+# Records VmHWM at exit: ru_maxrss of a child also counts the parent's memory it was forked from
+cli_code = (
+    'import os, atexit\n'
+    'from pathlib import Path\n'
+    'atexit.register(lambda: Path(os.environ["BENCH_RSS_FILE"]).write_text(Path("/proc/self/status").read_text()))\n'
+    'from pylibup.cli import baseCli\n'
+    'baseCli(prog_name = "pylibup")\n'
+)
+
+
+def read_proc_io() -> dict:
+    """
+    Bytes written by this process and its waited-for children (Linux only)
+    """
+    try: lines = Path('/proc/self/io').read_text().splitlines()
+    except OSError: return {}
+    values = dict(line.split(': ', 1) for line in lines)
+    return {'wchar': int(values['wchar']), 'write_bytes': int(values['write_bytes'])}
+
+
+def get_peak_rss_mb(status: str = None) -> float:
+    """
+    Peak RSS from VmHWM in /proc/<pid>/status, falling back to ru_maxrss
+    """
+    try: status = status or Path('/proc/self/status').read_text()
+    except OSError: status = ''
+    for line in status.splitlines():
+        if line.startswith('VmHWM:'): return int(line.split()[1]) / 1024
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def get_dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob('*') if f.is_file() and not f.is_symlink())
+
+
+class Worker:
+    def __init__(self, size: int, api_url: str, workspace: Path):
+        self.size = size
+        self.api_url = api_url
+        self.workspace = workspace
+        self.projects_dir = workspace.joinpath('projects')
+        self.names = [f'proj{i:03d}' for i in range(size)]
+        self.phases = []
+        self.errors = []
+        self.cli_rss_mb = 0.0
+
+    def project_dir(self, name: str) -> Path:
+        return self.projects_dir.joinpath(name)
+
+    def api_stats(self) -> dict:
+        with urllib.request.urlopen(f'{self.api_url}/_stats') as resp: return json.loads(resp.read())
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        api, io = self.api_stats(), read_proc_io()
+        self.cli_rss_mb = 0.0
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        api_after, io_after = self.api_stats(), read_proc_io()
+        calls = {k: v - api['calls'].get(k, 0) for k, v in api_after['calls'].items() if v != api['calls'].get(k, 0)}
+        self.phases.append({
+            'name': name, 'seconds': seconds, 'ms_per_project': seconds / self.size * 1e3,
+            'api_calls': sum(calls.values()), 'api_routes': calls,
+            'api_bytes_in': api_after['bytes_in'] - api['bytes_in'], 'api_bytes_out': api_after['bytes_out'] - api['bytes_out'],
+            'wchar': io_after.get('wchar', 0) - io.get('wchar', 0), 'write_bytes': io_after.get('write_bytes', 0) - io.get('write_bytes', 0),
+            'peak_rss_mb': get_peak_rss_mb(), 'cli_peak_rss_mb': self.cli_rss_mb,
+        })
+        print(f'  {name:<24}{seconds:>9.2f}s{sum(calls.values()):>7} calls', flush = True)
+
+    def cli(self, *args: str, cwd: Path = None):
+        """
+        Runs a CLI command in its own process and keeps the peak RSS of the largest one
+        """
+        rss_file = self.workspace.joinpath('cli-status.txt')
+        rss_file.unlink(missing_ok = True)
+        proc = subprocess.run([sys.executable, '-c', cli_code, *args], cwd = cwd or self.workspace, env = dict(os.environ, BENCH_RSS_FILE = rss_file.as_posix()), capture_output = True, text = True)
+        if rss_file.exists(): self.cli_rss_mb = max(self.cli_rss_mb, get_peak_rss_mb(rss_file.read_text()))
+        if proc.returncode != 0: self.errors.append(f'pylibup {" ".join(args)} (in {cwd}): exit {proc.returncode} {proc.stderr.strip()[-500:]}')
+
+    def run(self) -> dict:
+        from pylibup.client import PylibClient
+        self.projects_dir.mkdir(parents = True, exist_ok = True)
+        client = PylibClient(github_token = os.environ['GITHUB_TOKEN'])
+        metadata_files = [self.project_dir(name).joinpath('metadata.yaml').as_posix() for name in self.names]
+        login = client.api.username
+
+        with self.phase('init'):
+            for name in self.names:
+                client.init(project_dir = self.project_dir(name).as_posix(), name = name, secrets = {k: None for k in secret_names})
+        with self.phase('build'):
+            for name, config_file in zip(self.names, metadata_files):
+                client.build(config_file = config_file, project_name = name, project_dir = self.project_dir(name).as_posix(), auto_publish = True, concurrent = True)
+        with self.phase('publish'):
+            for name, config_file in zip(self.names, metadata_files):
+                client.publish(commit_msg = 'Publish', config_file = config_file, project_name = name, project_dir = self.project_dir(name).as_posix())
+        with self.phase('cli repo plan'):
+            self.cli('repo', 'plan', *metadata_files, '--no-diff')
+        with self.phase('cli repo build-many'):
+            self.cli('repo', 'build-many', *metadata_files, '--incremental', '--commit-msg', 'Rebuild')
+        with self.phase('cli state set'):
+            for name in self.names: self.cli('state', 'set', f'repo={login}/{name}', cwd = self.project_dir(name))
+        with self.phase('cli state merged'):
+            for name in self.names: self.cli('state', 'merged', cwd = self.project_dir(name))
+        with self.phase('cli repo release'):
+            for name in self.names: self.cli('repo', 'release', '--no-push', '--tag', 'v0.0.1', cwd = self.project_dir(name))
+        return {'size': self.size, 'phases': self.phases, 'errors': self.errors}
+
+
+def verify(size: int, workspace: Path, api: dict, login: str) -> list:
+    """
+    Returns what's missing: every project pushed to its bare remote, with its secrets and a release
+    """
+    problems = []
+    for i in range(size):
+        name = f'proj{i:03d}'
+        head = subprocess.run(['git', '-C', workspace.joinpath('projects', name).as_posix(), 'rev-parse', 'HEAD'], capture_output = True, text = True).stdout.strip()
+        remote = subprocess.run(['git', '-C', workspace.joinpath('remotes', login, f'{name}.git').as_posix(), 'rev-parse', 'main'], capture_output = True, text = True).stdout.strip()
+        if not head or head != remote: problems.append(f'{name}: remote main {remote[:8] or "missing"} != HEAD {head[:8] or "missing"}')
+    if api['repos'] != size: problems.append(f'{api["repos"]} repos created, expected {size}')
+    if api['secrets'] != size * len(secret_names): problems.append(f'{api["secrets"]} secrets stored, expected {size * len(secret_names)}')
+    if api['releases'] != size: problems.append(f'{api["releases"]} releases created, expected {size}')
+    return problems
+
+
+def get_env(workspace: Path, api_url: str, api_rate_limit: float) -> dict:
+    env = dict(os.environ)
+    home = workspace.joinpath('home')
+    home.mkdir(parents = True, exist_ok = True)
+    home.joinpath('.gitconfig').write_text('[user]\n\tname = Bench\n\temail = bench@example.com\n[init]\n\tdefaultBranch = main\n')
+    env.update({
+        'HOME': home.as_posix(), 'GIT_CONFIG_NOSYSTEM': '1',
+        'PYTHONPATH': os.pathsep.join([root.as_posix()] + [p for p in env.get('PYTHONPATH', '').split(os.pathsep) if p]),
+        'GITHUB_API_URL': api_url, 'GITHUB_TOKEN': 'bench-token',
+        'PYLIB_GIT_URL': workspace.joinpath('remotes').as_posix(),
+        'PYLIB_STATE_DIR': workspace.joinpath('state').as_posix(),
+        'PYLIB_API_RATE_LIMIT': str(api_rate_limit),
+    })
+    env.update({k: f'bench-{k.lower()}' for k in secret_names})
+    return env
+
+
+def run_size(size: int, github, workspace: Path, api_rate_limit: float, verbose: bool = False) -> dict:
+    github.reset(data = True)
+    github.remotes_dir = workspace.joinpath('remotes')
+    result_file = workspace.joinpath('result.json')
+    print(f'{size} projects', flush = True)
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, Path(__file__).as_posix(), '--worker', str(size), '--api-url', github.url, '--workspace', workspace.as_posix()],
+        env = get_env(workspace, github.url, api_rate_limit), cwd = workspace, stderr = None if verbose else subprocess.PIPE, text = True,
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0 or not result_file.exists(): raise RuntimeError(f'Worker for {size} projects failed:\n{(proc.stderr or "")[-4000:]}')
+    result = json.loads(result_file.read_text())
+    api = github.stats()
+    result.update({
+        'wall_seconds': wall, 'api_calls': api['total_calls'], 'api_routes': api['calls'], 'api_bytes_in': api['bytes_in'], 'api_bytes_out': api['bytes_out'],
+        'wchar': sum(p['wchar'] for p in result['phases']), 'write_bytes': sum(p['write_bytes'] for p in result['phases']),
+        'disk_bytes': get_dir_size(workspace.joinpath('projects')) + get_dir_size(workspace.joinpath('remotes')),
+        'peak_rss_mb': max(p['peak_rss_mb'] for p in result['phases']), 'cli_peak_rss_mb': max(p['cli_peak_rss_mb'] for p in result['phases']),
+    })
+    result['errors'] += verify(size, workspace, api, github.login)
+    return result
+
+
+def get_metadata() -> dict:
+    from pylibup.version import VERSION
+    sha = subprocess.run(['git', '-C', root.as_posix(), 'rev-parse', '--short', 'HEAD'], capture_output = True, text = True).stdout.strip()
+    git_version = subprocess.run(['git', '--version'], capture_output = True, text = True).stdout.strip()
+    return {'pylibup_version': VERSION, 'git_sha': sha or None, 'python': platform.python_version(), 'platform': platform.platform(), 'git': git_version, 'cpus': os.cpu_count(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def format_change(new: float, old: float) -> str:
+    if not old: return ''
+    return f'{(new - old) / old * 100:+.1f}%'
+
+
+def format_mb(mb: float) -> str:
+    return f'{mb:.1f}' if mb else '-'
+
+
+def print_results(results: list, baseline: dict = None):
+    old = {r['size']: r for r in (baseline or {}).get('results', [])}
+    print(f'\n{"projects":>8}  {"phase":<22}{"seconds":>9}{"ms/proj":>9}{"calls":>7}{"KB written":>12}{"rss MB":>8}{"cli MB":>8}' + ('  vs baseline' if old else ''))
+    for r in results:
+        old_phases = {p['name']: p for p in old.get(r['size'], {}).get('phases', [])}
+        for p in r['phases']:
+            change = format_change(p['seconds'], old_phases[p['name']]['seconds']) if p['name'] in old_phases else ''
+            print(f'{r["size"]:>8}  {p["name"]:<22}{p["seconds"]:>9.2f}{p["ms_per_project"]:>9.1f}{p["api_calls"]:>7}{p["wchar"] / 1024:>12.0f}{p["peak_rss_mb"]:>8.1f}{format_mb(p["cli_peak_rss_mb"]):>8}  {change}')
+        change = format_change(r['wall_seconds'], old[r['size']]['wall_seconds']) if r['size'] in old else ''
+        print(f'{r["size"]:>8}  {"total":<22}{r["wall_seconds"]:>9.2f}{r["wall_seconds"] / r["size"] * 1e3:>9.1f}{r["api_calls"]:>7}{r["wchar"] / 1024:>12.0f}{r["peak_rss_mb"]:>8.1f}{format_mb(r["cli_peak_rss_mb"]):>8}  {change}')
+        for error in r['errors']: print(f'          error: {error}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [1, 10, 100], help = 'Numbers of projects to run')
+    parser.add_argument('--json', dest = 'json_path', default = 'e2e.json', help = 'Write the results to this file')
+    parser.add_argument('--compare', default = None, help = 'Results of an earlier run to compare against')
+    parser.add_argument('--workdir', default = None, help = 'Dir for the workspaces. Defaults to a temp dir')
+    parser.add_argument('--api-rate-limit', type = float, default = 1000.0, help = 'PYLIB_API_RATE_LIMIT for the workers. The default of 10/s would dominate the timings')
+    parser.add_argument('--keep', action = 'store_true', help = 'Keep the workspaces')
+    parser.add_argument('--verbose', action = 'store_true', help = 'Show the worker output')
+    parser.add_argument('--worker', type = int, default = None, help = argparse.SUPPRESS)
+    parser.add_argument('--api-url', default = None, help = argparse.SUPPRESS)
+    parser.add_argument('--workspace', default = None, help = argparse.SUPPRESS)
+    opts = parser.parse_args()
+
+    if opts.worker is not None:
+        workspace = Path(opts.workspace)
+        result = Worker(opts.worker, opts.api_url, workspace).run()
+        workspace.joinpath('result.json').write_text(json.dumps(result))
+        return
+
+    from fake_github import FakeGithub
+    workdir = Path(opts.workdir or tempfile.mkdtemp(prefix = 'pylibup-e2e-')).resolve()
+    github = FakeGithub(workdir.joinpath('remotes')).start()
+    results = []
+    try:
+        for size in opts.sizes:
+            workspace = workdir.joinpath(f'n{size}')
+            shutil.rmtree(workspace, ignore_errors = True)
+            workspace.mkdir(parents = True)
+            results.append(run_size(size, github, workspace, opts.api_rate_limit, verbose = opts.verbose))
+            if not opts.keep: shutil.rmtree(workspace, ignore_errors = True)
+    finally:
+        github.stop()
+        if not opts.keep and not opts.workdir: shutil.rmtree(workdir, ignore_errors = True)
+
+    baseline = json.loads(Path(opts.compare).read_text()) if opts.compare else None
+    print_results(results, baseline)
+    if opts.json_path: Path(opts.json_path).write_text(json.dumps({'metadata': dict(get_metadata(), api_rate_limit = opts.api_rate_limit), 'results': results}, indent = 2))
+    sys.exit(1 if any(r['errors'] for r in results) else 0)
+
+
+if __name__ == '__main__':
+    main()
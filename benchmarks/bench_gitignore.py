@@ -0,0 +1,139 @@
+"""
+Throughput of the compiled gitignore matcher against the previous substring check.
+
+Generates a synthetic project tree (thousands of paths) and a few dozen
+gitignore patterns, then times:
+
+- substring: the old `should_add_to_commit` two-way substring containment
+- compiled: `pylibup.ignore.GitIgnore` without negations (one combined regex)
+- compiled+negation: the same patterns plus `!` rules (last match wins)
+
+With --verify (the default when git is on PATH) both pattern sets are also
+checked against `git check-ignore` in a scratch repo, and the run fails on
+any disagreement.
+
+Usage:
+    python benchmarks/bench_gitignore.py [--files 5000] [--repeat 5] [--no-verify] [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, Path(__file__).parent.parent.as_posix())
+
+from pylibup.ignore import GitIgnore
+from pylibup.static import default_metadata_gitignores
+
+
+extra_patterns = [
+    '*.pyc', '*.pyo', '*.so', '.env', '.env.*', '/docs/_build/', 'node_modules/', '*.log',
+    'coverage/', '.coverage', 'htmlcov/', '.tox/', '.mypy_cache/', '.pytest_cache/', '*.swp',
+    'tmp/**', '**/fixtures/*.json', 'data/*.csv', '*.sqlite3', 'secrets.y?ml', '[Tt]humbs.db',
+    'vendor/', 'out/', '*.tar.gz', '.idea/', 'notebooks/**/*.ipynb', 'scratch*', '*.bak',
+]
+negation_patterns = ['!keep.log', '!data/schema.csv', '!**/fixtures/base.json', '!.env.example']
+
+dirs = ['', 'src', 'src/pkg', 'src/pkg/sub', 'tests', 'docs', 'docs/_build', 'build', 'dist', 'data', 'tmp',
+        'node_modules/lib', 'app', 'app/routes', 'notebooks/x', 'src/pkg/fixtures', 'coverage', '.tox/py3', 'logs']
+names = ['module.py', 'module.pyc', 'README.md', 'setup.py', 'build.sh', 'notes.log', 'keep.log', 'data.csv',
+         'schema.csv', 'base.json', 'extra.json', 'test_x.py', 'x_test.py', 'meta.yaml', 'metadata.yaml',
+         'state.yaml', 'Thumbs.db', 'secrets.yaml', 'archive.tar.gz', 'analysis.ipynb', '.env', '.env.example',
+         'index.html', 'lib.so', 'scratch.txt', 'app.bak', 'cache.db', 'config.toml']
+
+
+def make_paths(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    paths = set()
+    while len(paths) < count:
+        d = rng.choice(dirs)
+        name = rng.choice(names)
+        if rng.random() < 0.5: name = f'{rng.randint(0, 999)}_{name}'
+        paths.add(f'{d}/{name}' if d else name)
+    return sorted(paths)
+
+
+def substring_ignored(filename: str, patterns: list) -> bool:
+    return any(i in filename or filename in i for i in patterns)
+
+
+def timeit(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def git_check_ignore(patterns: list, paths: list) -> set:
+    """
+    Returns the paths git considers ignored
+    """
+    tmp = Path(tempfile.mkdtemp(prefix = 'pylibup-gitignore-'))
+    try:
+        subprocess.run(['git', 'init', '-q', tmp.as_posix()], check = True)
+        tmp.joinpath('.gitignore').write_text('\n'.join(patterns) + '\n')
+        for path in paths:
+            fpath = tmp.joinpath(path)
+            fpath.parent.mkdir(parents = True, exist_ok = True)
+            fpath.touch()
+        proc = subprocess.run(['git', 'check-ignore', '--stdin', '--no-index'], cwd = tmp, input = '\n'.join(paths), capture_output = True, text = True)
+        return set(proc.stdout.splitlines())
+    finally:
+        shutil.rmtree(tmp, ignore_errors = True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type = int, default = 5000)
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--no-verify', dest = 'verify', action = 'store_false', help = 'Skip the git check-ignore comparison')
+    parser.add_argument('--json', dest = 'json_path', default = None, help = 'Write the results to this file')
+    opts = parser.parse_args()
+
+    paths = make_paths(opts.files)
+    patterns = list(default_metadata_gitignores) + extra_patterns
+    pattern_sets = {'compiled': patterns, 'compiled+negation': patterns + negation_patterns}
+    results, failed = {'files': len(paths), 'patterns': len(patterns), 'cases': {}}, False
+
+    substring_s = timeit(lambda: [substring_ignored(p, patterns) for p in paths], opts.repeat)
+    results['cases']['substring'] = {'seconds': substring_s, 'us_per_path': substring_s / len(paths) * 1e6}
+    print(f'{len(paths)} paths, {len(patterns)} patterns\n')
+    print(f'{"case":<20}{"compile ms":>12}{"total ms":>10}{"us/path":>10}{"ignored":>9}{"vs git":>10}')
+    print(f'{"substring":<20}{"-":>12}{substring_s * 1e3:>10.2f}{substring_s / len(paths) * 1e6:>10.2f}{sum(substring_ignored(p, patterns) for p in paths):>9}{"-":>10}')
+
+    verify = opts.verify and shutil.which('git') is not None
+    for name, pattern_set in pattern_sets.items():
+        start = time.perf_counter()
+        GitIgnore(pattern_set)
+        compile_s = time.perf_counter() - start
+        # A fresh matcher per run, so the per-dir cache doesn't carry over between runs
+        total_s = timeit(lambda: GitIgnore(pattern_set).filter(paths), opts.repeat)
+        ignored = {p for p in paths if GitIgnore(pattern_set).is_ignored(p)}
+        mismatches = None
+        if verify:
+            expected = git_check_ignore(pattern_set, paths)
+            mismatches = sorted(expected ^ ignored)
+            failed |= bool(mismatches)
+        results['cases'][name] = {
+            'compile_ms': compile_s * 1e3, 'seconds': total_s, 'us_per_path': total_s / len(paths) * 1e6,
+            'ignored': len(ignored), 'git_mismatches': mismatches,
+        }
+        status = '-' if mismatches is None else ('ok' if not mismatches else f'{len(mismatches)} diff')
+        print(f'{name:<20}{compile_s * 1e3:>12.2f}{total_s * 1e3:>10.2f}{total_s / len(paths) * 1e6:>10.2f}{len(ignored):>9}{status:>10}')
+        if mismatches: print('  e.g. ' + ', '.join(mismatches[:10]))
+
+    if opts.json_path: Path(opts.json_path).write_text(json.dumps(results, indent = 2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Import-time regression benchmark for the pylibup CLI.
+
+Runs `python -X importtime` for the CLI entry point and a few modules,
+reports the median cumulative import time of each, and fails when:
+
+- a target takes longer than its budget, or
+- a lightweight command (state/meta) imports a heavy dependency.
+
+Usage:
+    python benchmarks/bench_importtime.py [--runs 7] [--json results.json] [--scale 1.0]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+root = Path(__file__).parent.parent
+
+# target module -> budget in ms (cumulative import time, median of runs)
+budgets = {
+    'pylibup': 10,
+    # the console entry point, which forwards to the daemon before importing anything else
+    'pylibup.daemon': 40,
+    'pylibup.cli': 150,
+    'pylibup.serializers': 60,
+    'pylibup.classes': 800,
+}
+
+heavy_modules = {'github', 'git', 'jinja2', 'requests', 'pydantic', 'urllib3', 'nacl'}
+
+# commands that must not import any of the heavy modules
+light_commands = [
+    ['state', 'local'],
+    ['state', 'global'],
+    ['state', 'merged'],
+    ['repo', 'meta', os.devnull],
+]
+
+
+def get_env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([root.as_posix()] + [p for p in env.get('PYTHONPATH', '').split(os.pathsep) if p])
+    return env
+
+
+def measure_import(module: str) -> float:
+    """
+    Returns the cumulative import time of `module` in ms
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output = True, text = True, env = get_env(), cwd = root.parent)
+    if proc.returncode != 0: raise RuntimeError(proc.stderr)
+    for line in reversed(proc.stderr.splitlines()):
+        if not line.startswith('import time:'): continue
+        _, cumulative, name = [p.strip() for p in line[len('import time:'):].split('|')]
+        if name == module: return int(cumulative) / 1000
+    raise RuntimeError(f'{module} not found in importtime output')
+
+
+def check_command(args) -> list:
+    """
+    Runs a CLI command in-process and returns the heavy modules it imported
+    """
+    code = (
+        'import sys\n'
+        'from pylibup.cli import baseCli\n'
+        'try: baseCli(%r, standalone_mode=False)\n'
+        'except SystemExit: pass\n'
+        'print(",".join(sorted({m.split(".")[0] for m in sys.modules} & %r)))\n'
+    ) % (args, heavy_modules)
+    proc = subprocess.run([sys.executable, '-c', code], capture_output = True, text = True, env = get_env(), cwd = root.parent)
+    if proc.returncode != 0: raise RuntimeError(proc.stderr)
+    out = proc.stdout.strip().splitlines()
+    return [m for m in out[-1].split(',') if m] if out else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type = int, default = 7)
+    parser.add_argument('--scale', type = float, default = 1.0, help = 'Multiplier applied to every budget (for slow CI machines)')
+    parser.add_argument('--json', dest = 'json_path', default = None, help = 'Write the results to this file')
+    opts = parser.parse_args()
+
+    results, failed = {'imports': {}, 'commands': {}}, False
+    print(f'{"target":<24}{"median ms":>12}{"min ms":>10}{"budget":>10}')
+    for module, budget in budgets.items():
+        timings = [measure_import(module) for _ in range(opts.runs)]
+        median, budget = statistics.median(timings), budget * opts.scale
+        ok = median <= budget
+        failed |= not ok
+        results['imports'][module] = {'median_ms': round(median, 2), 'min_ms': round(min(timings), 2), 'budget_ms': budget, 'ok': ok}
+        print(f'{module:<24}{median:>12.1f}{min(timings):>10.1f}{budget:>10.0f}{"" if ok else "  OVER BUDGET"}')
+
+    print()
+    for args in light_commands:
+        imported = check_command(args)
+        failed |= bool(imported)
+        results['commands'][' '.join(args)] = {'heavy_imports': imported, 'ok': not imported}
+        print(f'pylibup {" ".join(args):<32}{"ok" if not imported else "imports " + ", ".join(imported)}')
+
+    if opts.json_path: Path(opts.json_path).write_text(json.dumps(results, indent = 2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Load/dump throughput of the pylibup serializer backends.
+
+Measures every available backend of `Json`, `Yaml` and `Pkl` over documents
+shaped like the ones pylibup actually reads and writes:
+
+- metadata: a project metadata.yaml (default metadata with extra modules/secrets)
+- state: a global state file with pushed secret hashes for many repos
+- etag: a cached GitHub API response (list of repos)
+
+Usage:
+    python benchmarks/bench_serializers.py [--repeat 5] [--scale 1] [--json results.json]
+"""
+import sys
+import copy
+import yaml
+import json
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, Path(__file__).parent.parent.as_posix())
+
+from pylibup.serializers import Json, Yaml, Pkl, Base, orjson
+from pylibup.static import default_pylib_metadata
+
+
+def make_metadata(scale: int) -> dict:
+    data = copy.deepcopy(default_pylib_metadata)
+    data['repo'] = 'someuser/somelib'
+    data['readme_text'] = 'A library. ' * 20
+    data['structure']['modules'] += [f'module_{i}' for i in range(10 * scale)]
+    data['secrets'].update({f'SECRET_{i}': {'from': f'SOURCE_SECRET_{i}'} for i in range(10 * scale)})
+    data['setup']['requirements'] += [f'package-{i}>=1.{i}' for i in range(10 * scale)]
+    return data
+
+
+def make_state(scale: int) -> dict:
+    return {
+        'github_token': 'x' * 40,
+        'pypi_user': 'someuser',
+        'pushed_secrets': {
+            f'someuser/lib{r}': {f'SECRET_{i}': Base.hash_encode(f'{r}:{i}') for i in range(8)}
+            for r in range(50 * scale)
+        },
+    }
+
+
+def make_etag(scale: int) -> dict:
+    return {
+        'etag': 'W/"' + 'a' * 64 + '"',
+        'status_code': 200,
+        'data': [
+            {'id': i, 'name': f'lib{i}', 'full_name': f'someuser/lib{i}', 'private': bool(i % 2), 'description': None,
+             'owner': {'login': 'someuser', 'id': 1, 'type': 'User'}, 'topics': ['python', 'library'],
+             'stargazers_count': i * 3, 'default_branch': 'main', 'size': i * 1024}
+            for i in range(30 * scale)
+        ],
+    }
+
+
+def get_backends():
+    """
+    Yields (name, setup, dumps, loads) for every available backend
+    """
+    for backend in Yaml.backends:
+        if backend == 'c' and not getattr(yaml, '__with_libyaml__', False): continue
+        yield f'yaml[{backend}]', (lambda b = backend: Yaml.set_backend(b)), Yaml.dumps, Yaml.loads
+    for backend in Json.backends:
+        if backend == 'orjson' and orjson is None: continue
+        # fast = True is how the manifest and ETag cache opt in to orjson's dumps
+        yield f'json[{backend}]', (lambda b = backend: Json.set_backend(b)), (lambda obj: Json.dumps(obj, fast = True)), Json.loads
+    yield 'pickle', (lambda: None), Pkl.dumps, Pkl.loads
+
+
+def timeit(func, arg, repeat: int, min_time: float = 0.05) -> float:
+    """
+    Returns the median seconds per call
+    """
+    loops, start = 0, time.perf_counter()
+    while time.perf_counter() - start < min_time:
+        func(arg)
+        loops += 1
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops): func(arg)
+        timings.append((time.perf_counter() - start) / loops)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--scale', type = int, default = 1, help = 'Multiplies the size of each document')
+    parser.add_argument('--json', dest = 'json_path', default = None, help = 'Write the results to this file')
+    opts = parser.parse_args()
+
+    documents = {'metadata': make_metadata(opts.scale), 'state': make_state(opts.scale), 'etag': make_etag(opts.scale)}
+    defaults = (Yaml.backend, Json.backend)
+    results = []
+    print(f'{"document":<10}{"backend":<16}{"size KB":>9}{"dump us":>11}{"load us":>11}{"dump MB/s":>11}{"load MB/s":>11}')
+    for doc_name, doc in documents.items():
+        for name, setup, dumps, loads in get_backends():
+            setup()
+            payload = dumps(doc)
+            size = len(payload)
+            dump_s, load_s = timeit(dumps, doc, opts.repeat), timeit(loads, payload, opts.repeat)
+            assert loads(payload) == doc, f'{name} did not round-trip {doc_name}'
+            results.append({
+                'document': doc_name, 'backend': name, 'bytes': size,
+                'dump_us': round(dump_s * 1e6, 2), 'load_us': round(load_s * 1e6, 2),
+                'dump_mb_s': round(size / dump_s / 1e6, 2), 'load_mb_s': round(size / load_s / 1e6, 2),
+            })
+            r = results[-1]
+            print(f'{doc_name:<10}{name:<16}{size / 1024:>9.1f}{r["dump_us"]:>11.1f}{r["load_us"]:>11.1f}{r["dump_mb_s"]:>11.1f}{r["load_mb_s"]:>11.1f}')
+        print()
+    Yaml.set_backend(defaults[0])
+    Json.set_backend(defaults[1])
+    print(f'defaults: yaml[{defaults[0]}], json[{defaults[1]}]')
+    if opts.json_path: Path(opts.json_path).write_text(json.dumps({'defaults': {'yaml': defaults[0], 'json': defaults[1]}, 'results': results}, indent = 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Throughput of `pylibup.utils.TextMatcher` against the previous per-pattern loop.
+
+Matches a large listing (environment-style names and file paths) against
+pattern lists of increasing size, in substring and exact mode.
+
+Usage:
+    python benchmarks/bench_textmatch.py [--texts 20000] [--repeat 5] [--json results.json]
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, Path(__file__).parent.parent.as_posix())
+
+from pylibup.utils import TextMatcher
+
+
+words = ['aws', 'access', 'key', 'secret', 'region', 'github', 'token', 'pypi', 'user', 'password', 'docker',
+         'image', 'repo', 'build', 'cache', 'path', 'home', 'lang', 'shell', 'term', 'python', 'src', 'lib', 'app']
+
+
+def make_texts(count: int, rng: random.Random) -> list:
+    texts = []
+    for i in range(count):
+        parts = rng.sample(words, rng.randint(2, 4))
+        texts.append('_'.join(parts).upper() if i % 2 else '/'.join(parts) + f'/{i}.py')
+    return texts
+
+
+def make_patterns(count: int, rng: random.Random) -> list:
+    return sorted({'_'.join(rng.sample(words, 2)).upper() + f'_{i}' if i % 3 else rng.choice(words) + str(i) for i in range(count)})
+
+
+def loop_match(text: str, items: list, exact: bool) -> bool:
+    for i in items:
+        if (exact and i == text) or (not exact and (i in text or text in i)): return True
+    return False
+
+
+def timeit(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--texts', type = int, default = 20000)
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--json', dest = 'json_path', default = None, help = 'Write the results to this file')
+    opts = parser.parse_args()
+
+    rng = random.Random(0)
+    texts = make_texts(opts.texts, rng)
+    results = []
+    print(f'{len(texts)} texts\n')
+    print(f'{"mode":<11}{"patterns":>9}{"loop ms":>10}{"matcher ms":>12}{"compile ms":>12}{"speedup":>9}')
+    for exact in (False, True):
+        for count in (10, 100, 1000):
+            patterns = make_patterns(count, rng)
+            start = time.perf_counter()
+            matcher = TextMatcher(patterns, exact = exact)
+            compile_s = time.perf_counter() - start
+            assert matcher.match_many(texts) == [loop_match(t, patterns, exact) for t in texts]
+            loop_s = timeit(lambda: [loop_match(t, patterns, exact) for t in texts], opts.repeat)
+            matcher_s = timeit(lambda: matcher.match_many(texts), opts.repeat)
+            mode = 'exact' if exact else 'substring'
+            results.append({'mode': mode, 'patterns': len(patterns), 'loop_ms': loop_s * 1e3, 'matcher_ms': matcher_s * 1e3, 'compile_ms': compile_s * 1e3})
+            print(f'{mode:<11}{len(patterns):>9}{loop_s * 1e3:>10.1f}{matcher_s * 1e3:>12.1f}{compile_s * 1e3:>12.2f}{loop_s / matcher_s:>8.1f}x')
+
+    if opts.json_path: Path(opts.json_path).write_text(json.dumps({'texts': len(texts), 'results': results}, indent = 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""
+A local stand-in for the parts of the GitHub REST API pylibup uses.
+
+Serves users, repos, the actions secrets public key, secrets, git tags/refs
+and releases from memory. Creating a repo also creates a bare git repo under
+`remotes_dir/<owner>/<name>.git`, so with `PYLIB_GIT_URL=<remotes_dir>` pushes
+go there instead of github.com. Uploaded secrets are decrypted with the
+server's key, which checks that the client sealed them correctly.
+
+Every request is counted per route (with owners, names and ids replaced by
+placeholders) along with the bytes received and sent. `GET /_stats` returns
+the counters without being counted, and `POST /_reset` clears them.
+
+Usage:
+    python benchmarks/fake_github.py [--port 8000] [--remotes /tmp/remotes] [--login bench]
+"""
+import re
+import json
+import time
+import base64
+import hashlib
+import argparse
+import threading
+import subprocess
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from nacl import public, encoding
+
+
+route_patterns = [
+    (re.compile(r'^/repos/[^/]+/[^/]+/actions/secrets/public-key$'), '/repos/{repo}/actions/secrets/public-key'),
+    (re.compile(r'^/repos/[^/]+/[^/]+/actions/secrets/[^/]+$'), '/repos/{repo}/actions/secrets/{name}'),
+    (re.compile(r'^/repos/[^/]+/[^/]+/git/tags$'), '/repos/{repo}/git/tags'),
+    (re.compile(r'^/repos/[^/]+/[^/]+/git/refs$'), '/repos/{repo}/git/refs'),
+    (re.compile(r'^/repos/[^/]+/[^/]+/releases$'), '/repos/{repo}/releases'),
+    (re.compile(r'^/repos/[^/]+/[^/]+$'), '/repos/{repo}'),
+    (re.compile(r'^/users/[^/]+$'), '/users/{user}'),
+]
+
+
+def get_route(method: str, path: str) -> str:
+    path = path.split('?', 1)[0].rstrip('/') or '/'
+    for pattern, route in route_patterns:
+        if pattern.match(path): return f'{method} {route}'
+    return f'{method} {path}'
+
+
+class FakeGithub:
+    def __init__(self, remotes_dir: Path, login: str = 'bench', host: str = '127.0.0.1', port: int = 0):
+        self.remotes_dir = Path(remotes_dir)
+        self.login = login
+        self.private_key = public.PrivateKey.generate()
+        self.public_key = self.private_key.public_key.encode(encoding.Base64Encoder()).decode()
+        self.lock = threading.Lock()
+        self.reset(data = True)
+        self.server = ThreadingHTTPServer((host, port), FakeGithubHandler)
+        self.server.daemon_threads = True
+        self.server.github = self
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakeGithub':
+        self.thread = threading.Thread(target = self.server.serve_forever, name = 'fake-github', daemon = True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self, data: bool = False):
+        """
+        Clears the counters, and with `data` the repos, secrets, tags and releases too
+        """
+        with self.lock:
+            if data: self.repos, self.secrets, self.tags, self.refs, self.releases = {}, {}, {}, {}, {}
+            self.calls = {}
+            self.bytes_in = 0
+            self.bytes_out = 0
+
+    def record(self, route: str, bytes_in: int, bytes_out: int):
+        with self.lock:
+            self.calls[route] = self.calls.get(route, 0) + 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'calls': dict(sorted(self.calls.items())), 'total_calls': sum(self.calls.values()),
+                'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out,
+                'repos': len(self.repos), 'secrets': sum(len(s) for s in self.secrets.values()),
+                'releases': sum(len(r) for r in self.releases.values()),
+            }
+
+    def user(self, login: str) -> dict:
+        return {'login': login, 'id': int(hashlib.sha1(login.encode()).hexdigest()[:6], 16), 'type': 'User', 'name': login.title(), 'email': f'{login}@example.com', 'url': f'{self.url}/users/{login}'}
+
+    def repo(self, full_name: str, private: bool = True) -> dict:
+        owner, name = full_name.split('/', 1)
+        return {'id': int(hashlib.sha1(full_name.encode()).hexdigest()[:8], 16), 'name': name, 'full_name': full_name, 'private': private, 'owner': self.user(owner), 'default_branch': 'main', 'url': f'{self.url}/repos/{full_name}'}
+
+    def create_repo(self, owner: str, data: dict):
+        full_name = f'{owner}/{data["name"]}'
+        with self.lock:
+            if full_name in self.repos: return 422, {'message': 'Repository creation failed.', 'errors': [{'message': 'name already exists on this account'}]}
+            self.repos[full_name] = self.repo(full_name, private = data.get('private', True))
+        remote = self.remotes_dir.joinpath(owner, f'{data["name"]}.git')
+        remote.parent.mkdir(parents = True, exist_ok = True)
+        subprocess.run(['git', 'init', '-q', '--bare', remote.as_posix()], check = True)
+        return 201, self.repos[full_name]
+
+    def put_secret(self, full_name: str, name: str, data: dict):
+        value = public.SealedBox(self.private_key).decrypt(base64.b64decode(data['encrypted_value'])).decode()
+        with self.lock:
+            secrets = self.secrets.setdefault(full_name, {})
+            existed = name in secrets
+            secrets[name] = value
+        return (204 if existed else 201), None
+
+    def create_tag(self, full_name: str, data: dict):
+        sha = hashlib.sha1(f'{full_name}:{data["tag"]}:{data["object"]}:{time.time_ns()}'.encode()).hexdigest()
+        with self.lock: self.tags[sha] = data
+        return 201, {'sha': sha, 'tag': data['tag'], 'message': data.get('message', ''), 'object': {'sha': data['object'], 'type': data.get('type', 'commit')}}
+
+    def create_ref(self, full_name: str, data: dict):
+        with self.lock:
+            refs = self.refs.setdefault(full_name, {})
+            if data['ref'] in refs: return 422, {'message': 'Reference already exists'}
+            refs[data['ref']] = data['sha']
+        return 201, {'ref': data['ref'], 'object': {'sha': data['sha'], 'type': 'tag'}}
+
+    def create_release(self, full_name: str, data: dict):
+        with self.lock:
+            releases = self.releases.setdefault(full_name, [])
+            release = dict(data, id = len(releases) + 1, html_url = f'{self.url}/{full_name}/releases/tag/{data["tag_name"]}')
+            releases.append(release)
+        return 201, release
+
+    def handle(self, method: str, path: str, data: dict):
+        """
+        Returns the (status, body) for a request
+        """
+        parts = path.split('?', 1)[0].strip('/').split('/')
+        if method == 'GET':
+            if parts == ['user']: return 200, self.user(self.login)
+            if len(parts) == 2 and parts[0] == 'users': return 200, self.user(parts[1])
+            if len(parts) >= 3 and parts[0] == 'repos':
+                full_name = f'{parts[1]}/{parts[2]}'
+                if full_name not in self.repos: return 404, {'message': 'Not Found'}
+                if len(parts) == 3: return 200, self.repos[full_name]
+                if parts[3:] == ['actions', 'secrets', 'public-key']: return 200, {'key_id': '568250167242549743', 'key': self.public_key}
+                if parts[3:] == ['releases']: return 200, self.releases.get(full_name, [])
+        elif method == 'POST':
+            if parts == ['user', 'repos']: return self.create_repo(self.login, data)
+            if len(parts) == 3 and parts[0] == 'orgs' and parts[2] == 'repos': return self.create_repo(parts[1], data)
+            if len(parts) >= 4 and parts[0] == 'repos':
+                full_name = f'{parts[1]}/{parts[2]}'
+                if full_name not in self.repos: return 404, {'message': 'Not Found'}
+                if parts[3:] == ['git', 'tags']: return self.create_tag(full_name, data)
+                if parts[3:] == ['git', 'refs']: return self.create_ref(full_name, data)
+                if parts[3:] == ['releases']: return self.create_release(full_name, data)
+        elif method == 'PUT':
+            if len(parts) == 6 and parts[0] == 'repos' and parts[3:5] == ['actions', 'secrets']:
+                full_name = f'{parts[1]}/{parts[2]}'
+                if full_name not in self.repos: return 404, {'message': 'Not Found'}
+                return self.put_secret(full_name, parts[5], data)
+        return 404, {'message': 'Not Found'}
+
+
+class FakeGithubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; with Nagle on, keep-alive clients wait out a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args): pass
+
+    def send_json(self, status: int, body = None, etag: str = None) -> int:
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        if etag: self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(data)
+        return len(data)
+
+    def dispatch(self, method: str):
+        github: FakeGithub = self.server.github
+        size = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(size) if size else b''
+        if self.path == '/_stats' and method == 'GET': return self.send_json(200, github.stats())
+        if self.path == '/_reset' and method == 'POST':
+            github.reset()
+            return self.send_json(204)
+        try: status, body = github.handle(method, self.path, json.loads(raw) if raw else {})
+        except Exception as e: status, body = 400, {'message': f'{type(e).__name__}: {e}'}
+        etag = None
+        if method == 'GET' and status == 200:
+            etag = '"' + hashlib.sha1(json.dumps(body, sort_keys = True).encode()).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag: status, body = 304, None
+        sent = self.send_json(status, body, etag)
+        github.record(get_route(method, self.path), len(raw), sent)
+
+    def do_GET(self): self.dispatch('GET')
+    def do_POST(self): self.dispatch('POST')
+    def do_PUT(self): self.dispatch('PUT')
+    def do_PATCH(self): self.dispatch('PATCH')
+    def do_DELETE(self): self.dispatch('DELETE')
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8000)
+    parser.add_argument('--remotes', default = 'remotes', help = 'Dir the bare repos are created in')
+    parser.add_argument('--login', default = 'bench', help = 'Login of the authenticated user')
+    opts = parser.parse_args()
+    github = FakeGithub(Path(opts.remotes).resolve(), login = opts.login, host = opts.host, port = opts.port)
+    print(f'Serving on {github.url}, bare repos in {github.remotes_dir}')
+    print(f'  GITHUB_API_URL={github.url} PYLIB_GIT_URL={github.remotes_dir}')
+    try: github.server.serve_forever()
+    except KeyboardInterrupt: github.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,43 @@
-from . import static
-from . import types
-from . import utils
-from . import serializers
-from . import envs
-from . import config
-from . import classes
-from . import client
+"""
+Submodules are imported on first access (PEP 562), so that lightweight
+entry points like `pylibup state local` don't pay for PyGithub, GitPython,
+Jinja2, requests and pydantic at startup.
+"""
+import importlib
+
+_submodules = [
+    'static',
+    'templates',
+    'types',
+    'utils',
+    'trace',
+    'serializers',
+    'envs',
+    'config',
+    'version',
+    'config_cache',
+    'manifest',
+    'ignore',
+    'runner',
+    'session',
+    'api',
+    'state',
+    'repo_secrets',
+    'classes',
+    'client',
+    'batch',
+    'plan',
+    'fleet',
+    'watch',
+    'daemon',
+]
+
+def __getattr__(name: str):
+    if name in _submodules:
+        module = importlib.import_module(f'.{name}', __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def __dir__():
+    return sorted(set(globals()) | set(_submodules))
@@ -0,0 +1,4 @@
+from pylibup.daemon import main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Caching layer for the GitHub REST lookups used by pylibup.
+
+GET responses are memoized per process for `ttl` seconds and invalidated
+by mutations (e.g. creating a repo). Optionally, 200 responses are also
+stored on disk with their ETag, so later runs send If-None-Match and get
+304s, which don't count against the rate limit.
+"""
+import time
+import requests
+
+from .types import *
+from .utils import get_logger
+from .config import GitConfig, StateConfig
+from .serializers import Json, Base
+from .session import GithubSession, get_session
+from .trace import span
+
+
+logger = get_logger()
+
+
+class GithubResponse:
+    def __init__(self, status_code: int, data: Any = None, headers: Dict[str, str] = None, from_cache: bool = False):
+        self.status_code = status_code
+        self.data = data
+        self.headers = headers or {}
+        self.from_cache = from_cache
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self):
+        return self.data
+
+    @classmethod
+    def from_response(cls, resp: requests.Response) -> 'GithubResponse':
+        try: data = resp.json() if resp.content else None
+        except ValueError: data = resp.text
+        return cls(status_code = resp.status_code, data = data, headers = dict(resp.headers))
+
+    def __repr__(self):
+        return f'<GithubResponse [{self.status_code}]{" (cached)" if self.from_cache else ""}>'
+
+
+class GithubAPI:
+    def __init__(self, github_token: str = None, base_url: str = None, ttl: float = None, etag_cache: bool = None, session: GithubSession = None):
+        self.github_token = github_token or GitConfig.token
+        self.session = session or get_session()
+        self.base_url = (base_url or GitConfig.api_url).rstrip('/')
+        self.ttl = GitConfig.api_cache_ttl if ttl is None else ttl
+        etag_cache = GitConfig.api_etag_cache if etag_cache is None else etag_cache
+        self.etag_dir = StateConfig.get_cache_dir('github') if etag_cache else None
+        self.cache: Dict[str, Tuple[float, GithubResponse]] = {}
+        # Scopes the on-disk cache to the token without storing it
+        self.token_key = Base.hash_encode(self.github_token or 'anonymous')[:16]
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        headers = {'Accept': 'application/vnd.github.v3+json'}
+        if self.github_token: headers['Authorization'] = f'token {self.github_token}'
+        return headers
+
+    @property
+    def stats(self):
+        return self.session.stats
+
+    def get_url(self, path: str) -> str:
+        if path.startswith('http'): return path
+        return f'{self.base_url}/{path.lstrip("/")}'
+
+    def send(self, method: str, url: str, headers: Dict[str, str] = None, **kwargs) -> requests.Response:
+        with span(f'{method.upper()} {url[len(self.base_url):] if url.startswith(self.base_url) else url}', 'http') as s:
+            resp = self.session.request(method, url, headers = dict(self.headers, **(headers or {})), **kwargs)
+            s.set(status = resp.status_code, bytes = len(resp.content))
+        return resp
+
+    def etag_file(self, url: str):
+        if self.etag_dir is None: return None
+        return self.etag_dir.joinpath(f'{Base.hash_encode(self.token_key + url)}.json')
+
+    def load_etag(self, url: str) -> Optional[Dict[str, Any]]:
+        fpath = self.etag_file(url)
+        if fpath is None or not fpath.exists(): return None
+        try: return Json.loads(fpath.read_text())
+        except ValueError: return None
+
+    def save_etag(self, url: str, resp: GithubResponse):
+        fpath = self.etag_file(url)
+        etag = resp.headers.get('ETag')
+        if fpath is None or not etag or resp.status_code != 200: return
+        try: fpath.write_text(Json.dumps({'etag': etag, 'status_code': resp.status_code, 'data': resp.data}, fast = True))
+        except (OSError, TypeError) as e: logger.warning(f'Unable to write ETag cache for {url}: {e}')
+
+    def delete_etag(self, url: str):
+        fpath = self.etag_file(url)
+        if fpath is not None and fpath.exists(): fpath.unlink()
+
+    def get(self, path: str, ttl: float = None, use_cache: bool = True) -> GithubResponse:
+        url = self.get_url(path)
+        ttl = self.ttl if ttl is None else ttl
+        if use_cache and url in self.cache:
+            expires, resp = self.cache[url]
+            if expires > time.monotonic(): return resp
+        cached = self.load_etag(url) if use_cache else None
+        headers = {'If-None-Match': cached['etag']} if cached else None
+        raw = self.send('GET', url, headers = headers)
+        if raw.status_code == 304 and cached:
+            resp = GithubResponse(status_code = cached['status_code'], data = cached['data'], headers = dict(raw.headers), from_cache = True)
+        else:
+            resp = GithubResponse.from_response(raw)
+            self.save_etag(url, resp)
+        if ttl > 0: self.cache[url] = (time.monotonic() + ttl, resp)
+        return resp
+
+    def request(self, method: str, path: str, invalidate: List[str] = None, **kwargs) -> GithubResponse:
+        """
+        Sends a mutating request and drops the cached entries for `path`
+        and any additional `invalidate` paths
+        """
+        resp = GithubResponse.from_response(self.send(method, self.get_url(path), **kwargs))
+        self.invalidate(path, *(invalidate or []))
+        return resp
+
+    def post(self, path: str, **kwargs) -> GithubResponse:
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path: str, **kwargs) -> GithubResponse:
+        return self.request('PUT', path, **kwargs)
+
+    def invalidate(self, *paths: str):
+        for path in paths:
+            url = self.get_url(path)
+            self.cache.pop(url, None)
+            self.delete_etag(url)
+
+    def clear(self):
+        self.cache.clear()
+
+    @property
+    def user(self) -> Dict[str, Any]:
+        resp = self.get('/user', ttl = float('inf'))
+        if not resp.ok: raise ValueError(f'Unable to fetch the authenticated GitHub user: {resp.status_code} {resp.data}')
+        return resp.data
+
+    @property
+    def username(self) -> str:
+        return self.user['login']
+
+    def get_repo(self, repo_path: str) -> GithubResponse:
+        return self.get(f'/repos/{repo_path}')
+
+    def repo_exists(self, repo_path: str) -> bool:
+        return self.get_repo(repo_path).ok
+
+    def create_repo(self, repo_path: str, data: Dict[str, Any]) -> GithubResponse:
+        return self.post('/user/repos', json = data, invalidate = [f'/repos/{repo_path}'])
+
+    def create_release(self, repo_path: str, tag: str, sha: str, tag_message: str = None, release_name: str = None, release_message: str = None, draft: bool = False, prerelease: bool = False) -> GithubResponse:
+        """
+        Creates an annotated tag on `sha`, its ref, and a release for it
+        """
+        tag_resp = self.post(f'/repos/{repo_path}/git/tags', json = {'tag': tag, 'message': tag_message or tag, 'object': sha, 'type': 'commit'})
+        if not tag_resp.ok: raise ValueError(f'Unable to create tag {tag}: {tag_resp.status_code} {tag_resp.data}')
+        ref_resp = self.post(f'/repos/{repo_path}/git/refs', json = {'ref': f'refs/tags/{tag}', 'sha': tag_resp.data['sha']})
+        if not ref_resp.ok: raise ValueError(f'Unable to create ref for tag {tag}: {ref_resp.status_code} {ref_resp.data}')
+        data = {'tag_name': tag, 'name': release_name or tag, 'body': release_message or '', 'draft': draft, 'prerelease': prerelease, 'target_commitish': sha}
+        return self.post(f'/repos/{repo_path}/releases', json = data)
+
+
+__all__ = [
+    'GithubResponse',
+    'GithubAPI',
+]
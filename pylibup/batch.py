@@ -0,0 +1,191 @@
+"""
+Builds many projects from their metadata files on a process pool.
+
+Each worker process keeps a single PylibClient (and its Github client) and
+builds every project it is handed with a fresh PylibConfig. Templates are
+compiled once in the parent so workers only load the cached bytecode.
+
+`map_config_files` and `format_table` are shared with the other commands
+that run per metadata file (repo plan, fleet sync).
+"""
+import os
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .types import *
+from .utils import get_logger, to_path, Path
+from .serializers import Json, Yaml
+from .templates import PylibTemplates
+from .config_cache import find_metadata_file
+
+
+logger = get_logger()
+
+R = TypeVar('R')
+
+class PylibBuildResult(BaseModel):
+    config_file: str
+    project_name: str
+    status: str = 'pending'
+    seconds: float = 0.0
+    files: int = 0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 'ok'
+
+
+def load_manifest(manifest_file: Union[str, Path]) -> List[str]:
+    """
+    Reads a manifest of metadata files or project dirs.
+    Supports yaml/json (a list or a dict with a `projects` key)
+    or plain text with one path per line. Relative paths
+    are resolved against the manifest's dir.
+    """
+    manifest_file = to_path(manifest_file)
+    text = manifest_file.read_text()
+    if manifest_file.suffix in {'.yaml', '.yml'}: data = Yaml.loads(text)
+    elif manifest_file.suffix == '.json': data = Json.loads(text)
+    else: data = [line.strip() for line in text.splitlines() if line.strip() and not line.strip().startswith('#')]
+    if isinstance(data, dict): data = data.get('projects', [])
+    return [manifest_file.parent.joinpath(os.path.expanduser(str(item))).as_posix() for item in data or []]
+
+
+def resolve_config_files(paths: List[str] = None, manifest_file: str = None) -> List[Path]:
+    """
+    Expands globs, project dirs and manifests into a de-duplicated,
+    ordered list of metadata files
+    """
+    paths = list(paths or [])
+    if manifest_file: paths.extend(load_manifest(manifest_file))
+    config_files: Dict[str, Path] = {}
+    for item in paths:
+        matches = glob.glob(os.path.expanduser(item), recursive = True) if glob.has_magic(item) else [os.path.expanduser(item)]
+        for match in sorted(matches):
+            path = to_path(match)
+            if path.is_dir(): path = find_metadata_file(path)
+            if path is None or not path.is_file():
+                logger.warning(f'No metadata file found for: {match}')
+                continue
+            config_files.setdefault(path.resolve().as_posix(), path.resolve())
+    return list(config_files.values())
+
+
+def get_worker_count(max_workers: Optional[int], count: int) -> int:
+    return max(1, min(max_workers or os.cpu_count() or 1, count))
+
+
+def map_config_files(
+    func: Callable[..., R],
+    config_files: List[Union[str, Path]],
+    args: tuple = (),
+    max_workers: int = None,
+    on_error: Callable[[str, Exception], R] = None,
+    on_result: Callable[[R], Any] = None,
+    initializer: Callable = PylibTemplates.warmup,
+    initargs: tuple = (),
+    in_process: bool = True,
+    ) -> List[R]:
+    """
+    Calls func(config_file, *args) for every metadata file on a bounded process pool,
+    or in this process for a single worker when `in_process`. A worker that dies
+    (e.g. BrokenProcessPool) gives on_error(config_file, error) as its result.
+    Results are returned in the same order as `config_files`.
+    """
+    config_files = [to_path(f).as_posix() for f in config_files]
+    if not config_files: return []
+    max_workers = get_worker_count(max_workers, len(config_files))
+    results: Dict[str, R] = {}
+    if max_workers == 1 and in_process:
+        for config_file in config_files:
+            results[config_file] = func(config_file, *args)
+            if on_result: on_result(results[config_file])
+        return [results[f] for f in config_files]
+    # Compile once in the parent so the workers start with a warm bytecode cache
+    PylibTemplates.warmup()
+    with ProcessPoolExecutor(max_workers = max_workers, initializer = initializer, initargs = initargs) as executor:
+        futures = {executor.submit(func, f, *args): f for f in config_files}
+        for future in as_completed(futures):
+            config_file = futures[future]
+            try: result = future.result()
+            except Exception as e:
+                if on_error is None: raise
+                result = on_error(config_file, e)
+            if on_result: on_result(result)
+            results[config_file] = result
+    return [results[f] for f in config_files]
+
+
+def format_table(headers: List[str], rows: List[List[str]]) -> List[str]:
+    """
+    Returns the lines of a column aligned table. The last column isn't padded
+    """
+    widths = [max(len(row[i]) for row in rows + [headers]) for i in range(len(headers) - 1)]
+    lines = ['  '.join(h.ljust(w) for h, w in zip(headers, widths)) + '  ' + headers[-1]]
+    lines.append('  '.join('-' * w for w in widths) + '  ' + '-' * len(headers[-1]))
+    lines.extend('  '.join(c.ljust(w) for c, w in zip(row, widths)) + '  ' + row[-1] for row in rows)
+    return lines
+
+
+_worker_client = None
+
+def _init_worker(github_token: str = None, pyirc_path: str = '~/.pypirc'):
+    global _worker_client
+    from .client import PylibClient
+    PylibTemplates.warmup()
+    _worker_client = PylibClient(github_token = github_token, pyirc_path = pyirc_path)
+
+
+def _build_project(config_file: str, build_kwargs: Dict[str, Any]) -> PylibBuildResult:
+    config_path = to_path(config_file)
+    result = PylibBuildResult(config_file = config_path.as_posix(), project_name = config_path.parent.name)
+    start = time.perf_counter()
+    try:
+        _worker_client.build(config_file = config_path.as_posix(), project_name = config_path.parent.name, project_dir = config_path.parent.as_posix(), **build_kwargs)
+        result.files = len(_worker_client.cfg.repo_files)
+        result.status = 'ok'
+    except Exception as e:
+        result.status = 'failed'
+        result.error = f'{type(e).__name__}: {e}'.splitlines()[0]
+    finally:
+        # Don't let one project's config leak into the next
+        _worker_client.cfg = None
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def build_many(config_files: List[Union[str, Path]], github_token: str = None, pyirc_path: str = '~/.pypirc', max_workers: int = None, **build_kwargs) -> List[PylibBuildResult]:
+    """
+    Builds every project concurrently on a bounded process pool.
+    Results are returned in the same order as `config_files`.
+    """
+    if not config_files: return []
+    logger.info(f'Building {len(config_files)} Projects with {get_worker_count(max_workers, len(config_files))} Workers')
+    return map_config_files(
+        _build_project, config_files, args = (build_kwargs,), max_workers = max_workers,
+        on_error = lambda f, e: PylibBuildResult(config_file = f, project_name = to_path(f).parent.name, status = 'failed', error = f'{type(e).__name__}: {e}'),
+        on_result = lambda r: logger.info(f'[{r.status}] {r.project_name} ({r.seconds:.2f}s)'),
+        # Workers keep their own PylibClient, so even a single build runs in a worker
+        initializer = _init_worker, initargs = (github_token, pyirc_path), in_process = False,
+    )
+
+
+def format_results_table(results: List[PylibBuildResult]) -> str:
+    headers = ['project', 'status', 'seconds', 'files', 'error']
+    lines = format_table(headers, [[r.project_name, r.status, f'{r.seconds:.2f}', str(r.files), r.error or ''] for r in results])
+    failed = sum(not r.ok for r in results)
+    lines.append(f'{len(results)} projects, {len(results) - failed} ok, {failed} failed, {sum(r.seconds for r in results):.2f}s total build time')
+    return '\n'.join(lines)
+
+
+__all__ = [
+    'PylibBuildResult',
+    'resolve_config_files',
+    'load_manifest',
+    'build_many',
+    'format_results_table',
+    'map_config_files',
+    'format_table',
+]
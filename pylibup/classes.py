@@ -1,12 +1,19 @@
-import requests
+import functools
 from git import Repo
 from github import Github
-from jinja2 import Template
 
 from .envs import envToStr
 from .types import *
-from .utils import get_logger, to_path, Path, exec_shell
+from .utils import get_logger, to_path, Path
 from .serializers import Yaml, Json, Base
+from .templates import render_template
+from .manifest import BuildManifest
+from .api import GithubAPI
+from .config import GitConfig
+from .runner import GitRunner
+from .config_cache import ConfigCache, get_config_cache, find_metadata_file, read_config_file
+from .ignore import GitIgnore, compile_gitignore
+from .trace import span, traced
 from .static import *
 
 
@@ -22,27 +29,94 @@ class BaseCls(BaseModel):
 
 class PylibStructure(BaseCls):
     modules: Optional[List[str]] = []
+    # a benchmarks/ package with a bench stub per module and a runner that writes JSON results
+    benchmarks: Optional[bool] = False
+
+docker_cache_modes = ('gha', 'registry', 'inline', 'local', 'none')
 
 class PylibDockerBuildOptions(BaseCls):
     app_name: Optional[str]
     require_ecr: Optional[bool] = False
     ecr_options: Optional[Dict[str, Any]] = {}
     docker_options: Optional[Dict[str, Any]] = {}
+    # BuildKit layer cache, one of docker_cache_modes
+    cache: Optional[str] = 'gha'
+    cache_scope: Optional[str] = None
+    cache_tag: Optional[str] = 'buildcache'
+    cache_dir: Optional[str] = '/tmp/.buildx-cache'
+    platforms: Optional[List[str]] = ['linux/amd64']
+    # more than one platform builds on a matrix job each, then merges the manifests
+    parallel_platforms: Optional[bool] = True
+    tags: Optional[List[str]] = ['latest']
+
+class PylibPypiPublishOptions(BaseCls):
+    # the cached variant: pip cache, parallel sdist/wheel jobs, concurrency group, skips published versions
+    cached: Optional[bool] = False
+    python_version: Optional[str] = '3.x'
+    paths: Optional[List[str]] = ['setup.py']
+    branches: Optional[List[str]] = []
+    concurrency: Optional[bool] = True
+    cancel_in_progress: Optional[bool] = True
+    skip_published: Optional[bool] = True
+    cache_dependency_paths: Optional[List[str]] = ['setup.py', 'requirements.txt']
+
+class PylibBenchmarkOptions(BaseCls):
+    # a pull request fails when a benchmark's median is this much slower than the default branch's baseline
+    threshold: Optional[float] = 0.2
+    repeat: Optional[int] = 5
+    python_version: Optional[str] = '3.x'
 
 class PylibGithubWorkflows(BaseCls):
     pypi_publish: Optional[bool] = True
+    pypi_publish_options: Optional[PylibPypiPublishOptions] = Field(default_factory = PylibPypiPublishOptions)
+    benchmarks: Optional[bool] = False
+    benchmarks_options: Optional[PylibBenchmarkOptions] = Field(default_factory = PylibBenchmarkOptions)
     docker_build: Optional[bool] = False
-    docker_build_options: Optional[PylibDockerBuildOptions] = Field(default=PylibDockerBuildOptions)
+    docker_build_options: Optional[PylibDockerBuildOptions] = Field(default_factory = PylibDockerBuildOptions)
     
 
+class PylibArtifact(BaseCls):
+    filename: str
+    content: Optional[str]
+    # managed files are owned by the templates and get re-rendered,
+    # unmanaged ones (empty module stubs) are only created once
+    managed: Optional[bool] = True
+    add_to_commit: Optional[bool] = True
+
+    @property
+    def enabled(self) -> bool:
+        if self.managed: return bool(self.content)
+        return self.content is not None
+
+
+dockerfile_modes = ('fastapi', 'multistage')
+
+class PylibDockerfileOptions(BaseCls):
+    python_version: Optional[str] = '3.9'
+    # default to python:<python_version> for the build stages and its -slim variant at runtime
+    builder_image: Optional[str] = None
+    base_image: Optional[str] = None
+    # installed into the runtime next to setup.requirements, to serve the app
+    extra_requirements: Optional[List[str]] = ['fastapi', 'uvicorn']
+    port: Optional[int] = 80
+    cmd: Optional[List[str]] = ['uvicorn', 'app.main:app', '--host', '0.0.0.0', '--port', '80']
+
 class PylibOptions(BaseCls):
     default_branch: Optional[str] = 'main'
     include_init: Optional[bool] = True
+    # the __init__.py imports the structure modules on first access instead of at import
+    lazy_init: Optional[bool] = False
+    # adds a TYPE_CHECKING block importing them, so IDEs and type checkers still resolve the names
+    lazy_init_stubs: Optional[bool] = True
     include_app: Optional[bool] = False
     include_dockerfile: Optional[bool] = False
     include_buildscript: Optional[bool] = True
     include_reqtext: Optional[bool] = True
     private: Optional[bool] = True
+    # fastapi: single stage on the uvicorn-gunicorn-fastapi image,
+    # multistage: wheelhouse, package and slim runtime stages with BuildKit cache mounts
+    dockerfile_mode: Optional[str] = 'fastapi'
+    dockerfile_options: Optional[PylibDockerfileOptions] = Field(default_factory = PylibDockerfileOptions)
 
 
 class PylibConfigData(BaseCls):
@@ -53,8 +127,8 @@ class PylibConfigData(BaseCls):
     gitignores: Optional[List[str]]
     structure: Optional[PylibStructure]
     secrets: Optional[Dict[str, Any]]
-    options: Optional[PylibOptions] = Field(default = PylibOptions)
-    workflows: Optional[PylibGithubWorkflows] = Field(default = PylibGithubWorkflows)
+    options: Optional[PylibOptions] = Field(default_factory = PylibOptions)
+    workflows: Optional[PylibGithubWorkflows] = Field(default_factory = PylibGithubWorkflows)
 
     @property
     def opt(self) -> PylibOptions: return self.options
@@ -96,55 +170,69 @@ class PylibConfigData(BaseCls):
     
     @property
     def repo_url(self):
-        return f'https://github.com/{self.repo_path}.git'
+        return f'{GitConfig.git_url.rstrip("/")}/{self.repo_path}.git'
     
     @property
     def tmpl_setup_py(self):
         if not self.setup: return None
-        tmpl = Template(setup_py_template)
-        return tmpl.render(self.setup)
+        return render_template('setup_py_template', self.setup)
     
     @property
     def tmpl_requirements_txt(self):
         if not self.opt.include_reqtext: return None
-        tmpl = Template(install_requirements_template)
-        return tmpl.render(self.setup)
+        return render_template('install_requirements_template', self.setup)
 
     @property
     def tmpl_readme_md(self):
         # if not self.readme_text: return None
-        tmpl = Template(readme_template)
         readme_data = self.setup or {}
         readme_data['readme_text'] = self.readme_text
-        return tmpl.render(readme_data)
+        return render_template('readme_template', readme_data)
     
     @property
     def tmpl_gitignore(self):
         if not self.gitignores: return None
-        tmpl = Template(gitignores_template)
         data = {'gitignore': self.gitignores}
-        return tmpl.render(data)
+        return render_template('gitignores_template', data)
     
     @property
     def tmpl_workflows_enabled(self):
-        return bool(self.wkflw.docker_build or self.wkflw.pypi_publish)
+        return bool(self.wkflw.docker_build or self.wkflw.pypi_publish or self.tmpl_github_action_benchmarks)
 
     @property
     def tmpl_github_action_pypi_publish(self):
         if not self.wkflw.pypi_publish: return None
-        return github_action_template_pypi_publish    
+        options = self.wkflw.pypi_publish_options
+        if not options.cached: return github_action_template_pypi_publish
+        data = options.dict()
+        data['pkg_name'] = self.setup.get('pkg_name', self.setup.get('lib_name'))
+        return render_template('github_action_template_pypi_publish_cached', data)
     
+    @property
+    def tmpl_github_action_benchmarks(self):
+        # runs the scaffolded benchmarks, so it needs structure.benchmarks too
+        if not self.wkflw.benchmarks or not self.benchmarks_enabled: return None
+        data = self.wkflw.benchmarks_options.dict()
+        data.update({'pkg_name': self.setup.get('pkg_name', self.libname), 'default_branch': self.opt.default_branch})
+        return render_template('github_action_template_benchmarks', data)
+
     @property
     def tmpl_github_action_docker_build(self):
         if not self.wkflw.docker_build: return None
-        tmpl = Template(github_action_template_docker_build)
-        data = {
-            'app_name': self.wkflw.docker_build_options.app_name or self.setup.get('lib_name', self.setup.get('pkg_name')), 
-            'require_ecr': self.wkflw.docker_build_options.require_ecr,
-            'ecr_options': self.wkflw.docker_build_options.ecr_options,
-            'docker_options': self.wkflw.docker_build_options.docker_options,
-        }
-        return tmpl.render(data)
+        options = self.wkflw.docker_build_options
+        if (options.cache or 'none') not in docker_cache_modes: raise ValueError(f'Unsupported docker cache: {options.cache}. Supported: {", ".join(docker_cache_modes)}')
+        registry = options.ecr_options if options.require_ecr else options.docker_options
+        data = options.dict()
+        data.update({
+            'app_name': options.app_name or self.setup.get('lib_name', self.setup.get('pkg_name')), 
+            'lib_name': self.libname,
+            'img_repo': registry.get('img_repo') or registry.get('repo') or '',
+            'cache': options.cache or 'none',
+            'tags': options.tags or ['latest'],
+            'platforms': options.platforms or ['linux/amd64'],
+        })
+        data['cache_scope'] = options.cache_scope or data['app_name']
+        return render_template('github_action_template_docker_build', data)
 
     @property
     def tmpl_build_sh(self):
@@ -154,47 +242,126 @@ class PylibConfigData(BaseCls):
     @property
     def tmpl_init_py(self):
         if not self.opt.include_init: return None
-        tmpl = Template(pyinit_template)
-        data = {'modules': self.structure.modules}
-        return tmpl.render(data)
+        data = {'modules': self.structure.modules, 'lazy': self.opt.lazy_init, 'type_stubs': self.opt.lazy_init_stubs}
+        return render_template('pyinit_template', data)
     
+    @property
+    def benchmarks_enabled(self) -> bool:
+        return bool(self.structure and self.structure.benchmarks)
+
+    @property
+    def tmpl_benchmark_runner(self):
+        if not self.benchmarks_enabled: return None
+        return benchmark_runner_template
+
+    def tmpl_benchmark_module(self, module: str):
+        return render_template('benchmark_module_template', {'lib_name': self.libname, 'module': module})
+
     @property
     def tmpl_dockerfile_app(self):
         if not self.opt.include_app and not self.opt.include_dockerfile: return None
-        return dockerfile_fastapi_template
+        if self.opt.dockerfile_mode not in dockerfile_modes: raise ValueError(f'Unsupported dockerfile_mode: {self.opt.dockerfile_mode}. Supported: {", ".join(dockerfile_modes)}')
+        if self.opt.dockerfile_mode == 'fastapi': return dockerfile_fastapi_template
+        data = self.opt.dockerfile_options.dict()
+        data.update({
+            'pkg_name': self.setup.get('pkg_name', self.libname),
+            'lib_name': self.libname,
+            'requirements': self.setup.get('requirements') or [],
+            'requirements_file': bool(self.tmpl_requirements_txt),
+        })
+        return render_template('dockerfile_multistage_template', data)
+
+    @property
+    def tmpl_dockerignore(self):
+        if self.opt.dockerfile_mode != 'multistage': return None
+        return dockerignore_template
     
     @property
     def needs_ipyirc(self):
         return self.wkflw.pypi_publish
     
+    @property
+    def ignore_matcher(self) -> GitIgnore:
+        return compile_gitignore(self.gitignores or [])
+
     def should_add_to_commit(self, filename: str):
-        return not any(i in filename or filename in i for i in self.gitignores)
+        return not self.ignore_matcher.is_ignored(filename)
+
+    def get_base_artifacts(self) -> List[PylibArtifact]:
+        return [
+            PylibArtifact(filename = 'setup.py', content = self.tmpl_setup_py),
+            PylibArtifact(filename = 'build.sh', content = self.tmpl_build_sh, add_to_commit = self.should_add_to_commit('build.sh')),
+            PylibArtifact(filename = 'requirements.txt', content = self.tmpl_requirements_txt),
+            PylibArtifact(filename = 'README.md', content = self.tmpl_readme_md),
+            PylibArtifact(filename = '.gitignore', content = self.tmpl_gitignore),
+        ]
+
+    def get_structure_artifacts(self) -> List[PylibArtifact]:
+        if not self.structure: return []
+        artifacts = [PylibArtifact(filename = f'{self.libname}/{module}.py', content = '', managed = False) for module in self.structure.modules]
+        artifacts.append(PylibArtifact(filename = f'{self.libname}/__init__.py', content = self.tmpl_init_py))
+        if self.benchmarks_enabled:
+            # the stubs are yours to fill in, only the runner is re-rendered
+            artifacts.append(PylibArtifact(filename = 'benchmarks/__init__.py', content = '', managed = False))
+            artifacts.extend(PylibArtifact(filename = f'benchmarks/bench_{module}.py', content = self.tmpl_benchmark_module(module), managed = False) for module in self.structure.modules)
+            artifacts.append(PylibArtifact(filename = 'benchmarks/run.py', content = self.tmpl_benchmark_runner))
+        return artifacts
+
+    def get_workflow_artifacts(self) -> List[PylibArtifact]:
+        if not self.tmpl_workflows_enabled: return []
+        return [
+            PylibArtifact(filename = '.github/workflows/python-publish.yaml', content = self.tmpl_github_action_pypi_publish),
+            PylibArtifact(filename = '.github/workflows/docker-build.yaml', content = self.tmpl_github_action_docker_build),
+            PylibArtifact(filename = '.github/workflows/benchmarks.yaml', content = self.tmpl_github_action_benchmarks),
+        ]
+
+    def get_app_artifacts(self) -> List[PylibArtifact]:
+        if not self.opt.include_app: return []
+        artifacts = [PylibArtifact(filename = f'app/{appfile}.py', content = '', managed = False) for appfile in ['__init__', 'config', 'client', 'classes', 'routez', 'utils']]
+        artifacts.append(PylibArtifact(filename = 'Dockerfile', content = self.tmpl_dockerfile_app))
+        artifacts.append(PylibArtifact(filename = '.dockerignore', content = self.tmpl_dockerignore))
+        return artifacts
+
+    def get_artifacts(self) -> List[PylibArtifact]:
+        """
+        Renders every file the build would write, in build order
+        """
+        artifacts = self.get_base_artifacts() + self.get_structure_artifacts() + self.get_workflow_artifacts() + self.get_app_artifacts()
+        return [a for a in artifacts if a.enabled]
 
     def get_secrets(self):
         data = {}
-        for key, val in self.secrets:
+        for key, val in (self.secrets or {}).items():
             if val:
                 if isinstance(val, str): data[key] = val
                 if isinstance(val, dict) and val.get('from'):
                     data[key] = envToStr(val['from'], envToStr(key))
-            else: data[key] = envToStr(envToStr(key))
+            else: data[key] = envToStr(key)
         return data
 
 
+@functools.lru_cache()
+def get_config_schema_key() -> str:
+    # Cached configs are pickled models, which must not outlive a change to their fields
+    return Base.hash_encode(repr([(model.__name__, model.__fields__) for model in BaseCls.__subclasses__()]))
+
+
 class PylibConfig:
-    def __init__(self, github: Github, github_token: str, config_file: str, project_name: str, project_dir: str = None, *args, **kwargs):
+    def __init__(self, github: Github, github_token: str, config_file: str, project_name: str, project_dir: str = None, api: GithubAPI = None, *args, **kwargs):
         self.github = github
         self.github_token = github_token
+        self.api = api or GithubAPI(github_token = github_token)
         self.config_file = config_file
         self.repo_files = []
         self.set_working_project(project_name, project_dir)
-        self.configfile_data = self.load_config_file(self.config_file)
-        self.config = self.load_config_data(self.configfile_data)
+        self.config = self.load_config(self.config_file)
         self.setup_repo()
 
     def setup_repo(self):
         if not self.working_dir.joinpath('.git').exists(): self.repo = Repo.init(self.working_dir, bare=False, initial_branch=self.config.opt.default_branch)
         else: self.repo = Repo(self.working_dir, search_parent_directories=True)
+        self.git = GitRunner(self.repo)
+        self.manifest = BuildManifest(Path(self.repo.git_dir).joinpath('pylibup', 'manifest.json'), self.working_dir)
 
     def set_working_project(self, project_name: str = None, project_dir: str = None):
         self.current_dir = to_path(project_dir) if project_dir else Path.cwd()
@@ -206,26 +373,31 @@ class PylibConfig:
         self.workflow_dir = self.working_dir.joinpath('.github/workflows')
         self.app_dir = self.working_dir.joinpath('app')
         if not self.config_file:
-            if self.working_dir.joinpath('metadata.yaml').exists():
-                self.config_file = self.working_dir.joinpath('metadata.yaml')
-            elif self.current_dir.joinpath('metadata.yaml').exists():
-                self.config_file = self.current_dir.joinpath('metadata.yaml')
+            self.config_file = find_metadata_file(self.working_dir) or find_metadata_file(self.current_dir)
             assert self.config_file, 'No specified config file'
 
     @classmethod
     def load_config_file(cls, config_file: str):
-        config_file = to_path(config_file)
-        if config_file.suffix == '.json': loader = Json.loads
-        elif config_file.suffix == '.yaml': loader = Yaml.loads
-        return loader(config_file.read_text())
+        return read_config_file(config_file)
     
     @classmethod
     def load_config_data(cls, config_data: Dict[str, Any]) -> PylibConfigData:
         return PylibConfigData(**config_data)
+
+    @classmethod
+    def load_config(cls, config_file: str, cache: ConfigCache = None) -> PylibConfigData:
+        """
+        Loads the validated config, reusing the compiled copy when the file is unchanged
+        """
+        return (cache or get_config_cache()).load(config_file, cls.load_config_data, schema = get_config_schema_key())
+
+    @property
+    def configfile_data(self) -> Dict[str, Any]:
+        return self.load_config_file(self.config_file)
     
     @property
     def github_username(self) -> str:
-        return self.github.get_user().login
+        return self.api.username
     
     @property
     def github_repo_user(self) -> str:
@@ -242,16 +414,8 @@ class PylibConfig:
         if self.config.repo_path: return self.config.repo_path
         return f'{self.github_repo_user}/{self.github_repo_name}'
     
-    @property
-    def user_authentication(self):
-        return Base.b64_encode(f'{self.github_username}:{self.github_token}')
-
-    @property
-    def github_headers(self):
-        return {'Accept': 'application/json, application/vnd.github.v3+json', 'Content-Type': 'application/json', 'Authorization': f'Basic {self.user_authentication}'}
-
     def get_github_repo(self):
-        return requests.get(f'https://api.github.com/repos/{self.github_repo_path}', headers=self.github_headers)
+        return self.api.get_repo(self.github_repo_path)
 
     def create_github_repo(self, **kwargs):
         if self.repo_exists: return
@@ -262,129 +426,144 @@ class PylibConfig:
             'default_branch': self.config.opt.default_branch,
         }
         if kwargs: data.update(kwargs)
-        return requests.post(url = 'https://api.github.com/user/repos', headers=self.github_headers, json=data)
+        return self.api.create_repo(self.github_repo_path, data)
 
     @property
     def repo_exists(self) -> bool:
-        return bool(self.get_github_repo().status_code < 399)
+        return self.api.repo_exists(self.github_repo_path)
     
-    def publish_repo(self):
-        if not self.repo_exists:
-            self.create_github_repo()
-            exec_shell(f'cd {self.working_dir} && git remote add origin {self.config.repo_url} && git branch -M {self.config.opt.default_branch}')
-        exec_shell(f'cd {self.working_dir} && git push -u origin {self.config.opt.default_branch}')
-
-
-    def build_tmpl(self, tmpl_data: Union[str, Any], filename: str, overwrite: bool = False, add_to_commit: bool = True):
-        if tmpl_data:
-            tmpl_file = self.working_dir.joinpath(filename)
-            if tmpl_file.exists() and not overwrite: pass
-            logger(f'Building: {filename}')
-            tmpl_file.write_text(tmpl_data)
-            if add_to_commit:
-                self.repo_files.append(tmpl_file.as_posix())
-
-    def build_base(self, overwrite: bool = False, *args, **kwargs):
-        self.build_tmpl(tmpl_data = self.config.tmpl_setup_py,  filename = 'setup.py',  overwrite=overwrite)
-        self.build_tmpl(tmpl_data = self.config.tmpl_build_sh,  filename = 'build.sh',  overwrite=overwrite, add_to_commit = self.config.should_add_to_commit('build.sh'))
-        self.build_tmpl(tmpl_data = self.config.tmpl_requirements_txt,  filename = 'requirements.txt', overwrite=overwrite)
-        self.build_tmpl(tmpl_data = self.config.tmpl_readme_md,  filename = 'README.md',  overwrite=overwrite)
-        self.build_tmpl(tmpl_data = self.config.tmpl_gitignore,  filename = '.gitignore',  overwrite=overwrite)
-
-    def build_pylib_structure(self, overwrite: bool = False, *args, **kwargs):
+    @traced()
+    def ensure_github_repo(self) -> bool:
+        """
+        Creates the GitHub repo if it doesn't exist yet. Returns True if it was created
+        """
+        if self.repo_exists: return False
+        self.create_github_repo()
+        return True
+
+    @traced()
+    def setup_remote(self):
+        if any(remote.name == 'origin' for remote in self.repo.remotes): return
+        self.git.set_remote(self.config.repo_url)
+        self.git.rename_branch(self.config.opt.default_branch)
+
+    @traced()
+    def push(self):
+        result = self.git.push(self.config.opt.default_branch)
+        logger.info(f'Pushed {self.config.opt.default_branch} to origin in {result.seconds:.2f}s')
+
+    @traced()
+    def push_repo(self):
+        self.ensure_github_repo()
+        self.setup_remote()
+        self.push()
+
+
+    def build_artifact(self, artifact: PylibArtifact, overwrite: bool = False, incremental: bool = False) -> bool:
+        """
+        Writes the artifact to the working dir and queues it for the commit.
+        In incremental mode, managed files are only rewritten and staged
+        when their content hash differs from the file on disk.
+        """
+        if not artifact.enabled: return False
+        tmpl_file = self.working_dir.joinpath(artifact.filename)
+        if tmpl_file.exists():
+            if not artifact.managed: return False
+            if not overwrite and not incremental: return False
+            if incremental and self.manifest.is_unchanged(artifact.filename, artifact.content): return False
+        logger(f'Building: {artifact.filename}')
+        with span(artifact.filename, 'write', bytes = len(artifact.content)):
+            tmpl_file.parent.mkdir(parents=True, exist_ok=True)
+            tmpl_file.write_text(artifact.content)
+            self.manifest.record(artifact.filename, self.manifest.hash_text(artifact.content))
+        if artifact.add_to_commit and self.config.should_add_to_commit(artifact.filename):
+            self.repo_files.append(tmpl_file.as_posix())
+        return True
+
+    def build_tmpl(self, tmpl_data: Union[str, Any], filename: str, overwrite: bool = False, add_to_commit: bool = True, incremental: bool = False):
+        return self.build_artifact(PylibArtifact(filename = filename, content = tmpl_data, add_to_commit = add_to_commit), overwrite = overwrite, incremental = incremental)
+
+    def build_artifacts(self, artifacts: List[PylibArtifact], overwrite: bool = False, incremental: bool = False) -> int:
+        return sum(self.build_artifact(artifact, overwrite = overwrite, incremental = incremental) for artifact in artifacts)
+
+    @traced()
+    def build_base(self, overwrite: bool = False, incremental: bool = False, *args, **kwargs):
+        self.build_artifacts(self.config.get_base_artifacts(), overwrite = overwrite, incremental = incremental)
+
+    @traced()
+    def build_pylib_structure(self, overwrite: bool = False, incremental: bool = False, *args, **kwargs):
         if not self.config.structure: return
         logger('Setting up Pylib structure')
-        pydir = self.working_dir.joinpath(self.config.libname)
-        pydir.mkdir(parents=True, exist_ok=True)
-        for module in self.config.structure.modules:
-            tmpl_file = pydir.joinpath(f'{module}.py')
-            if tmpl_file.exists() and not overwrite: pass
-            logger(f'Adding {self.config.libname}/{module}.py')
-            tmpl_file.touch(exist_ok=True)
-            self.repo_files.append(tmpl_file.as_posix())
-        
-        if self.config.opt.include_init:
-            tmpl_file = pydir.joinpath('__init__.py')
-            if tmpl_file.exists() and not overwrite: pass
-            tmpl_file.write_text(self.config.tmpl_init_py)
-            self.repo_files.append(tmpl_file.as_posix())
+        self.working_dir.joinpath(self.config.libname).mkdir(parents=True, exist_ok=True)
+        self.build_artifacts(self.config.get_structure_artifacts(), overwrite = overwrite, incremental = incremental)
     
-    def build_github_workflows(self, overwrite: bool = False, *args, **kwargs):
+    @traced()
+    def build_github_workflows(self, overwrite: bool = False, incremental: bool = False, *args, **kwargs):
         if not self.config.tmpl_workflows_enabled: return
         logger('Setting up Github Workflows')
         self.workflow_dir.mkdir(parents=True, exist_ok=True)
-
-        if self.config.tmpl_github_action_pypi_publish:
-            tmpl_file = self.workflow_dir.joinpath('python-publish.yaml')
-            if tmpl_file.exists() and not overwrite: pass
-            logger('Building: .github/workflows/python-publish.yaml')
-            tmpl_file.write_text(self.config.tmpl_github_action_pypi_publish)
-            self.repo_files.append(tmpl_file.as_posix())
-        
-        if self.config.tmpl_github_action_docker_build:
-            tmpl_file = self.workflow_dir.joinpath('docker-build.yaml')
-            if tmpl_file.exists() and not overwrite: pass
-            logger('Building: .github/workflows/docker-build.yaml')
-            tmpl_file.write_text(self.config.tmpl_github_action_docker_build)
-            self.repo_files.append(tmpl_file.as_posix())
+        self.build_artifacts(self.config.get_workflow_artifacts(), overwrite = overwrite, incremental = incremental)
     
-    def build_docker_app(self, overwrite: bool = False, *args, **kwargs):
+    @traced()
+    def build_docker_app(self, overwrite: bool = False, incremental: bool = False, *args, **kwargs):
         if not self.config.opt.include_app: return
         logger('Setting up AppDir')
         self.app_dir.mkdir(parents=True, exist_ok=True)
-        for appfile in ['__init__', 'config', 'client', 'classes', 'routez', 'utils']:
-            tmpl_file = self.app_dir.joinpath(f'{appfile}.py')
-            if tmpl_file.exists() and not overwrite: pass
-            logger(f'Adding app/{appfile}.py')
-            tmpl_file.touch(exist_ok=True)
-            self.repo_files.append(tmpl_file.as_posix())
-
-        if self.config.tmpl_dockerfile_app:
-            tmpl_file = self.working_dir.joinpath('Dockerfile')
-            if tmpl_file.exists() and not overwrite: pass
-            logger('Adding Dockerfile for App')
-            tmpl_file.write_text(self.config.tmpl_dockerfile_app)
-            self.repo_files.append(tmpl_file.as_posix())
+        self.build_artifacts(self.config.get_app_artifacts(), overwrite = overwrite, incremental = incremental)
 
     
-    def build(self, commit_msg: str = 'Initialize', overwrite: bool = False, auto_publish: bool = False, *args, **kwargs):
+    @traced()
+    def build_files(self, commit_msg: str = 'Initialize', overwrite: bool = False, incremental: bool = False, *args, **kwargs):
+        """
+        Renders and writes every file, then stages and commits them
+        """
+        self.build_base(overwrite=overwrite, incremental=incremental, *args, **kwargs)
+        self.build_pylib_structure(overwrite=overwrite, incremental=incremental, *args, **kwargs)
+        self.build_github_workflows(overwrite=overwrite, incremental=incremental, *args, **kwargs)
+        self.build_docker_app(overwrite=overwrite, incremental=incremental, *args, **kwargs)
+        self.manifest.save()
+        if self.repo_files:
+            logger.info(f'Adding {len(self.repo_files)} Files to Git Index')
+            with span('git add', 'git', files = len(self.repo_files)): self.repo.index.add(self.repo_files)
+        if incremental and not self.repo_files:
+            logger.info('No changes detected. Skipping Commit')
+        else:
+            logger.info(f'Adding Commit: {commit_msg}')
+            with span('git commit', 'git'): self.repo.index.commit(commit_msg)
+
+    @traced()
+    def build(self, commit_msg: str = 'Initialize', overwrite: bool = False, auto_publish: bool = False, incremental: bool = False, *args, **kwargs):
         logger.info('====================================================')
         logger.info(f'Building Repo: {self.project_name} @ {self.config.opt.default_branch}')
         logger.info('====================================================')
-        self.build_base(overwrite=overwrite, *args, **kwargs)
-        self.build_pylib_structure(overwrite=overwrite, *args, **kwargs)
-        self.build_github_workflows(overwrite=overwrite, *args, **kwargs)
-        self.build_docker_app(overwrite=overwrite, *args, **kwargs)
-        if self.repo_files:
-            logger.info(f'Adding {len(self.repo_files)} Files to Git Index')
-            self.repo.index.add(self.repo_files)
-        logger.info(f'Adding Commit: {commit_msg}')
-        self.repo.index.commit(commit_msg)
+        self.build_files(commit_msg = commit_msg, overwrite = overwrite, incremental = incremental, *args, **kwargs)
         if auto_publish:
             logger.info(f'Publishing {self.project_name}')
-            self.publish_repo()
+            self.push_repo()
         logger('Completed Pylib Build. Have fun!')
     
+    @traced()
     def publish_repo(self, commit_msg: str = None):
         if self.repo_exists: logger.warn(f'Repo already exists. Skipping Publishing: {self.project_name}')
         else: logger.info(f'Publishing {self.project_name}')
         if commit_msg: 
             logger.info(f'Adding Commit: {commit_msg}')
             self.repo.index.commit(commit_msg)
-        self.publish_repo()
+        self.push_repo()
 
 
-def get_metadata_template(github: Github, name: str, repo_user: str = None, private: bool = True, **kwargs):
+def get_metadata_template(github: Github, name: str, repo_user: str = None, private: bool = True, api: GithubAPI = None, **kwargs):
     metadata = default_pylib_metadata.copy()
     #if kwargs: metadata.update(kwargs)
-    caller = github.get_user()
-    if not repo_user: repo_user = caller.login
+    # GithubAPI keeps the user for the life of the process (and the daemon), PyGithub refetches it
+    caller = api.user if api else github.get_user().raw_data
+    if not repo_user: repo_user = caller['login']
     metadata['repo'] = f'{repo_user}/{name}'
     #metadata['options']['private'] = private
     metadata['setup'].update({
-        'author': caller.name or repo_user,
+        'author': caller.get('name') or repo_user,
         'description': kwargs.get('description', kwargs.get('project_description')),
-        'email': caller.email,
+        'email': caller.get('email'),
         'git_repo': f'{repo_user}',
         'pkg_name': name,
         'lib_name': kwargs.get('lib_name', name)
@@ -2,7 +2,9 @@ from . import base
 from . import app
 
 from .base import baseCli
-from .app import repoCli, stateCli
+from .app import repoCli, stateCli, fleetCli, daemonCli
 
 baseCli.add_typer(repoCli)
 baseCli.add_typer(stateCli)
+baseCli.add_typer(fleetCli)
+baseCli.add_typer(daemonCli)
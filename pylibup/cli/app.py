@@ -1,13 +1,22 @@
 from pathlib import Path
-from pylibup.client import PylibClient, Github
 from pylibup.cli.base import *
-from pylibup.serializers import Yaml
-from pylibup.utils import to_path, get_parent_path, exec_shell
-from typing import List
+from pylibup.utils import to_path
+from pylibup.state import StateFile, get_global_store, globalstate_dir
+from typing import List, Dict, Any, TYPE_CHECKING
+import json
+import shutil
+import contextlib
 import typer
 
+# Heavy dependencies (PyGithub, GitPython, Jinja2, requests, pydantic) are
+# imported inside the commands that need them, so state/meta commands start fast
+if TYPE_CHECKING:
+    from pylibup.client import PylibClient
+
 repoCli = createCli(name = 'repo')
 stateCli = createCli(name = 'state')
+fleetCli = createCli(name = 'fleet')
+daemonCli = createCli(name = 'daemon')
 
 def get_cwd(*paths, posix: bool = True):
     if not paths:
@@ -16,19 +25,20 @@ def get_cwd(*paths, posix: bool = True):
     if posix: return Path.cwd().joinpath(*paths).as_posix()
     return Path.cwd().joinpath(*paths)
 
-statefile = get_cwd('.pylibstate.yaml', posix=False)
-globalstate_dir = get_parent_path(__file__).joinpath('.pylibstate')
+# Resolved per call rather than at import, since the daemon serves requests from many cwds
+def get_statefile() -> Path:
+    return get_cwd('.pylibstate.yaml', posix=False)
+
 globalstate_dir.mkdir(exist_ok=True)
-globalstatefile = globalstate_dir.joinpath('state.yaml')
+globalstore = get_global_store()
+globalstatefile = globalstore.path
 globalstate_ignore_keys = {'name', 'commit_msg', 'project_name', 'project_dir'}
 
 def load_global_state():
-    if globalstatefile.exists(): return Yaml.loads(globalstatefile.read_text())
-    return {}
+    return globalstore.load()
 
 def load_state():
-    if statefile.exists(): return Yaml.loads(statefile.read_text())
-    return {}
+    return StateFile(get_statefile()).load()
 
 def load_merged_states():
     # global first, local overrides
@@ -37,41 +47,79 @@ def load_merged_states():
     if localdata: globaldata.update(localdata)
     return globaldata
 
-def save_global_state(overwrite_state: bool = False, **kwargs):
-    if globalstatefile.exists():
-        data = load_global_state()
+def merge_state(data: Dict[str, Any], overwrite_state: bool = False, **kwargs):
+    if data:
         if overwrite_state:
             data.update({k:v for k,v in kwargs.items() if v})
             kwargs = data
         else:
             kwargs.update({k:v for k,v in data.items() if v})
-    kwargs = {k:v for k,v in kwargs.items() if k not in globalstate_ignore_keys and v is not None}
-    globalstatefile.write_text(Yaml.dumps(kwargs))
+    return kwargs
+
+def save_global_state(overwrite_state: bool = False, **kwargs):
+    def update(data: Dict[str, Any]):
+        data = merge_state(data, overwrite_state = overwrite_state, **kwargs)
+        return {k:v for k,v in data.items() if k not in globalstate_ignore_keys and v is not None}
+    globalstore.update(update)
 
 def save_state(overwrite_state: bool = False, **kwargs):
-    if statefile.exists():
-        data = load_state()
-        if overwrite_state:
-            data.update({k:v for k,v in kwargs.items() if v})
-            kwargs = data
-        else:
-            kwargs.update({k:v for k,v in data.items() if v})
-    statefile.write_text(Yaml.dumps(kwargs))
+    StateFile(get_statefile()).update(lambda data: merge_state(data, overwrite_state = overwrite_state, **kwargs))
+
+
+# Warmed by the daemon, so forked requests reuse the parsed ~/.pypirc and the fetched GitHub user
+_clients: Dict[tuple, 'PylibClient'] = {}
+
+def get_client(github_token: str = None, pyirc_path: str = '~/.pypirc') -> 'PylibClient':
+    pyirc_file = Path(pyirc_path).expanduser()
+    key = (github_token or '', pyirc_path, pyirc_file.stat().st_mtime_ns if pyirc_file.exists() else None)
+    if key not in _clients:
+        from pylibup.client import PylibClient
+        _clients[key] = PylibClient(github_token = github_token, pyirc_path = pyirc_path)
+    return _clients[key]
+
+@contextlib.contextmanager
+def command_errors():
+    """
+    Logs a failed command and exits with its exit code
+    """
+    from pylibup.runner import CommandError
+    try:
+        yield
+    except CommandError as e:
+        logger.error(e)
+        raise typer.Exit(e.result.returncode if e.result.returncode > 0 else 1)
+
+def commit_and_push(commit_msg: str, branch: str, add_files: bool = True):
+    from git import Repo
+    from pylibup.runner import GitRunner
+    git = GitRunner(Repo(get_cwd(), search_parent_directories=True))
+    if add_files: git.add_all()
+    git.commit(commit_msg)
+    result = git.push(branch)
+    logger.info(f'Pushed {branch} to origin in {git.seconds:.2f}s')
+    return result
+
+def pip_reinstall():
+    from pylibup.runner import CommandRunner
+    result = CommandRunner(cwd = get_cwd()).pip_install('.', check = True)
+    logger.info(f'Reinstalled {get_cwd()} in {result.seconds:.2f}s')
+    return result
 
 
 @repoCli.command('init')
 def init_new_repo(
     name: Optional[str] = Argument(None),
-    project_dir: Optional[str] = Argument(get_cwd()),
+    project_dir: Optional[str] = Argument(None, help = "Defaults to the cwd"),
     repo_user: Optional[str] = Argument(None),
     github_token: Optional[str] = Option("", envvar="GITHUB_TOKEN"),
-    private: bool = Option(True, "--public"),
+    private: bool = Option(True, "--private/--public"),
     overwrite: bool = Option(False),
     overwrite_state: bool = Option(False),
     ):
+    project_dir = project_dir or get_cwd()
     state = load_merged_states()
     github_token = github_token or state.get('github_token', '')
-    client = PylibClient(github_token = github_token)
+    client = get_client(github_token = github_token)
     try:
         client.init(project_dir = project_dir, name = name, repo_user = repo_user, private = private, overwrite = overwrite)
         save_state(name = name, project_dir = project_dir, repo_user = repo_user, github_token = github_token, private = private, overwrite = overwrite, overwrite_state = overwrite_state)
@@ -80,29 +128,108 @@ def init_new_repo(
 
 @repoCli.command('build')
 def build_new_repo(
-    config_file: Optional[str] = Argument(get_cwd('metadata.yaml')),
+    config_file: Optional[str] = Argument(None, help = "Defaults to metadata.yaml in the cwd"),
     name: Optional[str] = Argument(None),
-    project_dir: Optional[str] = Argument(get_cwd()),
+    project_dir: Optional[str] = Argument(None, help = "Defaults to the cwd"),
     github_token: Optional[str] = Option("", envvar="GITHUB_TOKEN"),
     pypirc_path: Optional[str] = Option("~/.pypirc", envvar="PYPIRC_PATH"),
     commit_msg: Optional[str] = Option("Initialize"),
     auto_publish: bool = Option(False),
     overwrite: bool = Option(False),
+    incremental: bool = Option(False, help = "Only write and commit files whose content changed"),
+    concurrent: bool = Option(True, "--concurrent/--sequential", help = "Run the publish steps one after another instead of overlapping the GitHub calls with local work"),
     overwrite_state: bool = Option(False),
     ):
+    config_file = config_file or get_cwd('metadata.yaml')
+    project_dir = project_dir or get_cwd()
     state = load_merged_states()
     github_token = github_token or state.get('github_token', '')
     pypirc_path = state.get('pypirc_path', pypirc_path)
     config_file = config_file or state.get('config_file')
     project_dir = project_dir or state.get('project_dir')
-    client = PylibClient(github_token = github_token, pyirc_path = pypirc_path)
+    client = get_client(github_token = github_token, pyirc_path = pypirc_path)
     try:
-        client.build(config_file = config_file, project_name = name, project_dir = project_dir, commit_msg = commit_msg, auto_publish = auto_publish, overwrite = overwrite)
+        client.build(config_file = config_file, project_name = name, project_dir = project_dir, commit_msg = commit_msg, auto_publish = auto_publish, overwrite = overwrite, incremental = incremental, concurrent = concurrent)
         save_state(github_token = github_token, pyirc_path = pypirc_path, config_file = config_file, project_name = name, project_dir = project_dir, commit_msg = commit_msg, auto_publish = auto_publish, overwrite = overwrite, overwrite_state = overwrite_state)
     except Exception as e:
         logger.error(e)
 
 
+@repoCli.command('build-many', short_help = "Builds many projects concurrently from metadata globs, dirs or a manifest")
+def build_many_repos(
+    paths: Optional[List[str]] = Argument(None, help = "Metadata files, project dirs or globs (e.g. './libs/*/metadata.yaml')"),
+    manifest: Optional[str] = Option(None, help = "yaml/json/txt file listing metadata files or project dirs"),
+    github_token: Optional[str] = Option("", envvar="GITHUB_TOKEN"),
+    pypirc_path: Optional[str] = Option("~/.pypirc", envvar="PYPIRC_PATH"),
+    commit_msg: Optional[str] = Option("Initialize"),
+    max_workers: Optional[int] = Option(None, help = "Defaults to the number of CPUs"),
+    auto_publish: bool = Option(False),
+    overwrite: bool = Option(False),
+    incremental: bool = Option(False),
+    ):
+    from pylibup.batch import resolve_config_files, build_many, format_results_table
+    state = load_merged_states()
+    github_token = github_token or state.get('github_token', '')
+    pypirc_path = state.get('pypirc_path', pypirc_path)
+    config_files = resolve_config_files(paths, manifest_file = manifest)
+    if not config_files:
+        logger.error('No metadata files found')
+        raise typer.Exit(1)
+    results = build_many(config_files, github_token = github_token, pyirc_path = pypirc_path, max_workers = max_workers, commit_msg = commit_msg, auto_publish = auto_publish, overwrite = overwrite, incremental = incremental)
+    logger.info('\n' + format_results_table(results))
+    if any(not r.ok for r in results): raise typer.Exit(1)
+
+
+@repoCli.command('plan', short_help = "Shows what a build would create or modify, without writing files or touching git")
+def plan_repos(
+    paths: Optional[List[str]] = Argument(None, help = "Metadata files, project dirs or globs. Defaults to the cwd"),
+    manifest: Optional[str] = Option(None, help = "yaml/json/txt file listing metadata files or project dirs"),
+    diff: bool = Option(True, '--diff/--no-diff', help = "Only list the files, without unified diffs"),
+    max_workers: Optional[int] = Option(None, help = "Defaults to the number of CPUs"),
+    exit_code: bool = Option(False, '--exit-code', help = "Exit with 2 when any project would change"),
+    json_path: Optional[str] = Option(None, '--json', help = "Also write the plans to this file"),
+    ):
+    from pylibup.batch import resolve_config_files
+    from pylibup.plan import plan_many, format_plan_summary
+    config_files = resolve_config_files(paths or [get_cwd()], manifest_file = manifest)
+    if not config_files:
+        logger.error('No metadata files found')
+        raise typer.Exit(1)
+    plans = plan_many(config_files, diff = diff, max_workers = max_workers)
+    for plan in plans:
+        if plan.has_changes or plan.error: typer.echo(plan.format(show_diff = diff))
+    if len(plans) > 1: typer.echo(format_plan_summary(plans))
+    elif not plans[0].has_changes and not plans[0].error: typer.echo(plans[0].format(show_diff = False))
+    if json_path: to_path(json_path).write_text(json.dumps([p.dict() for p in plans], indent = 2))
+    if any(p.error for p in plans): raise typer.Exit(1)
+    if exit_code and any(p.has_changes for p in plans): raise typer.Exit(2)
+
+
+@repoCli.command('watch', short_help = "Regenerates the files affected by each edit of the metadata file, until interrupted")
+def watch_repo(
+    config_file: Optional[str] = Argument(None, help = "Defaults to the local state's config_file, else metadata.yaml in the cwd"),
+    name: Optional[str] = Argument(None),
+    project_dir: Optional[str] = Argument(None, help = "Defaults to the cwd"),
+    debounce: Optional[float] = Option(0.3, help = "Seconds without further edits before syncing"),
+    commit: bool = Option(False, '--commit/--no-commit', help = "Commit the regenerated files"),
+    commit_every: Optional[int] = Option(0, help = "Commit after this many syncs that wrote files. 0 only commits on exit"),
+    commit_msg: Optional[str] = Option("Regenerate from metadata"),
+    poll: bool = Option(False, '--poll', help = "Poll the files instead of using inotify"),
+    poll_interval: Optional[float] = Option(0.5),
+    ):
+    from pylibup.watch import ProjectWatcher
+    # only the local state, a config_file in the global state belongs to whichever project set it
+    def get_config_file():
+        return load_state().get('config_file')
+    config_file = config_file or get_config_file() or get_cwd('metadata.yaml')
+    project_dir = project_dir or get_cwd()
+    state = load_merged_states()
+    client = get_client(github_token = state.get('github_token', ''))
+    client.init_cfg(config_file = config_file, project_name = name, project_dir = project_dir)
+    watcher = ProjectWatcher(client.cfg, state_files = [get_statefile()], get_config_file = get_config_file, debounce = debounce, commit = commit, commit_every = commit_every, commit_msg = commit_msg, poll_interval = poll_interval, use_inotify = not poll)
+    watcher.run()
+
+
 @repoCli.command('cleanup')
 def cleanup_repo(
     force: bool = Option(False),
@@ -114,27 +241,32 @@ def cleanup_repo(
     if not force: force = typer.confirm("Are you sure you want to delete everything in this repo? There is no going back.", abort=True)
     if keep_dir:
         logger.info(f'Removing all files in {project_dir}/*')
-        exec_shell(f'rm -rf {project_dir}/*')
+        # Same as rm -rf dir/*, which leaves hidden files like .git in place
+        for path in to_path(project_dir).iterdir():
+            if path.name.startswith('.'): continue
+            if path.is_dir() and not path.is_symlink(): shutil.rmtree(path)
+            else: path.unlink()
     else:
         logger.info(f'Removing directory {project_dir}')
-        exec_shell(f'rm -rf {project_dir}')
+        shutil.rmtree(project_dir, ignore_errors=True)
 
 
 @repoCli.command('publish')
 def publish_new_repo(
-    config_file: Optional[str] = Argument(get_cwd('metadata.yaml')),
+    config_file: Optional[str] = Argument(None, help = "Defaults to metadata.yaml in the cwd"),
     github_token: Optional[str] = Option("", envvar="GITHUB_TOKEN"), 
     pypirc_path: Optional[str] = Option("~/.pypirc", envvar="PYPIRC_PATH"),
     commit_msg: Optional[str] = Option("Initialize"),
     overwrite_state: bool = Option(False),
     ):
+    config_file = config_file or get_cwd('metadata.yaml')
     state = load_merged_states()
     github_token = github_token or state.get('github_token', '')
     pypirc_path = state.get('pypirc_path', pypirc_path)
     config_file = config_file or state.get('config_file')
     project_dir = state.get('project_dir')
     project_name = state.get('project_name')
-    client = PylibClient(github_token = github_token, pyirc_path = pypirc_path)
+    client = get_client(github_token = github_token, pyirc_path = pypirc_path)
     try:
         client.publish(commit_msg= commit_msg, config_file = config_file, project_dir = project_dir, project_name = project_name)
         save_state(github_token = github_token, pyirc_path = pypirc_path, config_file = config_file, project_name = project_name, project_dir = project_dir, commit_msg = commit_msg, overwrite_state = overwrite_state)
@@ -145,19 +277,17 @@ def publish_new_repo(
 def push_to_repo(
     commit: Optional[str] = Argument("Updating"),
     branch: Optional[str] = Option("main"),
-    add_files: bool = Option(True, '--no-add'),
+    add_files: bool = Option(True, '--add/--no-add'),
     reinstall: bool = Option(False),
     ):
-    cmd = f'cd {get_cwd()} && '
-    if add_files: cmd += 'git add . && '
-    cmd += f'git commit -m "{commit}" && git push -u origin {branch}'
-    if reinstall: cmd += ' && pip install .'
-    exec_shell(cmd)
+    with command_errors():
+        commit_and_push(commit, branch, add_files = add_files)
+        if reinstall: pip_reinstall()
 
 @repoCli.command('reload', short_help = "Does a reinstall via pip install . within the cwd")
 def reload_pip_repo():
-    cmd = f'cd {get_cwd()} && pip install .'
-    exec_shell(cmd)
+    with command_errors():
+        pip_reinstall()
 
 
 @repoCli.command('release')
@@ -169,7 +299,7 @@ def publish_release(
     draft: bool = Option(False),
     prerelease: bool = Option(False),
     branch: Optional[str] = Option("main"),
-    push_first: bool = Option(True, '--no-push'),
+    push_first: bool = Option(True, '--push/--no-push'),
     github_token: Optional[str] = Option("", envvar="GITHUB_TOKEN")
     ):
     state = load_merged_states()
@@ -178,20 +308,29 @@ def publish_release(
         logger.error('Unable to locate repo name in state.')
         return
     if push_first:
-        exec_shell(f'cd {get_cwd()} && git add . && git commit -m "{release_message}" && git push -u origin {branch}')
+        with command_errors():
+            commit_and_push(release_message, branch)
     github_token = github_token or state.get('github_token', '')
-    github = Github(login_or_token=github_token)
-    repo = github.get_repo(repo_name)
-    rez = repo.create_git_tag_and_release(tag = tag, tag_message = tag_message, release_name= release_name, release_message= release_message, draft = draft, prerelease = prerelease)
-    logger(f'Created Release: {release_name}')
-    logger(rez)
+    from git import Repo
+    from pylibup.api import GithubAPI
+    sha = Repo(get_cwd(), search_parent_directories=True).head.commit.hexsha
+    try:
+        resp = GithubAPI(github_token = github_token).create_release(repo_name, tag, sha, tag_message = tag_message, release_name = release_name, release_message = release_message, draft = draft, prerelease = prerelease)
+    except ValueError as e:
+        logger.error(e)
+        raise typer.Exit(1)
+    if not resp.ok:
+        logger.error(f'Unable to create Release {release_name}: {resp.status_code} {resp.data}')
+        raise typer.Exit(1)
+    logger.info(f'Created Release: {release_name} ({resp.data.get("html_url", tag)})')
 
     
 
 @repoCli.command('meta')
 def display_meta(
-    config_file: Optional[str] = Argument(get_cwd('metadata.yaml')),
+    config_file: Optional[str] = Argument(None, help = "Defaults to metadata.yaml in the cwd"),
     ):
+    config_file = config_file or get_cwd('metadata.yaml')
     state = load_state()
     config_file = config_file or state.get('config_file')
     config_path = to_path(config_file)
@@ -202,6 +341,32 @@ def display_meta(
     logger(config_data)
 
 
+@fleetCli.command('sync', short_help = "Re-renders the managed files of every pylibup repo under a root and commits the changes on a branch")
+def sync_fleet_repos(
+    root: Optional[str] = Argument(None, help = "Dir to search for pylibup managed git repos. Defaults to the cwd"),
+    manifest: Optional[str] = Option(None, help = "yaml/json/txt file listing repos, instead of searching the root"),
+    branch: Optional[str] = Option("pylibup/sync", help = "Branch the changes are committed on"),
+    commit_msg: Optional[str] = Option("Sync pylibup managed files"),
+    max_depth: Optional[int] = Option(4, help = "How deep to search below the root"),
+    max_workers: Optional[int] = Option(None, help = "Defaults to the number of CPUs"),
+    push: bool = Option(False, '--push', help = "Push the committed branches"),
+    push_workers: Optional[int] = Option(4, help = "Max concurrent pushes"),
+    remote: Optional[str] = Option("origin"),
+    dry_run: bool = Option(False, '--dry-run', help = "Only report which repos would change"),
+    json_path: Optional[str] = Option(None, '--json', help = "Also write the report to this file"),
+    ):
+    from pylibup.batch import resolve_config_files
+    from pylibup.fleet import discover_repos, sync_fleet, format_fleet_report
+    config_files = resolve_config_files(manifest_file = manifest) if manifest else discover_repos(root or get_cwd(), max_depth = max_depth)
+    if not config_files:
+        logger.error('No pylibup managed repos found')
+        raise typer.Exit(1)
+    results = sync_fleet(config_files, max_workers = max_workers, push = push, push_workers = push_workers, remote = remote, branch = branch, commit_msg = commit_msg, dry_run = dry_run)
+    typer.echo(format_fleet_report(results))
+    if json_path: to_path(json_path).write_text(json.dumps([r.dict() for r in results], indent = 2))
+    if any(not r.ok for r in results): raise typer.Exit(1)
+
+
 @stateCli.command('local')
 def display_state():
     state = load_state()
@@ -244,5 +409,45 @@ def set_state(
         logger.info(f'Saving Global State: {globalstatefile.as_posix()}')
         save_global_state(overwrite_state = overwrite_state, **statevals)
     else:
-        logger.info(f'Saving Local State: {statefile.as_posix()}')
-        save_state(overwrite_state = overwrite_state, **statevals)
\ No newline at end of file
+        logger.info(f'Saving Local State: {get_statefile().as_posix()}')
+        save_state(overwrite_state = overwrite_state, **statevals)
+
+@daemonCli.command('start', short_help = "Starts a warm background server that `pylibup` commands are forwarded to")
+def start_daemon(
+    idle_timeout: Optional[float] = Option(None, help = "Stop after this many seconds without requests. Defaults to PYLIB_DAEMON_IDLE_TIMEOUT or never"),
+    ):
+    from pylibup import daemon
+    with command_errors():
+        status = daemon.start_daemon(idle_timeout = idle_timeout)
+        logger.info(f'Daemon running (pid {status["pid"]}) on {status["socket"]}')
+
+@daemonCli.command('run', short_help = "Runs the daemon in the foreground")
+def run_daemon(
+    idle_timeout: Optional[float] = Option(None, help = "Stop after this many seconds without requests"),
+    ):
+    from pylibup import daemon
+    daemon.Daemon(idle_timeout = idle_timeout).serve()
+
+@daemonCli.command('stop')
+def stop_daemon():
+    from pylibup import daemon
+    reply = daemon.stop_daemon()
+    if reply is None: logger.info('Daemon is not running')
+    else: logger.info(f'Stopped daemon (pid {reply["pid"]})')
+
+@daemonCli.command('status')
+def daemon_status(
+    json_output: bool = Option(False, '--json', help = "Print the status as JSON"),
+    ):
+    from pylibup import daemon
+    status = daemon.get_status()
+    if json_output:
+        echo(json.dumps(status, indent = 2))
+    elif status is None:
+        logger.info(f'Daemon is not running ({daemon.get_socket_path().as_posix()})')
+    else:
+        logger.info(f'Daemon running (pid {status["pid"]}, v{status["version"]}) on {status["socket"]}')
+        logger.info(f'Uptime {status["uptime"]:.0f}s, {status["requests"]} requests, {status["active"]} active')
+        logger.info('Warmed up: ' + ', '.join(f'{k} {v}ms' for k, v in status['warm_ms'].items()))
+        if not status['env_matches']: logger.warning('The environment differs from the daemon\'s, so commands from this shell run in-process. Restart the daemon to pick it up')
+    if status is None: raise typer.Exit(1)
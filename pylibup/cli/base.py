@@ -1,6 +1,6 @@
-from typer import Typer, Option, Argument, echo, colors, style
+from typer import Typer, Context, Option, Argument, echo, colors, style
 from typer.testing import CliRunner
-from pylibup.types import *
+from typing import List, Dict, Optional, Callable, Any
 from pylibup.utils import get_logger
 
 logger = get_logger()
@@ -32,6 +32,21 @@ def createCli(name: str, invoke_without_command: bool = False, chain: bool = Fal
 
 baseCli = Typer()
 
+@baseCli.callback()
+def baseCallback(
+    ctx: Context,
+    profile: Optional[str] = Option(None, '--profile', help = "Write a Chrome/Perfetto trace JSON of the run to this file and print a timing summary"),
+    ):
+    if not profile: return
+    from pylibup.trace import enable_tracing, disable_tracing
+    enable_tracing()
+    def write_profile():
+        tracer = disable_tracing()
+        path = tracer.save(profile)
+        echo(tracer.format_summary(), err = True)
+        echo(f'Trace written to {path.as_posix()}', err = True)
+    ctx.call_on_close(write_profile)
+
 __all__ = [
     'List',
     'Optional',
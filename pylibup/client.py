@@ -1,7 +1,12 @@
+import asyncio
+import functools
 from github import Github
-from .utils import get_logger, to_path, Path, exec_shell
+from .utils import get_logger, to_path, Path
 from .config import GitConfig, load_pypi_creds
 from .classes import PylibConfig, get_metadata_template
+from .api import GithubAPI
+from .state import ProjectState
+from .repo_secrets import SecretProvisioner
 from typing import Dict
 
 logger = get_logger()
@@ -10,11 +15,12 @@ class PylibClient:
     def __init__(self, github_token: str = None, pyirc_path: str = '~/.pypirc'):
         self.github_token = github_token or GitConfig.token
         self.pyirc = load_pypi_creds(pyirc_path)
-        self.github = Github(login_or_token=self.github_token)
+        self.github = Github(login_or_token=self.github_token or None, base_url=GitConfig.api_url)
+        self.api = GithubAPI(github_token = self.github_token)
         self.cfg: PylibConfig = None
     
     def init_cfg(self, config_file: str = None, project_name: str = None, project_dir: str = None, *args, **kwargs):
-        self.cfg = PylibConfig(github=self.github, github_token = self.github_token, config_file = config_file, project_name = project_name, project_dir = project_dir, *args, **kwargs)
+        self.cfg = PylibConfig(github=self.github, github_token = self.github_token, api = self.api, config_file = config_file, project_name = project_name, project_dir = project_dir, *args, **kwargs)
     
     def init(self, project_dir: str = None, name: str = None, repo_user: str = None, private: bool = True, overwrite: bool = False, **kwargs):
         working_dir = to_path(project_dir) if project_dir else Path.cwd()
@@ -23,35 +29,56 @@ class PylibClient:
         working_dir.mkdir(exist_ok=True)
         tmpl_file = working_dir.joinpath('metadata.yaml')
         if tmpl_file.exists() and not overwrite: raise ValueError(f'{tmpl_file.as_posix()} exists but overwrite is not selected')
-        tmpl = get_metadata_template(github = self.github, name = name, repo_user = repo_user, private = private, **kwargs)
+        tmpl = get_metadata_template(github = self.github, api = self.api, name = name, repo_user = repo_user, private = private, **kwargs)
         logger.info(f'Writing Metadata template to {tmpl_file.as_posix()}')
         tmpl = "## Autogenerated by Pylibup\n\n" + tmpl
         tmpl_file.write_text(tmpl)
         #logger.info
         #logger.info(tmpl)
 
-    def build(self, config_file: str = None, project_name: str = None, project_dir: str = None, commit_msg: str = 'Initialize', overwrite: bool = False, auto_publish: bool = False, *args, **kwargs):
+    def build(self, config_file: str = None, project_name: str = None, project_dir: str = None, commit_msg: str = 'Initialize', overwrite: bool = False, auto_publish: bool = False, concurrent: bool = False, *args, **kwargs):
+        if concurrent and auto_publish:
+            return asyncio.run(self.abuild(config_file = config_file, project_name = project_name, project_dir = project_dir, commit_msg = commit_msg, overwrite = overwrite, auto_publish = auto_publish, *args, **kwargs))
         self.init_cfg(config_file= config_file, project_name = project_name, project_dir = project_dir, *args, **kwargs)
         self.cfg.build(commit_msg= commit_msg, overwrite= overwrite, auto_publish= auto_publish, *args, **kwargs)
         if auto_publish:
-            extra_secrets = {}
-            if self.cfg.config.needs_ipyirc:
-                extra_secrets['PYPI_API_TOKEN'] = self.pyirc.get('pypi')
-            self.create_secrets(extra_secrets)
+            self.create_secrets(self.get_extra_secrets())
 
-    def create_secrets(self, extra_secrets: Dict[str, str] = {}):
+    async def abuild(self, config_file: str = None, project_name: str = None, project_dir: str = None, commit_msg: str = 'Initialize', overwrite: bool = False, auto_publish: bool = False, *args, **kwargs):
+        """
+        Same end state as `build`, but overlaps the network bound steps with the local ones:
+        the GitHub repo is checked/created while files are rendered and committed,
+        and secrets are uploaded while the branch is pushed.
+        """
+        loop = asyncio.get_running_loop()
+        def run(func, *a, **kw): return loop.run_in_executor(None, functools.partial(func, *a, **kw))
+
+        self.init_cfg(config_file= config_file, project_name = project_name, project_dir = project_dir, *args, **kwargs)
+        logger.info(f'Building Repo: {self.cfg.project_name} @ {self.cfg.config.opt.default_branch}')
+        tasks = [run(self.cfg.build_files, commit_msg = commit_msg, overwrite = overwrite, *args, **kwargs)]
+        if auto_publish: tasks.append(run(self.cfg.ensure_github_repo))
+        await asyncio.gather(*tasks)
+        if auto_publish:
+            logger.info(f'Publishing {self.cfg.project_name}')
+            await run(self.cfg.setup_remote)
+            await asyncio.gather(run(self.cfg.push), run(self.create_secrets, self.get_extra_secrets()))
+        logger('Completed Pylib Build. Have fun!')
+
+    def get_extra_secrets(self) -> Dict[str, str]:
+        extra_secrets = {}
+        if self.cfg.config.needs_ipyirc and self.pyirc and self.pyirc.get('pypi'):
+            extra_secrets['PYPI_API_TOKEN'] = self.pyirc['pypi'].password
+        return extra_secrets
+
+    def create_secrets(self, extra_secrets: Dict[str, str] = {}, force: bool = False, max_workers: int = 8):
         if not self.cfg: return
         assert self.cfg.repo_exists, 'Repo has not been created yet'
-        repo = self.github.get_repo(self.cfg.config.repo_path)
         secrets = self.cfg.config.get_secrets()
-        if secrets:
-            for key, value in secrets.items():
-                rez = repo.create_secret(secret_name = key, unencrypted_value = value)
-                logger.info(f'Created Secret: {key} = {rez}')
-        if extra_secrets:
-            for key, value in extra_secrets.items():
-                rez = repo.create_secret(secret_name = key, unencrypted_value = value)
-                logger.info(f'Created Secret: {key} = {rez}')
+        if extra_secrets: secrets.update(extra_secrets)
+        if not secrets: return
+        provisioner = SecretProvisioner(api = self.api, repo_path = self.cfg.github_repo_path, state = ProjectState(self.cfg.working_dir), max_workers = max_workers)
+        for key, status in provisioner.provision(secrets, force = force).items():
+            logger.info(f'Secret {key}: {status}')
 
     def publish(self, commit_msg: str = "Initialize", config_file: str = None, project_name: str = None, project_dir: str = None, *args, **kwargs):
         self.init_cfg(config_file= config_file, project_name = project_name, project_dir = project_dir, *args, **kwargs)
@@ -1,5 +1,6 @@
 from .envs import *
 from .utils import to_path, Path
+from .state import globalstate_dir
 from .types import *
 
 class PypiCreds(BaseModel):
@@ -27,6 +28,31 @@ def load_pypi_creds(path: str = '~/.pypirc'):
 # We assume user is authenticated to git right?
 class GitConfig:
     token: str = envToStr('GITHUB_TOKEN', '')
+    api_url: str = envToStr('GITHUB_API_URL', 'https://api.github.com')
+    # Base that repo paths are appended to for the git remote, e.g. a local dir of bare repos
+    git_url: str = envToStr('PYLIB_GIT_URL', 'https://github.com')
+    api_cache_ttl: float = envToFloat('PYLIB_API_CACHE_TTL', 300.0)
+    api_etag_cache: bool = envToBool('PYLIB_API_ETAG_CACHE', 'true')
+    api_max_retries: int = envToInt('PYLIB_API_MAX_RETRIES', 5)
+    api_rate_limit: float = envToFloat('PYLIB_API_RATE_LIMIT', 10.0)
+    api_pool_size: int = envToInt('PYLIB_API_POOL_SIZE', 10)
+
+
+class StateConfig:
+    globalstate_dir: Path = globalstate_dir
+    cache_dir: Path = globalstate_dir.joinpath('cache')
+    config_cache: bool = envToBool('PYLIB_CONFIG_CACHE', 'true')
+
+    @classmethod
+    def get_cache_dir(cls, name: str) -> Optional[Path]:
+        """
+        Returns the named cache dir under the global state dir,
+        or None if it can't be created (e.g. read-only site-packages)
+        """
+        path = cls.cache_dir.joinpath(name)
+        try: path.mkdir(parents=True, exist_ok=True)
+        except OSError: return None
+        return path
     
 
 
@@ -0,0 +1,154 @@
+"""
+Compiled-config cache for project metadata files.
+
+Parsing metadata.yaml and validating it into the PylibConfigData tree
+happens on every build/publish, even though the file rarely changes. The
+validated config is pickled under the global cache dir, keyed by a hash of
+the metadata file's bytes, the pylibup version and the config schema, and
+loaded directly on a hit. Editing the file, upgrading pylibup or adding a
+field to the config models changes the key, so stale entries are never read.
+
+Metadata can come from .yaml/.yml, .json, or .toml files. In a .toml file
+(including pyproject.toml) the config is read from the `[tool.pylibup]`
+table when there is one.
+"""
+import os
+import pickle
+import hashlib
+import tempfile
+import threading
+import contextlib
+
+from .types import *
+from .utils import get_logger, to_path, Path
+from .serializers import Json, Yaml
+from .config import StateConfig
+from .version import VERSION
+from .trace import span
+
+try:
+    import tomllib
+except ImportError: # pragma: no cover - python < 3.11
+    try: import tomli as tomllib
+    except ImportError: tomllib = None
+
+
+logger = get_logger()
+
+config_suffixes = ('.yaml', '.yml', '.json', '.toml')
+metadata_filenames = ('metadata.yaml', 'metadata.yml', 'metadata.json', 'metadata.toml', 'pyproject.toml')
+
+
+def parse_config_text(text: Union[str, bytes], suffix: str) -> Dict[str, Any]:
+    if isinstance(text, bytes): text = text.decode('utf-8')
+    if suffix in {'.yaml', '.yml'}: return Yaml.loads(text) or {}
+    if suffix == '.json': return Json.loads(text)
+    if suffix == '.toml':
+        if tomllib is None: raise ValueError('Reading .toml configs requires python 3.11+ or tomli')
+        data = tomllib.loads(text)
+        return data.get('tool', {}).get('pylibup', data)
+    raise ValueError(f'Unsupported config file type: {suffix}. Supported: {", ".join(config_suffixes)}')
+
+
+def find_metadata_file(path: Path) -> Optional[Path]:
+    for name in metadata_filenames:
+        fpath = path.joinpath(name)
+        if not fpath.exists(): continue
+        # pyproject.toml only counts when it configures pylibup
+        if name == 'pyproject.toml' and '[tool.pylibup' not in fpath.read_text(): continue
+        return fpath
+    return None
+
+
+def read_config_file(config_file: Union[str, Path]) -> Dict[str, Any]:
+    config_file = to_path(config_file)
+    return parse_config_text(config_file.read_bytes(), config_file.suffix)
+
+
+class ConfigCache:
+    protocol: int = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, cache_dir: Union[str, Path] = None, enabled: bool = None):
+        self.enabled = StateConfig.config_cache if enabled is None else enabled
+        self.cache_dir = to_path(cache_dir) if cache_dir else (StateConfig.get_cache_dir('configs') if self.enabled else None)
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def get_key(cls, source: bytes, suffix: str, schema: str = '') -> str:
+        return hashlib.sha256(b'\0'.join([VERSION.encode(), schema.encode(), suffix.encode(), source])).hexdigest()
+
+    def get_path(self, key: str) -> Optional[Path]:
+        return self.cache_dir.joinpath(f'{key}.pkl') if self.cache_dir else None
+
+    def read(self, key: str) -> Any:
+        path = self.get_path(key)
+        if path is None or not path.exists(): return None
+        try: return pickle.loads(path.read_bytes())
+        except Exception as e:
+            # A truncated or incompatible entry is just a miss
+            logger.debug(f'Discarding config cache entry {path.name}: {e}')
+            with contextlib.suppress(OSError): path.unlink()
+            return None
+
+    def write(self, key: str, config: Any):
+        path = self.get_path(key)
+        if path is None: return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir = path.parent.as_posix(), prefix = f'.{path.name}.', suffix = '.tmp')
+            with os.fdopen(fd, 'wb') as f: f.write(pickle.dumps(config, protocol = self.protocol))
+            os.replace(tmp_path, path.as_posix())
+        except (OSError, pickle.PicklingError) as e:
+            logger.debug(f'Unable to write config cache entry {path.name}: {e}')
+
+    def load(self, config_file: Union[str, Path], validate: Callable[[Dict[str, Any]], Any], schema: str = '') -> Any:
+        """
+        Returns the validated config for `config_file`, from the cache when the
+        file and pylibup version are unchanged, else parses and validates it
+        """
+        config_file = to_path(config_file)
+        source = config_file.read_bytes()
+        if not self.enabled: return validate(parse_config_text(source, config_file.suffix))
+        key = self.get_key(source, config_file.suffix, schema)
+        with span(config_file.name, 'config') as s:
+            config = self.read(key)
+            s.set(cache_hit = config is not None)
+            if config is not None:
+                self.hits += 1
+                return config
+            self.misses += 1
+            config = validate(parse_config_text(source, config_file.suffix))
+            self.write(key, config)
+        return config
+
+    def clear(self) -> int:
+        if not self.cache_dir or not self.cache_dir.exists(): return 0
+        paths = list(self.cache_dir.glob('*.pkl'))
+        for path in paths:
+            with contextlib.suppress(OSError): path.unlink()
+        return len(paths)
+
+
+_config_cache: ConfigCache = None
+_config_cache_lock = threading.Lock()
+
+def get_config_cache() -> ConfigCache:
+    """
+    Returns the process-wide ConfigCache, so its hit/miss counters cover every load
+    """
+    global _config_cache
+    if _config_cache is None:
+        with _config_cache_lock:
+            if _config_cache is None: _config_cache = ConfigCache()
+    return _config_cache
+
+
+__all__ = [
+    'config_suffixes',
+    'metadata_filenames',
+    'find_metadata_file',
+    'parse_config_text',
+    'read_config_file',
+    'ConfigCache',
+    'get_config_cache',
+]
@@ -0,0 +1,379 @@
+"""
+Warm CLI daemon and the `pylibup`/`pylib` console entry point.
+
+`pylibup daemon start` runs a server on a Unix socket that has already
+imported the CLI, compiled the templates, parsed the global state and
+~/.pypirc, and fetched the authenticated GitHub user. Each request is served
+by a forked child, so requests run concurrently and can't leak state into
+each other, while the warm parent stays clean:
+
+- the client passes its stdin/stdout/stderr over the socket (SCM_RIGHTS), and
+  the child dup2s them, so output, colors and prompts go to the caller's terminal
+- the child takes on the caller's cwd and environment, runs the command and
+  sends back the exit code; Ctrl-C in the client is forwarded to the child
+- config read from the environment at import time (PYLIB_*, GITHUB_*, HOME)
+  is compared by fingerprint, and on a mismatch the client runs in-process
+- the parent closes its pooled HTTP connections before serving, so children
+  never share a socket
+- a connection whose request doesn't arrive within `request_timeout` is
+  dropped, and a client that gets no ack within `handshake_timeout` runs
+  the command in-process
+
+`main` forwards to the daemon when its socket accepts connections and falls
+back to running the command in-process otherwise (or with PYLIB_DAEMON=false).
+This module only imports the stdlib until the command runs in-process.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import select
+import struct
+import hashlib
+import tempfile
+import traceback
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+
+supported = hasattr(socket, 'AF_UNIX') and hasattr(os, 'fork') and hasattr(socket, 'send_fds')
+header = struct.Struct('!I')
+# The daemon drops connections whose request doesn't arrive in time, so one stuck client can't
+# block the accept loop. Clients wait a little longer for the child's ack, then run in-process
+request_timeout = 1.0
+handshake_timeout = 5.0
+
+# Environment the config modules read at import time. The daemon only serves clients with the same values
+env_prefixes = ('PYLIB_', 'GITHUB_')
+env_keys = ('HOME', 'TMPDIR', 'PYTHONPATH')
+
+
+def get_socket_path() -> Path:
+    if os.getenv('PYLIB_DAEMON_SOCKET'): return Path(os.environ['PYLIB_DAEMON_SOCKET']).expanduser()
+    return Path(tempfile.gettempdir()).joinpath(f'pylibup-daemon-{getattr(os, "getuid", lambda: 0)()}', 'daemon.sock')
+
+
+def get_env_fingerprint(env: Dict[str, str]) -> str:
+    from pylibup.version import VERSION
+    items = sorted((k, v) for k, v in env.items() if (k.startswith(env_prefixes) and not k.startswith('PYLIB_DAEMON')) or k in env_keys)
+    return hashlib.sha1(json.dumps([VERSION, sys.executable, items]).encode()).hexdigest()
+
+
+def is_enabled() -> bool:
+    return supported and os.getenv('PYLIB_DAEMON', 'true').lower() not in {'0', 'false', 'no', 'off'}
+
+
+class Channel:
+    """
+    Length-prefixed JSON messages over a stream socket, with optional fds on the first one
+    """
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.buffer = bytearray()
+
+    def send(self, data: Dict[str, Any], fds: List[int] = None):
+        payload = json.dumps(data).encode()
+        message = header.pack(len(payload)) + payload
+        if fds: message = message[socket.send_fds(self.sock, [message], fds):]
+        if message: self.sock.sendall(message)
+
+    def recv(self, maxfds: int = 0) -> Tuple[Dict[str, Any], List[int]]:
+        fds = []
+        while True:
+            if len(self.buffer) >= header.size:
+                end = header.size + header.unpack_from(self.buffer)[0]
+                if len(self.buffer) >= end:
+                    payload = bytes(self.buffer[header.size:end])
+                    del self.buffer[:end]
+                    return json.loads(payload), fds
+            if maxfds and not fds: chunk, fds, _, _ = socket.recv_fds(self.sock, 65536, maxfds)
+            else: chunk = self.sock.recv(65536)
+            if not chunk: raise ConnectionError('Connection closed by the other side')
+            self.buffer += chunk
+
+
+def connect(socket_path: Path = None, timeout: float = None) -> Optional[socket.socket]:
+    socket_path = socket_path or get_socket_path()
+    if not supported or not socket_path.exists(): return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if timeout: sock.settimeout(timeout)
+    try: sock.connect(socket_path.as_posix())
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def request(data: Dict[str, Any], socket_path: Path = None, timeout: float = 5.0) -> Optional[Dict[str, Any]]:
+    """
+    Sends a control request (status/stop) and returns the reply, or None if the daemon isn't running
+    """
+    sock = connect(socket_path, timeout = timeout)
+    if sock is None: return None
+    with sock:
+        channel = Channel(sock)
+        channel.send(data)
+        return channel.recv()[0]
+
+
+def get_status(socket_path: Path = None) -> Optional[Dict[str, Any]]:
+    return request({'cmd': 'status', 'fingerprint': get_env_fingerprint(os.environ)}, socket_path)
+
+
+def forward(argv: List[str], prog_name: str = 'pylibup', socket_path: Path = None) -> Optional[int]:
+    """
+    Runs the command in the daemon and returns its exit code,
+    or None when it should run in-process instead
+    """
+    sock = connect(socket_path, timeout = handshake_timeout)
+    if sock is None: return None
+    with sock:
+        channel = Channel(sock)
+        fds = [fd for fd in (0, 1, 2) if is_fd_open(fd)]
+        env = dict(os.environ)
+        try:
+            channel.send({'cmd': 'run', 'argv': argv, 'prog_name': prog_name, 'cwd': os.getcwd(), 'env': env, 'fingerprint': get_env_fingerprint(env), 'fds': fds}, fds)
+            reply = channel.recv()[0]
+        except OSError: return None
+        if reply.get('fallback'): return None
+        pid = reply['pid']
+        # The child has acknowledged, the command itself may run for as long as it needs
+        sock.settimeout(None)
+        while True:
+            try: return channel.recv()[0].get('exit', 1)
+            except KeyboardInterrupt:
+                try: os.kill(pid, signal.SIGINT)
+                except ProcessLookupError: pass
+            except OSError: return 1
+
+
+def is_fd_open(fd: int) -> bool:
+    try: os.fstat(fd)
+    except OSError: return False
+    return True
+
+
+def run_cli(argv: List[str], prog_name: str = 'pylibup') -> int:
+    from pylibup.cli import baseCli
+    try: baseCli(args = argv, prog_name = prog_name)
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int): return e.code or 0
+        print(e.code, file = sys.stderr)
+        return 1
+    return 0
+
+
+class Daemon:
+    def __init__(self, socket_path: Path = None, idle_timeout: float = None):
+        self.socket_path = socket_path or get_socket_path()
+        self.pid_path = self.socket_path.with_suffix('.pid')
+        self.idle_timeout = float(os.getenv('PYLIB_DAEMON_IDLE_TIMEOUT', 0)) if idle_timeout is None else idle_timeout
+        self.fingerprint = get_env_fingerprint(os.environ)
+        self.started = time.time()
+        self.last_request = time.monotonic()
+        self.requests = 0
+        self.children = set()
+        self.running = False
+        self.warm: Dict[str, float] = {}
+
+    def warmup(self):
+        """
+        Imports and caches everything a forked request would otherwise redo
+        """
+        from pylibup.utils import get_logger
+        logger = get_logger()
+        start = time.perf_counter()
+        from pylibup.cli import app
+        from pylibup.templates import PylibTemplates
+        from pylibup import batch, plan, fleet
+        self.warm['imports'] = time.perf_counter() - start
+        start = time.perf_counter()
+        PylibTemplates.warmup()
+        self.warm['templates'] = time.perf_counter() - start
+        start = time.perf_counter()
+        state = app.load_global_state()
+        github_token = os.getenv('GITHUB_TOKEN') or state.get('github_token', '')
+        client = app.get_client(github_token = github_token, pyirc_path = state.get('pypirc_path', os.getenv('PYPIRC_PATH', '~/.pypirc')))
+        self.warm['client'] = time.perf_counter() - start
+        if client.github_token:
+            start = time.perf_counter()
+            try: client.api.user
+            except Exception as e: logger.warning(f'Unable to fetch the GitHub user: {e}')
+            else: self.warm['github_user'] = time.perf_counter() - start
+        # Children inherit the parsed responses, but must not share pooled connections
+        client.api.session.close()
+        logger.info('Warmed up in ' + ', '.join(f'{k} {v * 1000:.0f}ms' for k, v in self.warm.items()))
+
+    def status(self, fingerprint: str = None) -> Dict[str, Any]:
+        from pylibup.version import VERSION
+        return {
+            'pid': os.getpid(), 'version': VERSION, 'socket': self.socket_path.as_posix(), 'uptime': time.time() - self.started,
+            'requests': self.requests, 'active': len(self.children), 'idle_timeout': self.idle_timeout,
+            'warm_ms': {k: round(v * 1000, 1) for k, v in self.warm.items()},
+            'env_matches': None if fingerprint is None else fingerprint == self.fingerprint,
+        }
+
+    def stop(self, *args):
+        self.running = False
+
+    def reap(self):
+        for pid in list(self.children):
+            try: done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError: done = pid
+            if done: self.children.discard(pid)
+
+    def is_peer_allowed(self, conn: socket.socket) -> bool:
+        if not hasattr(socket, 'SO_PEERCRED'): return True
+        _, uid, _ = struct.unpack('3i', conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')))
+        return uid == os.getuid()
+
+    def serve(self):
+        from pylibup.utils import get_logger
+        logger = get_logger()
+        if not supported: raise RuntimeError('The daemon needs fork, Unix sockets and socket.send_fds (Python 3.9+)')
+        if get_status(self.socket_path): raise RuntimeError(f'A daemon is already listening on {self.socket_path.as_posix()}')
+        self.socket_path.parent.mkdir(mode = 0o700, parents = True, exist_ok = True)
+        self.warmup()
+        self.socket_path.unlink(missing_ok = True)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path.as_posix())
+        os.chmod(self.socket_path, 0o600)
+        server.listen(64)
+        self.pid_path.write_text(str(os.getpid()))
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.running = True
+        logger.info(f'Listening on {self.socket_path.as_posix()} (pid {os.getpid()})')
+        try:
+            while self.running:
+                self.reap()
+                if not select.select([server], [], [], 1.0)[0]:
+                    if self.idle_timeout and not self.children and time.monotonic() - self.last_request > self.idle_timeout:
+                        logger.info(f'Idle for {self.idle_timeout:.0f}s. Stopping')
+                        self.running = False
+                    continue
+                conn, _ = server.accept()
+                try:
+                    if self.is_peer_allowed(conn): self.handle(conn, server)
+                except Exception as e: logger.error(f'Request failed: {type(e).__name__}: {e}')
+                finally: conn.close()
+        finally:
+            server.close()
+            if self.pid_path.exists() and self.pid_path.read_text().strip() == str(os.getpid()):
+                self.socket_path.unlink(missing_ok = True)
+                self.pid_path.unlink(missing_ok = True)
+            logger.info(f'Stopped after {self.requests} requests')
+
+    def handle(self, conn: socket.socket, server: socket.socket):
+        conn.settimeout(request_timeout)
+        channel = Channel(conn)
+        message, fds = channel.recv(maxfds = 3)
+        try:
+            cmd = message.get('cmd')
+            if cmd == 'status': return channel.send(self.status(message.get('fingerprint')))
+            if cmd == 'stop':
+                self.running = False
+                return channel.send({'stopping': True, 'pid': os.getpid()})
+            if cmd != 'run' or message.get('fingerprint') != self.fingerprint or len(fds) != len(message.get('fds', [])):
+                return channel.send({'fallback': True})
+            self.requests += 1
+            self.last_request = time.monotonic()
+            pid = os.fork()
+            if pid == 0:
+                server.close()
+                self.run_child(channel, message, fds)
+            self.children.add(pid)
+        finally:
+            for fd in fds: os.close(fd)
+
+    def run_child(self, channel: Channel, message: Dict[str, Any], fds: List[int]):
+        """
+        Runs in the forked child and never returns
+        """
+        code = 1
+        try: channel.send({'pid': os.getpid()})
+        # The client gave up waiting and runs the command itself
+        except OSError: os._exit(code)
+        channel.sock.settimeout(None)
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            for target, fd in zip(message['fds'], fds): os.dup2(fd, target)
+            for fd in fds:
+                if fd not in message['fds']: os.close(fd)
+            if hasattr(sys.stdout, 'reconfigure'): sys.stdout.reconfigure(line_buffering = os.isatty(1))
+            os.environ.clear()
+            os.environ.update(message['env'])
+            os.chdir(message['cwd'])
+            code = run_cli(message['argv'], prog_name = message.get('prog_name', 'pylibup'))
+        except KeyboardInterrupt: code = 130
+        except BaseException: traceback.print_exc()
+        finally:
+            for stream in (sys.stdout, sys.stderr):
+                try: stream.flush()
+                except Exception: pass
+            try: channel.send({'exit': code})
+            except OSError: pass
+            os._exit(code)
+
+
+def start_daemon(socket_path: Path = None, timeout: float = 30.0, idle_timeout: float = None) -> Dict[str, Any]:
+    """
+    Starts the daemon in the background and waits until it accepts requests
+    """
+    import subprocess
+    socket_path = socket_path or get_socket_path()
+    status = get_status(socket_path)
+    if status: return status
+    socket_path.parent.mkdir(mode = 0o700, parents = True, exist_ok = True)
+    cmd = [sys.executable, '-m', 'pylibup', 'daemon', 'run']
+    if idle_timeout is not None: cmd += ['--idle-timeout', str(idle_timeout)]
+    env = dict(os.environ, PYLIB_DAEMON_SOCKET = socket_path.as_posix())
+    with socket_path.with_suffix('.log').open('ab') as log:
+        proc = subprocess.Popen(cmd, stdin = subprocess.DEVNULL, stdout = log, stderr = subprocess.STDOUT, env = env, start_new_session = True)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = get_status(socket_path)
+        if status: return status
+        if proc.poll() is not None: raise RuntimeError(f'The daemon exited with {proc.returncode}. See {socket_path.with_suffix(".log").as_posix()}')
+        time.sleep(0.05)
+    raise TimeoutError(f'The daemon did not start within {timeout:.0f}s')
+
+
+def stop_daemon(socket_path: Path = None, timeout: float = 10.0) -> Optional[Dict[str, Any]]:
+    """
+    Asks the daemon to stop and waits for its socket to go away. Returns None if it wasn't running
+    """
+    socket_path = socket_path or get_socket_path()
+    reply = request({'cmd': 'stop'}, socket_path)
+    if reply is None: return None
+    deadline = time.monotonic() + timeout
+    while socket_path.exists() and time.monotonic() < deadline: time.sleep(0.05)
+    return reply
+
+
+def main(argv: List[str] = None):
+    """
+    Console entry point. Forwards to the daemon if it's running, otherwise runs in-process
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    prog_name = Path(sys.argv[0]).name if sys.argv and sys.argv[0] and not sys.argv[0].startswith('-') else 'pylibup'
+    if prog_name == '__main__.py': prog_name = 'pylibup'
+    # daemon commands always run here, so `daemon stop` doesn't go through the daemon it stops
+    if is_enabled() and argv and argv[0] != 'daemon':
+        code = forward(argv, prog_name)
+        if code is not None: sys.exit(code)
+    sys.exit(run_cli(argv, prog_name))
+
+
+__all__ = [
+    'Daemon',
+    'get_socket_path',
+    'get_status',
+    'forward',
+    'start_daemon',
+    'stop_daemon',
+    'main',
+]
@@ -70,7 +70,7 @@ def loadEnvFile(path: Union[str, Path], override: bool = False):
     elif path.suffix == '.yaml': loader = Yaml.loads
     elif path.suffix == '.pkl': loader = Pkl.loads
     if loader is None: return False
-    data = loader(path.read_text())
+    data = loader(path.read_bytes() if path.suffix == '.pkl' else path.read_text())
     for k,v in data.items():
         toEnv(name=k, value=v, override=override)
     _LoadedEnvFiles.add(path.name)
@@ -0,0 +1,216 @@
+"""
+Fleet sync: re-renders the template-owned files of many local repos.
+
+Repos are discovered under a root (a git repo with a pylibup metadata
+file). Each repo is synced in a worker process:
+
+- only managed, committed artifacts are rendered, and only the ones whose
+  content differs from the working tree are written (unmanaged stubs and
+  gitignored files like build.sh are never touched)
+- changes are committed on a sync branch, then the original branch is
+  checked out again so the working tree is left as it was. A sync branch
+  created by a run that commits nothing is deleted again
+- repos with uncommitted changes, untracked files at artifact paths, a
+  detached HEAD or a sync branch that isn't based on the current branch
+  tip are skipped
+
+Committed branches can then be pushed on a bounded thread pool.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from git import Repo
+
+from .types import *
+from .utils import get_logger, to_path, Path
+from .config_cache import find_metadata_file
+from .manifest import BuildManifest
+from .runner import GitRunner
+from .classes import PylibConfig
+from .plan import plan_artifact, is_committed_artifact
+from .batch import map_config_files, format_table, get_worker_count
+
+
+logger = get_logger()
+
+skip_dirs = {'node_modules', '__pycache__', 'venv', 'site-packages', 'dist', 'build'}
+
+
+class FleetRepoResult(BaseModel):
+    config_file: str
+    project_dir: str
+    status: str = 'pending'
+    branch: Optional[str] = None
+    files: List[str] = []
+    commit: Optional[str] = None
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def project_name(self) -> str:
+        return to_path(self.project_dir).name
+
+    @property
+    def ok(self) -> bool:
+        return self.status not in {'failed', 'push-failed'}
+
+
+def discover_repos(root: Union[str, Path], max_depth: int = 4) -> List[Path]:
+    """
+    Returns the metadata files of the pylibup managed git repos under `root`.
+    Doesn't descend into hidden dirs, into common build/env dirs or into a repo once found.
+    """
+    found, stack = [], [(to_path(root).expanduser().resolve(), 0)]
+    while stack:
+        path, depth = stack.pop()
+        if path.joinpath('.git').exists():
+            metadata_file = find_metadata_file(path)
+            if metadata_file:
+                found.append(metadata_file)
+                continue
+        if depth >= max_depth: continue
+        try: entries = list(os.scandir(path))
+        except OSError: continue
+        stack.extend((Path(e.path), depth + 1) for e in entries if e.is_dir(follow_symlinks = False) and not e.name.startswith('.') and e.name not in skip_dirs)
+    return sorted(found)
+
+
+def get_changed_artifacts(root: Path, config: Any, manifest: BuildManifest = None) -> List[Any]:
+    artifacts = [a for a in config.get_artifacts() if a.managed and is_committed_artifact(config, a)]
+    return [a for a in artifacts if plan_artifact(root, a, manifest = manifest, diff = False).status != 'unchanged']
+
+
+def sync_repo(config_file: Union[str, Path], branch: str = 'pylibup/sync', commit_msg: str = 'Sync pylibup managed files', dry_run: bool = False) -> FleetRepoResult:
+    """
+    Re-renders the managed files of a single repo and commits the changed ones on `branch`
+    """
+    config_file = to_path(config_file)
+    root = config_file.parent
+    result = FleetRepoResult(config_file = config_file.as_posix(), project_dir = root.as_posix(), branch = branch)
+    start = time.perf_counter()
+    try:
+        config = PylibConfig.load_config(config_file)
+        manifest = BuildManifest(root.joinpath('.git', 'pylibup', 'manifest.json'), root)
+        changed = get_changed_artifacts(root, config, manifest)
+        result.files = [a.filename for a in changed]
+        if not changed: result.status = 'unchanged'
+        elif dry_run: result.status = 'changed'
+        else: commit_changes(result, root, config, manifest, changed, branch, commit_msg)
+    except Exception as e:
+        result.status = 'failed'
+        result.error = f'{type(e).__name__}: {e}'.splitlines()[0]
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def commit_changes(result: FleetRepoResult, root: Path, config: Any, manifest: BuildManifest, changed: List[Any], branch: str, commit_msg: str):
+    git = GitRunner(Repo(root))
+    original = git.current_branch
+    if original is None or git.is_dirty:
+        result.status = 'skipped'
+        result.error = 'detached HEAD' if original is None else 'uncommitted changes'
+        return
+    exists = branch in git.repo.heads
+    if exists and branch != original and not git.repo.is_ancestor(git.repo.heads[original].commit, git.repo.heads[branch].commit):
+        result.status = 'skipped'
+        result.error = f'{branch} is not based on the tip of {original}'
+        return
+    # Untracked files would be committed on the sync branch and removed by checking out the original again
+    untracked = sorted(set(git.repo.untracked_files) & {a.filename for a in changed})
+    if untracked:
+        result.status = 'skipped'
+        result.error = f'untracked files: {", ".join(untracked)}'
+        return
+    git.checkout(branch, create = True)
+    originals: Dict[Path, Optional[bytes]] = {}
+
+    def restore():
+        # Leave the repo as it was: drop what was written on the sync branch and put back what it replaced
+        git.repo.head.reset(index = True, working_tree = True)
+        for fpath, content in originals.items():
+            if content is not None: fpath.write_bytes(content)
+            elif fpath.exists(): fpath.unlink()
+
+    try:
+        # The sync branch may already have some of the changes from an earlier run
+        if exists and branch != original: changed = get_changed_artifacts(root, config, manifest)
+        result.files = [a.filename for a in changed]
+        if not changed:
+            result.status = 'up-to-date'
+            return
+        for artifact in changed:
+            fpath = root.joinpath(artifact.filename)
+            originals[fpath] = fpath.read_bytes() if fpath.exists() else None
+            fpath.parent.mkdir(parents = True, exist_ok = True)
+            fpath.write_text(artifact.content)
+        git.add([a.filename for a in changed])
+        if not git.has_staged_changes:
+            restore()
+            result.status = 'unchanged'
+            return
+        result.commit = git.commit(commit_msg).stdout
+        result.status = 'committed'
+    except Exception:
+        restore()
+        raise
+    finally:
+        if branch != original:
+            git.checkout(original)
+            if not exists and result.status != 'committed': git.delete_branch(branch, check = False)
+        # Refresh the hashes of the files now checked out, so the next run can skip hashing them
+        for artifact in changed:
+            if root.joinpath(artifact.filename).exists(): manifest.hash_file(artifact.filename)
+        manifest.save()
+
+
+def push_repo(result: FleetRepoResult, remote: str = 'origin') -> FleetRepoResult:
+    start = time.perf_counter()
+    push = GitRunner(Repo(result.project_dir)).push(result.branch, remote = remote, check = False)
+    if push.ok: result.status = 'pushed'
+    else:
+        result.status = 'push-failed'
+        result.error = (push.stderr or push.stdout).strip().splitlines()[0] if (push.stderr or push.stdout).strip() else f'exit code {push.returncode}'
+    result.seconds += time.perf_counter() - start
+    return result
+
+
+def _sync_repo(config_file: str, sync_kwargs: Dict[str, Any]) -> FleetRepoResult:
+    return sync_repo(config_file, **sync_kwargs)
+
+
+def sync_fleet(config_files: List[Union[str, Path]], max_workers: int = None, push: bool = False, push_workers: int = 4, remote: str = 'origin', **sync_kwargs) -> List[FleetRepoResult]:
+    """
+    Syncs every repo on a process pool, then optionally pushes the committed
+    branches with at most `push_workers` pushes in flight.
+    Results are returned in the same order as `config_files`.
+    """
+    if not config_files: return []
+    logger.info(f'Syncing {len(config_files)} Repos with {get_worker_count(max_workers, len(config_files))} Workers')
+    results = map_config_files(
+        _sync_repo, config_files, args = (sync_kwargs,), max_workers = max_workers,
+        on_error = lambda f, e: FleetRepoResult(config_file = f, project_dir = to_path(f).parent.as_posix(), status = 'failed', error = f'{type(e).__name__}: {e}'),
+    )
+    committed = [r for r in results if r.status == 'committed']
+    if push and committed:
+        logger.info(f'Pushing {len(committed)} Branches with {push_workers} Workers')
+        with ThreadPoolExecutor(max_workers = max(1, min(push_workers, len(committed)))) as executor:
+            list(executor.map(lambda r: push_repo(r, remote = remote), committed))
+    return results
+
+
+def format_fleet_report(results: List[FleetRepoResult]) -> str:
+    headers = ['project', 'status', 'files', 'commit', 'seconds', 'error']
+    lines = format_table(headers, [[r.project_name, r.status, str(len(r.files)), (r.commit or '')[:8], f'{r.seconds:.2f}', r.error or ''] for r in results])
+    counts: Dict[str, int] = {}
+    for r in results: counts[r.status] = counts.get(r.status, 0) + 1
+    lines.append(f'{len(results)} repos: ' + ', '.join(f'{n} {s}' for s, n in sorted(counts.items())))
+    return '\n'.join(lines)
+
+
+__all__ = [
+    'FleetRepoResult',
+    'discover_repos',
+    'sync_repo',
+    'sync_fleet',
+    'format_fleet_report',
+]
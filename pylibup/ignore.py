@@ -0,0 +1,171 @@
+"""
+Compiled gitignore matcher (gitwildmatch semantics).
+
+Patterns are translated to regexes once:
+
+- `*` and `?` never match `/`, and `[...]` is a character class
+- a pattern without a `/` (other than a trailing one) matches at any depth
+- a leading `**/`, a trailing `/**` and a `/**/` in the middle match any
+  number of directories, any other `**` behaves like `*`
+- a trailing `/` only matches directories, and `!` re-includes a path
+
+A path is ignored when one of its parent dirs is ignored (git can't
+re-include a file inside an excluded dir), else when the last pattern
+matching it isn't a negation. Without negations every pattern is folded
+into two combined regexes (one for basenames, one for full paths), so
+each path costs at most two matches.
+"""
+import re
+import functools
+from typing import Iterable, List, NamedTuple, Optional, Union
+from pathlib import Path
+
+
+class IgnoreRule(NamedTuple):
+    pattern: str
+    regex: str
+    negate: bool
+    dir_only: bool
+    # unanchored rules contain no `/`, so they are matched against the basename
+    anchored: bool
+
+
+def translate_segment(segment: str) -> str:
+    """
+    Translates a single path segment (no `/`) to a regex
+    """
+    out, i, n = [], 0, len(segment)
+    while i < n:
+        c = segment[i]
+        if c == '*':
+            while i + 1 < n and segment[i + 1] == '*': i += 1
+            out.append('[^/]*')
+        elif c == '?': out.append('[^/]')
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(segment[i]))
+        elif c == '[':
+            j = i + 1
+            if j < n and segment[j] in '!^': j += 1
+            if j < n and segment[j] == ']': j += 1
+            while j < n and segment[j] != ']': j += 1
+            if j >= n: out.append(re.escape(c))
+            else:
+                body = segment[i + 1:j]
+                if body[:1] in {'!', '^'}: body = '^' + body[1:]
+                out.append('[' + body.replace('/', '') + ']')
+                i = j
+        else: out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
+
+
+def compile_rule(pattern: str) -> Optional[IgnoreRule]:
+    """
+    Translates a gitignore line to an IgnoreRule, or None for blanks and comments
+    """
+    line = pattern.rstrip('\n')
+    if not line.strip() or line.startswith('#'): return None
+    # Trailing spaces are ignored unless escaped
+    stripped = line.rstrip(' ')
+    if stripped.endswith('\\') and len(stripped) < len(line): stripped += ' '
+    line = stripped
+    negate = line.startswith('!')
+    if negate or line.startswith('\\!') or line.startswith('\\#'): line = line[1:]
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line: return None
+    anchored = '/' in line
+    segments = line.lstrip('/').split('/')
+    parts, last = [], len(segments) - 1
+    for i, segment in enumerate(segments):
+        if segment == '**':
+            if i == 0 and i == last: parts.append('.+')
+            elif i == 0: parts.append('(?:.+/)?')
+            elif i == last: parts.append('/.+')
+            else: parts.append('(?:/.+)?/')
+            continue
+        if i > 0 and segments[i - 1] != '**': parts.append('/')
+        parts.append(translate_segment(segment))
+    return IgnoreRule(pattern = pattern, regex = ''.join(parts), negate = negate, dir_only = dir_only, anchored = anchored)
+
+
+class GitIgnore:
+    def __init__(self, patterns: Iterable[str]):
+        self.rules: List[IgnoreRule] = [rule for rule in (compile_rule(p) for p in patterns) if rule]
+        self.has_negation = any(rule.negate for rule in self.rules)
+        if self.has_negation:
+            self.compiled = [(re.compile(rule.regex + r'\Z'), rule) for rule in reversed(self.rules)]
+        else:
+            file_rules = [rule for rule in self.rules if not rule.dir_only]
+            self.combined = {
+                True: (self.combine(self.rules, False), self.combine(self.rules, True)),
+                False: (self.combine(file_rules, False), self.combine(file_rules, True)),
+            }
+        self.dir_cache = {}
+
+    @staticmethod
+    def combine(rules: List[IgnoreRule], anchored: bool):
+        rules = [rule for rule in rules if rule.anchored == anchored]
+        if not rules: return None
+        return re.compile('(?:' + '|'.join(f'(?:{rule.regex})' for rule in rules) + r')\Z')
+
+    def match(self, path: str, is_dir: bool = False) -> bool:
+        """
+        Whether the patterns themselves exclude `path`, ignoring its parent dirs
+        """
+        name = path.rpartition('/')[2]
+        if not self.has_negation:
+            name_regex, path_regex = self.combined[is_dir]
+            return bool((name_regex and name_regex.match(name)) or (path_regex and path_regex.match(path)))
+        for regex, rule in self.compiled:
+            if rule.dir_only and not is_dir: continue
+            if regex.match(path if rule.anchored else name): return not rule.negate
+        return False
+
+    def is_dir_ignored(self, path: str) -> bool:
+        if path not in self.dir_cache:
+            parent = path.rpartition('/')[0]
+            self.dir_cache[path] = (bool(parent) and self.is_dir_ignored(parent)) or self.match(path, is_dir = True)
+        return self.dir_cache[path]
+
+    def is_ignored(self, path: Union[str, Path], is_dir: bool = False) -> bool:
+        """
+        Whether `path` (relative to the repo root) is ignored
+        """
+        path = Path(path).as_posix() if isinstance(path, Path) else path.replace('\\', '/')
+        path = path.lstrip('/')
+        while path.startswith('./'): path = path[2:]
+        if not path or not self.rules: return False
+        parent = path.rpartition('/')[0]
+        if parent and self.is_dir_ignored(parent): return True
+        return self.is_dir_ignored(path) if is_dir else self.match(path)
+
+    def filter(self, paths: Iterable[Union[str, Path]]) -> List[Union[str, Path]]:
+        """
+        Returns the paths that aren't ignored, in order
+        """
+        return [path for path in paths if not self.is_ignored(path)]
+
+    def __contains__(self, path: Union[str, Path]) -> bool:
+        return self.is_ignored(path)
+
+
+@functools.lru_cache(maxsize = 64)
+def _compile_gitignore(patterns: tuple) -> GitIgnore:
+    return GitIgnore(patterns)
+
+
+def compile_gitignore(patterns: Iterable[str]) -> GitIgnore:
+    """
+    Returns a compiled matcher, shared between calls with the same patterns
+    """
+    return _compile_gitignore(tuple(patterns or ()))
+
+
+__all__ = [
+    'IgnoreRule',
+    'compile_rule',
+    'GitIgnore',
+    'compile_gitignore',
+]
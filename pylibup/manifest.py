@@ -0,0 +1,85 @@
+"""
+Content-hash manifest used for incremental builds.
+
+Maps each generated file (relative to the project dir) to the hash of its
+content, along with the size and mtime it had when it was last hashed so
+unchanged files don't need to be re-read. Files above `mmap_threshold`
+are hashed through a read-only memory map instead of being read into memory.
+"""
+import mmap
+import hashlib
+from .types import *
+from .utils import to_path, Path
+from .serializers import Json, Base
+
+
+mmap_threshold: int = 256 * 1024
+
+
+def hash_path(path: Union[str, Path], method: str = 'sha256') -> str:
+    """
+    Hashes the file's bytes. The digest matches `Base.hash_encode` of its text
+    """
+    path = to_path(path)
+    encoder = hashlib.new(method)
+    size = path.stat().st_size
+    if size >= mmap_threshold:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as mapped: encoder.update(mapped)
+    elif size: encoder.update(path.read_bytes())
+    return encoder.hexdigest()
+
+
+class BuildManifest:
+    version: int = 1
+
+    def __init__(self, path: Union[str, Path], root: Union[str, Path]):
+        self.path = to_path(path)
+        self.root = to_path(root)
+        self.entries: Dict[str, Dict[str, Any]] = self.load()
+        self.changed = False
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        if not self.path.exists(): return {}
+        try: data = Json.loads(self.path.read_text())
+        except ValueError: return {}
+        if data.get('version') != self.version: return {}
+        return data.get('files', {})
+
+    def save(self):
+        if not self.changed: return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(Json.dumps({'version': self.version, 'files': self.entries}, indent = 2, sort_keys = True, fast = True))
+        self.changed = False
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        return Base.hash_encode(text)
+
+    def record(self, filename: str, digest: str):
+        fpath = self.root.joinpath(filename)
+        stat = fpath.stat()
+        self.entries[filename] = {'hash': digest, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        self.changed = True
+
+    def hash_file(self, filename: str) -> Optional[str]:
+        """
+        Returns the hash of the file on disk, or None if it doesn't exist.
+        Uses the recorded hash if the size and mtime still match.
+        """
+        fpath = self.root.joinpath(filename)
+        try: stat = fpath.stat()
+        except FileNotFoundError: return None
+        entry = self.entries.get(filename)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns: return entry['hash']
+        digest = hash_path(fpath)
+        self.record(filename, digest)
+        return digest
+
+    def is_unchanged(self, filename: str, content: str) -> bool:
+        return self.hash_file(filename) == self.hash_text(content)
+
+
+__all__ = [
+    'hash_path',
+    'BuildManifest',
+]
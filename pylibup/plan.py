@@ -0,0 +1,160 @@
+"""
+Dry-run plans: what a build would change in an existing project.
+
+Every artifact is rendered in memory and compared to the working tree
+without writing files or touching the git index. Comparisons are ordered
+cheapest first:
+
+1. files that aren't committed (gitignored, like build.sh) are `skipped`,
+   since a fresh checkout never has them
+2. a missing file is `created`, and existing unmanaged files are `skipped`
+   (builds never rewrite them)
+3. a size that differs from the rendered content means `modified`
+4. the build manifest's hash is reused when the size and mtime still match
+5. otherwise the file is hashed, through mmap for large files
+
+Unified diffs are only computed for the files that changed.
+"""
+import time
+import difflib
+
+from .types import *
+from .utils import get_logger, to_path, Path
+from .serializers import Base
+from .manifest import BuildManifest, hash_path
+from .classes import PylibConfig
+from .batch import map_config_files, format_table
+
+
+logger = get_logger()
+
+plan_statuses = ('created', 'modified', 'unchanged', 'skipped')
+
+
+class PlannedFile(BaseModel):
+    filename: str
+    status: str
+    managed: bool = True
+    diff: Optional[str] = None
+
+
+class RepoPlan(BaseModel):
+    config_file: str
+    project_dir: str
+    files: List[PlannedFile] = []
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        counts = {status: 0 for status in plan_statuses}
+        for f in self.files: counts[f.status] += 1
+        return counts
+
+    @property
+    def changed(self) -> List[PlannedFile]:
+        return [f for f in self.files if f.status in {'created', 'modified'}]
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.changed)
+
+    @property
+    def project_name(self) -> str:
+        return to_path(self.project_dir).name
+
+    def format(self, show_diff: bool = True) -> str:
+        lines = [f'{self.project_name}: ' + ', '.join(f'{n} {s}' for s, n in self.counts.items()) + f' ({self.seconds * 1000:.1f}ms)']
+        if self.error: lines.append(f'  error: {self.error}')
+        lines.extend(f'  {f.status:<10} {f.filename}' for f in self.changed)
+        if show_diff: lines.extend(f.diff.rstrip('\n') for f in self.changed if f.diff)
+        return '\n'.join(lines)
+
+
+def get_diff(filename: str, old: Optional[str], new: str) -> str:
+    old_lines = old.splitlines(keepends = True) if old else []
+    return ''.join(difflib.unified_diff(old_lines, new.splitlines(keepends = True), fromfile = f'a/{filename}' if old is not None else '/dev/null', tofile = f'b/{filename}'))
+
+
+def is_committed_artifact(config: Any, artifact: Any) -> bool:
+    return artifact.add_to_commit and config.should_add_to_commit(artifact.filename)
+
+
+def plan_artifact(root: Path, artifact: Any, manifest: BuildManifest = None, diff: bool = True) -> PlannedFile:
+    fpath = root.joinpath(artifact.filename)
+    planned = PlannedFile(filename = artifact.filename, status = 'unchanged', managed = artifact.managed)
+    try: stat = fpath.stat()
+    except FileNotFoundError:
+        planned.status = 'created'
+        if diff: planned.diff = get_diff(artifact.filename, None, artifact.content)
+        return planned
+    if not artifact.managed:
+        planned.status = 'skipped'
+        return planned
+    content = artifact.content.encode(Base.encoding)
+    if stat.st_size != len(content): planned.status = 'modified'
+    else:
+        entry = manifest.entries.get(artifact.filename) if manifest else None
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns: digest = entry['hash']
+        else: digest = hash_path(fpath)
+        if digest != Base.hash_encode(artifact.content): planned.status = 'modified'
+    if diff and planned.status == 'modified': planned.diff = get_diff(artifact.filename, fpath.read_text(errors = 'replace'), artifact.content)
+    return planned
+
+
+def plan_project(config_file: Union[str, Path], project_dir: Union[str, Path] = None, diff: bool = True) -> RepoPlan:
+    """
+    Renders the project's artifacts in memory and compares them to `project_dir`
+    (defaults to the metadata file's dir). Nothing on disk is modified.
+    """
+    config_file = to_path(config_file)
+    root = to_path(project_dir) if project_dir else config_file.parent
+    plan = RepoPlan(config_file = config_file.as_posix(), project_dir = root.as_posix())
+    start = time.perf_counter()
+    try:
+        config = PylibConfig.load_config(config_file)
+        manifest_path = root.joinpath('.git', 'pylibup', 'manifest.json')
+        manifest = BuildManifest(manifest_path, root) if manifest_path.exists() else None
+        plan.files = [
+            plan_artifact(root, artifact, manifest = manifest, diff = diff) if is_committed_artifact(config, artifact)
+            else PlannedFile(filename = artifact.filename, status = 'skipped', managed = artifact.managed)
+            for artifact in config.get_artifacts()
+        ]
+    except Exception as e:
+        plan.error = f'{type(e).__name__}: {e}'.splitlines()[0]
+    plan.seconds = time.perf_counter() - start
+    return plan
+
+
+def _plan_project(config_file: str, diff: bool) -> RepoPlan:
+    return plan_project(config_file, diff = diff)
+
+
+def plan_many(config_files: List[Union[str, Path]], diff: bool = True, max_workers: int = None) -> List[RepoPlan]:
+    """
+    Plans every project, on a process pool when there is more than one.
+    Results are returned in the same order as `config_files`.
+    """
+    return map_config_files(
+        _plan_project, config_files, args = (diff,), max_workers = max_workers,
+        on_error = lambda f, e: RepoPlan(config_file = f, project_dir = to_path(f).parent.as_posix(), error = f'{type(e).__name__}: {e}'),
+    )
+
+
+def format_plan_summary(plans: List[RepoPlan]) -> str:
+    headers = ['project'] + list(plan_statuses) + ['ms', 'error']
+    lines = format_table(headers, [[p.project_name] + [str(p.counts[s]) for s in plan_statuses] + [f'{p.seconds * 1000:.1f}', p.error or ''] for p in plans])
+    drifted = sum(p.has_changes for p in plans)
+    lines.append(f'{len(plans)} projects, {drifted} with changes, {sum(bool(p.error) for p in plans)} failed')
+    return '\n'.join(lines)
+
+
+__all__ = [
+    'PlannedFile',
+    'RepoPlan',
+    'is_committed_artifact',
+    'plan_artifact',
+    'plan_project',
+    'plan_many',
+    'format_plan_summary',
+]
@@ -0,0 +1,92 @@
+"""
+Diff-only, concurrent provisioning of GitHub Actions repository secrets.
+
+The repo public key is fetched once, every value is sealed locally and the
+uploads run on a bounded thread pool. A hash of each pushed value (scoped
+to the public key) is kept in the project state, so unchanged secrets are
+skipped on later runs.
+"""
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from nacl import encoding, public
+
+from .types import *
+from .utils import get_logger
+from .serializers import Base
+from .api import GithubAPI
+from .state import ProjectState
+
+
+logger = get_logger()
+
+
+def seal_secret(public_key: str, value: str) -> str:
+    sealed_box = public.SealedBox(public.PublicKey(public_key.encode('utf-8'), encoding.Base64Encoder()))
+    return base64.b64encode(sealed_box.encrypt(value.encode('utf-8'))).decode('utf-8')
+
+
+class SecretProvisioner:
+    state_key: str = 'pushed_secrets'
+
+    def __init__(self, api: GithubAPI, repo_path: str, state: ProjectState = None, max_workers: int = 8):
+        self.api = api
+        self.repo_path = repo_path
+        self.state = state
+        self.max_workers = max_workers
+
+    def get_public_key(self) -> Dict[str, str]:
+        resp = self.api.get(f'/repos/{self.repo_path}/actions/secrets/public-key')
+        if not resp.ok: raise ValueError(f'Unable to fetch the secrets public key for {self.repo_path}: {resp.status_code} {resp.data}')
+        return resp.data
+
+    def get_pushed_hashes(self) -> Dict[str, str]:
+        if self.state is None: return {}
+        return dict(self.state.get(self.state_key, {}).get(self.repo_path, {}))
+
+    def save_pushed_hashes(self, hashes: Dict[str, str]):
+        if self.state is None: return
+        def merge(data: Dict[str, Any]) -> Dict[str, Any]:
+            data.setdefault(self.state_key, {})[self.repo_path] = hashes
+            return data
+        self.state.update(merge)
+
+    @staticmethod
+    def get_secret_hash(key_id: str, name: str, value: str) -> str:
+        return Base.hash_encode(f'{key_id}:{name}:{value}')
+
+    def put_secret(self, name: str, encrypted_value: str, key_id: str) -> str:
+        resp = self.api.put(f'/repos/{self.repo_path}/actions/secrets/{name}', json = {'encrypted_value': encrypted_value, 'key_id': key_id})
+        if resp.status_code == 201: return 'created'
+        if resp.status_code == 204: return 'updated'
+        raise ValueError(f'{resp.status_code} {resp.data}')
+
+    def provision(self, secrets: Dict[str, str], force: bool = False) -> Dict[str, str]:
+        """
+        Uploads every secret whose value changed since the last push.
+        Returns the status of each secret: created, updated, unchanged or failed
+        """
+        secrets = {k: str(v) for k, v in secrets.items() if v is not None}
+        if not secrets: return {}
+        key = self.get_public_key()
+        pushed = self.get_pushed_hashes()
+        hashes = {name: self.get_secret_hash(key['key_id'], name, value) for name, value in secrets.items()}
+        results = {name: 'unchanged' for name in secrets if not force and pushed.get(name) == hashes[name]}
+        sealed = {name: seal_secret(key['key'], value) for name, value in secrets.items() if name not in results}
+        if sealed:
+            with ThreadPoolExecutor(max_workers = max(1, min(self.max_workers, len(sealed)))) as executor:
+                futures = {name: executor.submit(self.put_secret, name, value, key['key_id']) for name, value in sealed.items()}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                    pushed[name] = hashes[name]
+                except Exception as e:
+                    logger.error(f'Failed to create Secret: {name}: {e}')
+                    results[name] = 'failed'
+            self.save_pushed_hashes(pushed)
+        return {name: results[name] for name in secrets}
+
+
+__all__ = [
+    'seal_secret',
+    'SecretProvisioner',
+]
@@ -0,0 +1,208 @@
+"""
+Command runner used instead of os.system shell-outs.
+
+Local git operations run in-process through GitPython's Repo, everything
+else runs as an argv based subprocess. Both return a CommandResult with
+the exit code, captured output and timing, and failures raise CommandError
+when `check` is set.
+"""
+import sys
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from git import Repo, GitCommandError
+
+from .types import *
+from .utils import get_logger, to_path, Path
+from .trace import span
+
+
+logger = get_logger()
+
+
+class CommandError(Exception):
+    def __init__(self, result: 'CommandResult'):
+        self.result = result
+        super().__init__(f'Command failed ({result.returncode}): {result.cmd}\n{result.stderr or result.stdout}'.strip())
+
+
+class CommandResult(BaseModel):
+    args: List[str]
+    returncode: int = 0
+    stdout: str = ''
+    stderr: str = ''
+    seconds: float = 0.0
+    timed_out: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+    @property
+    def cmd(self) -> str:
+        return ' '.join(self.args)
+
+    def check(self) -> 'CommandResult':
+        if not self.ok: raise CommandError(self)
+        return self
+
+
+class CommandRunner:
+    def __init__(self, cwd: Union[str, Path] = None, timeout: float = 600.0, env: Dict[str, str] = None):
+        self.cwd = to_path(cwd) if cwd else None
+        self.timeout = timeout
+        self.env = env
+        self.history: List[CommandResult] = []
+
+    def record(self, result: CommandResult, check: bool = False) -> CommandResult:
+        self.history.append(result)
+        logger.debug(f'[{result.returncode}] {result.cmd} ({result.seconds:.2f}s)')
+        if check: result.check()
+        return result
+
+    def run(self, args: List[str], cwd: Union[str, Path] = None, timeout: float = None, env: Dict[str, str] = None, check: bool = False) -> CommandResult:
+        cwd = cwd or self.cwd
+        start = time.perf_counter()
+        with span(' '.join(args[:3]), 'subprocess') as s:
+            try:
+                proc = subprocess.run(args, cwd = cwd, env = env or self.env, capture_output = True, text = True, timeout = timeout or self.timeout)
+                result = CommandResult(args = args, returncode = proc.returncode, stdout = proc.stdout, stderr = proc.stderr)
+            except subprocess.TimeoutExpired as e:
+                result = CommandResult(args = args, returncode = -1, stdout = e.stdout or '', stderr = e.stderr or '', timed_out = True)
+            except OSError as e:
+                result = CommandResult(args = args, returncode = 127, stderr = str(e))
+            s.set(returncode = result.returncode)
+        result.seconds = time.perf_counter() - start
+        return self.record(result, check = check)
+
+    def run_many(self, commands: List[List[str]], max_workers: int = 4, check: bool = False, **kwargs) -> List[CommandResult]:
+        """
+        Runs independent commands concurrently. Results are in the same order as `commands`
+        """
+        with ThreadPoolExecutor(max_workers = max(1, min(max_workers, len(commands) or 1))) as executor:
+            results = list(executor.map(lambda args: self.run(args, **kwargs), commands))
+        if check:
+            for result in results: result.check()
+        return results
+
+    def pip_install(self, *args: str, **kwargs) -> CommandResult:
+        return self.run([sys.executable, '-m', 'pip', 'install', *args], **kwargs)
+
+    @property
+    def seconds(self) -> float:
+        return sum(r.seconds for r in self.history)
+
+
+class GitRunner(CommandRunner):
+    """
+    Runs git operations in-process through GitPython
+    """
+    def __init__(self, repo: Repo, timeout: float = 600.0):
+        super().__init__(cwd = repo.working_tree_dir, timeout = timeout)
+        self.repo = repo
+
+    def call(self, args: List[str], func: Callable[[], Any], check: bool = True) -> CommandResult:
+        start = time.perf_counter()
+        result = CommandResult(args = ['git', *args])
+        with span(f'git {args[0]}', 'git') as s:
+            try:
+                out = func()
+                if isinstance(out, str): result.stdout = out
+            except GitCommandError as e:
+                result.returncode = e.status if isinstance(e.status, int) else 1
+                result.stdout, result.stderr = str(e.stdout or ''), str(e.stderr or '')
+            except (ValueError, OSError) as e:
+                result.returncode = 1
+                result.stderr = str(e)
+            s.set(returncode = result.returncode)
+        result.seconds = time.perf_counter() - start
+        return self.record(result, check = check)
+
+    @property
+    def has_head(self) -> bool:
+        return self.repo.head.is_valid()
+
+    @property
+    def has_staged_changes(self) -> bool:
+        if not self.has_head: return bool(len(self.repo.index.entries))
+        return bool(self.repo.index.diff('HEAD'))
+
+    def _add_all(self):
+        changed = self.repo.index.diff(None)
+        to_add = self.repo.untracked_files + [d.a_path for d in changed if not d.deleted_file]
+        to_remove = [d.a_path for d in changed if d.deleted_file]
+        if to_add: self.repo.index.add(to_add)
+        if to_remove: self.repo.index.remove(to_remove)
+        return f'{len(to_add)} added, {len(to_remove)} removed'
+
+    def add_all(self, check: bool = True) -> CommandResult:
+        return self.call(['add', '-A'], self._add_all, check = check)
+
+    def _add(self, paths: List[str]):
+        self.repo.index.add(paths)
+
+    def add(self, paths: List[str], check: bool = True) -> CommandResult:
+        return self.call(['add', *paths], lambda: self._add(paths), check = check)
+
+    def _commit(self, message: str):
+        if not self.has_staged_changes: raise ValueError('nothing to commit, working tree clean')
+        return self.repo.index.commit(message).hexsha
+
+    def commit(self, message: str, check: bool = True) -> CommandResult:
+        return self.call(['commit', '-m', message], lambda: self._commit(message), check = check)
+
+    @property
+    def current_branch(self) -> Optional[str]:
+        """
+        The checked out branch, or None on a detached HEAD
+        """
+        if self.repo.head.is_detached: return None
+        return self.repo.active_branch.name
+
+    @property
+    def is_dirty(self) -> bool:
+        return self.repo.is_dirty(untracked_files = False)
+
+    def _checkout(self, name: str, create: bool):
+        if name in self.repo.heads: head = self.repo.heads[name]
+        elif create: head = self.repo.create_head(name)
+        else: raise ValueError(f'Branch {name} does not exist')
+        head.checkout()
+
+    def checkout(self, name: str, create: bool = False, check: bool = True) -> CommandResult:
+        return self.call(['checkout', name], lambda: self._checkout(name, create), check = check)
+
+    def delete_branch(self, name: str, check: bool = True) -> CommandResult:
+        return self.call(['branch', '-D', name], lambda: self.repo.delete_head(name, force = True), check = check)
+
+    def _set_remote(self, name: str, url: str):
+        if name in [r.name for r in self.repo.remotes]: self.repo.remote(name).set_url(url)
+        else: self.repo.create_remote(name, url)
+
+    def set_remote(self, url: str, name: str = 'origin', check: bool = True) -> CommandResult:
+        return self.call(['remote', 'add', name, url], lambda: self._set_remote(name, url), check = check)
+
+    def _rename_branch(self, name: str):
+        if self.has_head: self.repo.active_branch.rename(name, force = True)
+        else: self.repo.head.set_reference(f'refs/heads/{name}')
+
+    def rename_branch(self, name: str, check: bool = True) -> CommandResult:
+        return self.call(['branch', '-M', name], lambda: self._rename_branch(name), check = check)
+
+    def _push(self, branch: str, remote: str, set_upstream: bool, timeout: float):
+        infos = self.repo.remote(remote).push(refspec = f'{branch}:{branch}', set_upstream = set_upstream, kill_after_timeout = timeout)
+        errors = [info.summary.strip() for info in infos if info.flags & info.ERROR]
+        if errors or not infos: raise ValueError(f'Push to {remote}/{branch} failed: {", ".join(errors) or "no refs pushed"}')
+        return '\n'.join(info.summary.strip() for info in infos)
+
+    def push(self, branch: str, remote: str = 'origin', set_upstream: bool = True, timeout: float = None, check: bool = True) -> CommandResult:
+        args = ['push', '-u', remote, branch] if set_upstream else ['push', remote, branch]
+        return self.call(args, lambda: self._push(branch, remote, set_upstream, timeout or self.timeout), check = check)
+
+
+__all__ = [
+    'CommandError',
+    'CommandResult',
+    'CommandRunner',
+    'GitRunner',
+]
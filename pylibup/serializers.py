@@ -1,49 +1,145 @@
 
+"""
+Serializers with pluggable backends.
+
+- Json.loads uses orjson when it's installed, except for documents with
+  integers orjson can't represent exactly (it turns them into floats) or
+  that it rejects (NaN, Infinity), which go through the stdlib json.
+- Json.dumps output differs between the two (separators, non-ASCII
+  escaping, NaN), so orjson is only used by call sites that opt in with
+  `fast = True` and only ask for options it supports (indent=2,
+  sort_keys, default). Everything else matches json.dumps exactly.
+- Yaml uses the libyaml backed CSafeLoader/CSafeDumper when PyYAML was
+  built with libyaml, else the pure-Python SafeLoader/SafeDumper. Values
+  the safe dumper can't represent (paths, tuples, sets, enums, models)
+  are converted to plain types first, so dumped output always loads back.
+- Pkl uses the stdlib pickle (C accelerated) with a configurable protocol.
+
+Backends can be switched with `set_backend`, e.g. `Json.set_backend('json')`.
+"""
 import yaml
 import pickle
 import base64
 import gzip
 import hashlib
 import json
+import enum
+from pathlib import PurePath
 from typing import Any, Union
 from uuid import uuid4
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class Json:
+    backends = ['orjson', 'json']
+    backend: str = 'orjson' if orjson is not None else 'json'
+    # A run of 19+ digits may be an integer outside the 64 bit range orjson parses exactly.
+    # Mapping digits to '0' and everything else to ' ' makes the check a substring search
+    digits_table = bytes(48 if 48 <= i <= 57 else 32 for i in range(256))
+    long_number = b'0' * 19
+
     @classmethod
-    def dumps(cls, obj, *args, **kwargs):
+    def set_backend(cls, backend: str):
+        if backend not in cls.backends: raise ValueError(f'Unknown Json backend: {backend}. Choose from {cls.backends}')
+        if backend == 'orjson' and orjson is None: raise ValueError('orjson is not installed')
+        cls.backend = backend
+
+    @classmethod
+    def get_orjson_option(cls, indent: int = None, sort_keys: bool = False, **kwargs) -> int:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent: option |= orjson.OPT_INDENT_2
+        if sort_keys: option |= orjson.OPT_SORT_KEYS
+        return option
+
+    @classmethod
+    def use_orjson(cls, args: tuple, kwargs: dict, supported: set) -> bool:
+        if cls.backend != 'orjson' or args or not set(kwargs).issubset(supported): return False
+        return kwargs.get('indent') in {None, 0, 2}
+
+    @classmethod
+    def dumps(cls, obj, *args, fast: bool = False, **kwargs):
+        if fast and cls.use_orjson(args, kwargs, {'indent', 'sort_keys', 'default'}):
+            # orjson rejects some inputs json accepts (e.g. ints over 64 bits), those fall through
+            try: return orjson.dumps(obj, default = kwargs.get('default'), option = cls.get_orjson_option(**kwargs)).decode()
+            except TypeError: pass
         return json.dumps(obj, *args, **kwargs)
 
+    @classmethod
+    def has_long_number(cls, obj) -> bool:
+        if isinstance(obj, str): obj = obj.encode(errors = 'surrogatepass')
+        return cls.long_number in bytes(obj).translate(cls.digits_table)
+
     @classmethod
     def loads(cls, obj, *args, **kwargs):
+        if cls.use_orjson(args, kwargs, set()) and not cls.has_long_number(obj):
+            try: return orjson.loads(obj)
+            except orjson.JSONDecodeError: pass
         return json.loads(obj, *args, **kwargs)
 
     @classmethod
     def decode(cls, obj, *args, **kwargs):
         if isinstance(obj, dict): return obj
-        if isinstance(obj, Any): return obj.dict()
+        if hasattr(obj, 'dict'): return obj.dict()
         if isinstance(obj, (str, bytes)): return Json.loads(obj)
         raise ValueError
 
 
 class Yaml:
+    backends = ['c', 'python']
+    backend: str = 'c' if getattr(yaml, '__with_libyaml__', False) else 'python'
+
+    @classmethod
+    def set_backend(cls, backend: str):
+        if backend not in cls.backends: raise ValueError(f'Unknown Yaml backend: {backend}. Choose from {cls.backends}')
+        if backend == 'c' and not getattr(yaml, '__with_libyaml__', False): raise ValueError('PyYAML was built without libyaml')
+        cls.backend = backend
+
+    @classmethod
+    def get_loader(cls):
+        return yaml.CSafeLoader if cls.backend == 'c' else yaml.SafeLoader
+
+    @classmethod
+    def get_dumper(cls):
+        return yaml.CSafeDumper if cls.backend == 'c' else yaml.SafeDumper
+
     @classmethod
     def dumps(cls, obj, *args, **kwargs):
-        return yaml.dump(obj, *args, **kwargs)
+        if 'Dumper' in kwargs: return yaml.dump(obj, *args, **kwargs)
+        try: return yaml.dump(obj, *args, Dumper = cls.get_dumper(), **kwargs)
+        except yaml.representer.RepresenterError:
+            # Anything still not representable raises, rather than writing tags loads() rejects
+            return yaml.dump(cls.to_plain(obj), *args, Dumper = cls.get_dumper(), **kwargs)
+
+    @classmethod
+    def to_plain(cls, obj):
+        if isinstance(obj, dict): return {cls.to_plain(k): cls.to_plain(v) for k, v in obj.items()}
+        if isinstance(obj, (list, tuple, set, frozenset)): return [cls.to_plain(v) for v in obj]
+        if isinstance(obj, PurePath): return obj.as_posix()
+        if isinstance(obj, enum.Enum): return cls.to_plain(obj.value)
+        if hasattr(obj, 'dict') and callable(obj.dict): return cls.to_plain(obj.dict())
+        return obj
 
     @classmethod
     def loads(cls, obj, *args, **kwargs):
-        return yaml.load(obj, Loader=yaml.Loader, *args, **kwargs)
+        kwargs.setdefault('Loader', cls.get_loader())
+        return yaml.load(obj, *args, **kwargs)
 
 
 class Pkl:
+    protocol: int = pickle.HIGHEST_PROTOCOL
+
     @classmethod
     def dumps(cls, obj, *args, **kwargs):
-        return pickle.dumps(obj=obj, protocol=pickle.HIGHEST_PROTOCOL, *args, **kwargs)
+        kwargs.setdefault('protocol', cls.protocol)
+        return pickle.dumps(obj, *args, **kwargs)
 
     @classmethod
     def loads(cls, obj, *args, **kwargs):
-        return pickle.loads(str=obj, *args, **kwargs)
+        return pickle.loads(obj, *args, **kwargs)
 
 class Base:
     encoding: str = "UTF-8"
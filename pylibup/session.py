@@ -0,0 +1,204 @@
+"""
+Pooled, retrying and rate-limit-aware HTTP session for the GitHub REST API.
+
+All GitHub traffic from pylibup goes through a single keep-alive
+requests.Session. Requests are paced by a token bucket whose rate is
+adjusted from the X-RateLimit-* headers. Rate limited (429/403 +
+Retry-After or an exhausted quota) and transient 5xx responses are
+retried with jittered exponential backoff.
+"""
+import time
+import random
+import email.utils
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+from .types import *
+from .utils import get_logger
+from .config import GitConfig
+
+
+logger = get_logger()
+
+retry_statuses = {500, 502, 503, 504}
+idempotent_methods = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parses a Retry-After header, in seconds or as an HTTP-date. Returns None when it doesn't parse
+    """
+    if not value: return None
+    try: return max(0.0, float(value))
+    except ValueError: pass
+    try: return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError): return None
+
+
+class SessionStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.retries = 0
+        self.errors = 0
+        self.throttled_seconds = 0.0
+
+    def incr(self, name: str, value: Union[int, float] = 1):
+        with self.lock: setattr(self, name, getattr(self, name) + value)
+
+    def dict(self) -> Dict[str, Union[int, float]]:
+        return {'calls': self.calls, 'retries': self.retries, 'errors': self.errors, 'throttled_seconds': round(self.throttled_seconds, 3)}
+
+    def __repr__(self):
+        return f'<SessionStats {self.dict()}>'
+
+
+class RateLimiter:
+    """
+    Token bucket. Runs at `rate` tokens/sec with `burst` capacity until
+    less than `pace_ratio` of the quota is left, then spreads what remains
+    over the time left until GitHub resets it.
+    """
+    def __init__(self, rate: float = 10.0, burst: int = 10, reserve: int = 5, pace_ratio: float = 0.2):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.reserve = reserve
+        self.pace_ratio = pace_ratio
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self) -> float:
+        """
+        Blocks until a token is available, returns the seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.refill(now)
+                delay = max(0.0, self.blocked_until - now)
+                if not delay:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def block_for(self, seconds: float):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def update(self, headers: Dict[str, str]):
+        remaining, reset = headers.get('X-RateLimit-Remaining'), headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None: return
+        remaining, seconds_left = int(remaining), max(1.0, float(reset) - time.time())
+        if remaining <= self.reserve:
+            logger.warning(f'GitHub rate limit almost exhausted ({remaining} left). Pausing for {seconds_left:.0f}s')
+            self.block_for(seconds_left)
+            return
+        limit = int(headers.get('X-RateLimit-Limit') or 0)
+        with self.lock:
+            if limit and remaining > limit * self.pace_ratio: self.rate = self.max_rate
+            else: self.rate = max(0.01, min(self.max_rate, (remaining - self.reserve) / seconds_left))
+
+
+class GithubSession:
+    def __init__(self, max_retries: int = None, backoff_factor: float = 0.5, backoff_max: float = 60.0, max_wait: float = 900.0, pool_size: int = None, timeout: float = 30.0, rate: float = None):
+        self.max_retries = GitConfig.api_max_retries if max_retries is None else max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate = rate or GitConfig.api_rate_limit)
+        self.stats = SessionStats()
+        pool_size = pool_size or GitConfig.api_pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size, max_retries = 0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get_backoff(self, attempt: int) -> float:
+        # "Full jitter" so concurrent workers don't retry in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_factor * (2 ** attempt)))
+
+    def get_retry_delay(self, method: str, resp: requests.Response, attempt: int) -> Optional[float]:
+        """
+        Returns how long to wait before retrying, or None if the response should be returned as is
+        """
+        if resp.status_code in {403, 429}:
+            retry_after = parse_retry_after(resp.headers.get('Retry-After'))
+            if retry_after is not None: return retry_after
+            if resp.headers.get('X-RateLimit-Remaining') == '0' and resp.headers.get('X-RateLimit-Reset'):
+                return max(1.0, float(resp.headers['X-RateLimit-Reset']) - time.time())
+            # Secondary rate limits ask for at least a minute between retries
+            if 'secondary rate limit' in resp.text.lower(): return max(60.0, self.get_backoff(attempt))
+            if resp.status_code == 429: return self.get_backoff(attempt)
+            return None
+        if resp.status_code in retry_statuses and method in idempotent_methods: return self.get_backoff(attempt)
+        return None
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        method = method.upper()
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            self.stats.incr('throttled_seconds', self.limiter.acquire())
+            self.stats.incr('calls')
+            try:
+                resp = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.stats.incr('errors')
+                if attempt >= self.max_retries or (method not in idempotent_methods and not isinstance(e, requests.ConnectTimeout)): raise
+                delay = self.get_backoff(attempt)
+                logger.warning(f'{method} {url} failed ({type(e).__name__}). Retrying in {delay:.1f}s')
+            else:
+                self.limiter.update(resp.headers)
+                delay = self.get_retry_delay(method, resp, attempt)
+                if delay is None or attempt >= self.max_retries: return resp
+                if delay > self.max_wait:
+                    logger.error(f'{method} {url} is rate limited for {delay:.0f}s, which exceeds the max wait of {self.max_wait:.0f}s')
+                    return resp
+                logger.warning(f'{method} {url} returned {resp.status_code}. Retrying in {delay:.1f}s')
+                # Rate limits apply to every request, so pause the whole session
+                if resp.status_code in {403, 429}: self.limiter.block_for(delay)
+            attempt += 1
+            self.stats.incr('retries')
+            self.stats.incr('throttled_seconds', delay)
+            time.sleep(delay)
+
+    def close(self):
+        self.session.close()
+
+
+_session: GithubSession = None
+_session_lock = threading.Lock()
+
+def get_session() -> GithubSession:
+    """
+    Returns the process-wide GithubSession
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None: _session = GithubSession()
+    return _session
+
+
+__all__ = [
+    'SessionStats',
+    'RateLimiter',
+    'GithubSession',
+    'get_session',
+]
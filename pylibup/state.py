@@ -0,0 +1,223 @@
+"""
+Crash-safe state stores for the local (.pylibstate.yaml) and global state.
+
+- Writes go to a temp file in the same dir and are moved into place with
+  os.replace, so a reader never sees a truncated file.
+- Read-modify-write updates hold an advisory lock (fcntl.flock on a
+  per-path lock file in the temp dir), so concurrent pylibup processes
+  don't lose updates.
+- Reads are cached in-process and revalidated by mtime and size.
+- The global state can optionally live in SQLite (PYLIB_STATE_BACKEND=sqlite).
+  A new state.db starts with the contents of the existing state.yaml.
+
+This module only depends on the stdlib, yaml and logz so the state commands stay fast.
+"""
+import os
+import copy
+import json
+import hashlib
+import sqlite3
+import tempfile
+import contextlib
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from .utils import to_path, get_parent_path, Path
+from .serializers import Yaml
+
+try:
+    import fcntl
+except ImportError: # pragma: no cover - windows
+    fcntl = None
+
+
+globalstate_dir: Path = to_path(os.getenv('PYLIB_STATE_DIR', get_parent_path(__file__).joinpath('cli', '.pylibstate').as_posix()))
+state_backend: str = os.getenv('PYLIB_STATE_BACKEND', 'yaml').lower()
+
+_StateCache: Dict[str, Tuple[int, int, Dict[str, Any]]] = {}
+
+
+@contextlib.contextmanager
+def file_lock(path: Union[str, Path]):
+    """
+    Holds an exclusive advisory lock for `path` for the duration of the block.
+    Lock files live in the temp dir so they never end up in a project's tree.
+    """
+    lock_dir = to_path(tempfile.gettempdir()).joinpath(f'pylibup-locks-{getattr(os, "getuid", lambda: 0)()}')
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    lock_path = lock_dir.joinpath(hashlib.sha1(to_path(path).resolve().as_posix().encode()).hexdigest() + '.lock')
+    with open(lock_path, 'a') as f:
+        # No advisory locks without fcntl, the atomic replace still prevents torn writes
+        if fcntl is not None: fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try: yield
+        finally:
+            if fcntl is not None: fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write_text(path: Union[str, Path], text: str):
+    path = to_path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir = path.parent.as_posix(), prefix = f'.{path.name}.', suffix = '.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path.as_posix())
+    except BaseException:
+        with contextlib.suppress(OSError): os.unlink(tmp_path)
+        raise
+
+
+class StateFile:
+    """
+    YAML state file with cached reads and locked, atomic updates
+    """
+    def __init__(self, path: Union[str, Path]):
+        self.path = to_path(path)
+
+    @property
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def read(self) -> Dict[str, Any]:
+        if not self.path.exists(): return {}
+        return Yaml.loads(self.path.read_text()) or {}
+
+    def load(self) -> Dict[str, Any]:
+        """
+        Returns a copy of the state, only re-parsing the file when it changed
+        """
+        key = self.path.as_posix()
+        try: stat = self.path.stat()
+        except FileNotFoundError:
+            _StateCache.pop(key, None)
+            return {}
+        cached = _StateCache.get(key)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size: return copy.deepcopy(cached[2])
+        data = self.read()
+        _StateCache[key] = (stat.st_mtime_ns, stat.st_size, data)
+        return copy.deepcopy(data)
+
+    def write(self, data: Dict[str, Any]):
+        atomic_write_text(self.path, Yaml.dumps(data))
+        _StateCache.pop(self.path.as_posix(), None)
+
+    def update(self, func: Callable[[Dict[str, Any]], Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        """
+        Applies `func` (or merges `kwargs`) to the current state under the
+        lock and writes the result atomically
+        """
+        with file_lock(self.path):
+            data = self.read()
+            data = func(data) if func else dict(data, **kwargs)
+            self.write(data)
+        return data
+
+
+class SqliteStateStore:
+    """
+    Key/value state in SQLite, for the global state when many processes write to it.
+    A new database is seeded from `seed` (the YAML state it replaces)
+    """
+    def __init__(self, path: Union[str, Path], timeout: float = 30.0, seed: StateFile = None):
+        self.path = to_path(path)
+        self.timeout = timeout
+        self.seed = seed
+
+    @property
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        new = not self.path.exists()
+        conn = sqlite3.connect(self.path.as_posix(), timeout = self.timeout, isolation_level = None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        if new and self.seed is not None and self.seed.exists: self.import_seed(conn)
+        return conn
+
+    def import_seed(self, conn: sqlite3.Connection):
+        data = self.seed.read()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have created and seeded the database first
+            if data and not conn.execute('SELECT 1 FROM state LIMIT 1').fetchone():
+                conn.executemany('INSERT INTO state (key, value) VALUES (?, ?)', [(k, json.dumps(v)) for k, v in data.items()])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    @property
+    def cache_key(self) -> Tuple[int, int]:
+        # Writes land in the WAL first, so both files decide whether the cache is stale
+        stats = [p.stat() for p in [self.path, self.path.with_name(self.path.name + '-wal')] if p.exists()]
+        return (max(s.st_mtime_ns for s in stats), sum(s.st_size for s in stats)) if stats else (0, 0)
+
+    def read(self, conn: sqlite3.Connection = None) -> Dict[str, Any]:
+        if conn is None:
+            if not self.path.exists() and not (self.seed is not None and self.seed.exists): return {}
+            with contextlib.closing(self.connect()) as conn: return self.read(conn)
+        return {k: json.loads(v) for k, v in conn.execute('SELECT key, value FROM state')}
+
+    def load(self) -> Dict[str, Any]:
+        key = self.path.as_posix()
+        mtime, size = self.cache_key
+        cached = _StateCache.get(key)
+        if cached and cached[0] == mtime and cached[1] == size: return copy.deepcopy(cached[2])
+        data = self.read()
+        _StateCache[key] = (mtime, size, data)
+        return copy.deepcopy(data)
+
+    def write(self, data: Dict[str, Any]):
+        self.update(lambda _: data)
+
+    def update(self, func: Callable[[Dict[str, Any]], Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        with contextlib.closing(self.connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                data = self.read(conn)
+                data = func(data) if func else dict(data, **kwargs)
+                conn.execute('DELETE FROM state')
+                conn.executemany('INSERT INTO state (key, value) VALUES (?, ?)', [(k, json.dumps(v)) for k, v in data.items()])
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        _StateCache.pop(self.path.as_posix(), None)
+        return data
+
+
+def get_global_store(backend: str = None) -> Union[StateFile, SqliteStateStore]:
+    backend = (backend or state_backend).lower()
+    if backend == 'sqlite': return SqliteStateStore(globalstate_dir.joinpath('state.db'), seed = StateFile(globalstate_dir.joinpath('state.yaml')))
+    return StateFile(globalstate_dir.joinpath('state.yaml'))
+
+
+class ProjectState:
+    filename: str = '.pylibstate.yaml'
+
+    def __init__(self, project_dir: Union[str, Path]):
+        self.path = to_path(project_dir).joinpath(self.filename)
+        self.store = StateFile(self.path)
+
+    def load(self) -> Dict[str, Any]:
+        return self.store.load()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.load().get(key, default)
+
+    def update(self, func: Callable[[Dict[str, Any]], Dict[str, Any]] = None, **kwargs):
+        return self.store.update(func, **kwargs)
+
+
+__all__ = [
+    'globalstate_dir',
+    'file_lock',
+    'atomic_write_text',
+    'StateFile',
+    'SqliteStateStore',
+    'get_global_store',
+    'ProjectState',
+]
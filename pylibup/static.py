@@ -88,9 +88,43 @@ gitignores_template = """
 """
 
 pyinit_template = """
+{%- if lazy and modules %}
+# Submodules are imported on first access (PEP 562)
+import importlib
+{%- if type_stubs %}
+from typing import TYPE_CHECKING
+{%- endif %}
+
+_submodules = [
+    {%- for item in modules %}
+    '{{ item }}',
+    {%- endfor %}
+]
+{%- if type_stubs %}
+
+if TYPE_CHECKING:
+    {%- for item in modules %}
+    from . import {{ item }}
+    {%- endfor %}
+{%- endif %}
+
+def __getattr__(name: str):
+    if name in _submodules:
+        module = importlib.import_module(f'.{name}', __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def __dir__():
+    return sorted(set(globals()) | set(_submodules))
+
+# `from lib import *` imports every submodule, like the eager form
+__all__ = list(_submodules)
+{%- else %}
 {%- for item in modules %}
 from . import {{ item }}
 {%- endfor %}
+{%- endif %}
 """
 
 readme_template = """
@@ -234,8 +268,176 @@ jobs:
         password: ${{ secrets.PYPI_API_TOKEN }}
 """
 
+github_action_template_pypi_publish_cached = """
+## Autogenerated from Pylibup
+
+name: Upload Python Package
+on:
+  push:
+    {%- if branches %}
+    branches:
+      {%- for item in branches %}
+      - '{{ item }}'
+      {%- endfor %}
+    {%- endif %}
+    paths:
+      {%- for item in paths %}
+      - '{{ item }}'
+      {%- endfor %}
+  release:
+    types: [created]
+{%- if concurrency %}
+concurrency:
+  group: pypi-publish-{% raw %}${{ github.ref }}{% endraw %}
+  cancel-in-progress: {{ 'true' if cancel_in_progress else 'false' }}
+{%- endif %}
+jobs:
+  version:
+    runs-on: ubuntu-latest
+    outputs:
+      version: {% raw %}${{ steps.version.outputs.version }}{% endraw %}
+      publish: {% raw %}${{ steps.version.outputs.publish }}{% endraw %}
+    steps:
+    - uses: actions/checkout@v4
+    - name: Set up Python
+      uses: actions/setup-python@v5
+      with:
+        python-version: '{{ python_version }}'
+    - name: Check if the version is already published
+      id: version
+      run: |
+        # Read without setuptools, which Python 3.12+ no longer ships
+        VERSION=$(sed -nE "s/^version = ['\\"]([^'\\"]+)['\\"].*/\\1/p" setup.py | head -n 1)
+        if [ -z "$VERSION" ]; then
+          echo "::error::Unable to read the version from setup.py"
+          exit 1
+        fi
+        echo "version=$VERSION" >> $GITHUB_OUTPUT
+        {%- if skip_published %}
+        STATUS=$(curl -s -o /dev/null -w '%{http_code}' https://pypi.org/pypi/{{ pkg_name }}/$VERSION/json)
+        if [ "$STATUS" = "200" ]; then
+          echo "{{ pkg_name }} $VERSION is already on PyPI, skipping"
+          echo "publish=false" >> $GITHUB_OUTPUT
+        else
+          echo "publish=true" >> $GITHUB_OUTPUT
+        fi
+        {%- else %}
+        echo "publish=true" >> $GITHUB_OUTPUT
+        {%- endif %}
+  build:
+    needs: version
+    if: needs.version.outputs.publish == 'true'
+    runs-on: ubuntu-latest
+    strategy:
+      matrix:
+        dist: [sdist, wheel]
+    steps:
+    - uses: actions/checkout@v4
+    - name: Set up Python
+      uses: actions/setup-python@v5
+      with:
+        python-version: '{{ python_version }}'
+        cache: 'pip'
+        cache-dependency-path: |
+          {%- for item in cache_dependency_paths %}
+          {{ item }}
+          {%- endfor %}
+    - name: Install dependencies
+      run: python -m pip install build
+    - name: Build {% raw %}${{ matrix.dist }}{% endraw %}
+      run: python -m build --{% raw %}${{ matrix.dist }}{% endraw %}
+    - uses: actions/upload-artifact@v4
+      with:
+        name: dist-{% raw %}${{ matrix.dist }}{% endraw %}
+        path: dist/
+        retention-days: 1
+  publish:
+    needs: [version, build]
+    runs-on: ubuntu-latest
+    steps:
+    - uses: actions/download-artifact@v4
+      with:
+        pattern: dist-*
+        path: dist/
+        merge-multiple: true
+    - name: Publish {{ pkg_name }} {% raw %}${{ needs.version.outputs.version }}{% endraw %}
+      uses: pypa/gh-action-pypi-publish@release/v1
+      with:
+        user: __token__
+        password: {% raw %}${{ secrets.PYPI_API_TOKEN }}{% endraw %}
+        skip-existing: true
+"""
+
 github_action_template_docker_build = """
 ## Autogenerated from Pylibup
+{%- set image = '${{ steps.ecr.outputs.repository-uri }}' if require_ecr else '${{ env.IMG_REPO }}' %}
+{%- set use_matrix = platforms|length > 1 and parallel_platforms %}
+{%- set suffix = '-${{ env.PLATFORM_PAIR }}' if use_matrix else '' %}
+{%- macro login() %}
+      {%- if require_ecr %}
+      - name: Configure AWS credentials
+        uses: aws-actions/configure-aws-credentials@v4
+        with:
+          aws-access-key-id: {% raw %}${{ secrets.AWS_ACCESS_KEY_ID }}{% endraw %}
+          aws-secret-access-key: {% raw %}${{ secrets.AWS_SECRET_ACCESS_KEY }}{% endraw %}
+          aws-region: {% raw %}${{ secrets.AWS_REGION }}{% endraw %}
+
+      - name: Login to Amazon ECR
+        id: login-ecr
+        uses: aws-actions/amazon-ecr-login@v2
+
+      - name: Create ECR Repo if not Exists
+        uses: int128/create-ecr-repository-action@v1
+        id: ecr
+        with:
+          repository: {% raw %}${{ env.IMG_REPO }}{% endraw %}
+      {%- endif %}
+{%- endmacro %}
+{%- macro setup_buildx() %}
+      {%- if platforms|reject('equalto', 'linux/amd64')|list %}
+      - name: Set up QEMU
+        uses: docker/setup-qemu-action@v3
+      {%- endif %}
+      - name: Set up Docker Buildx
+        id: buildx
+        uses: docker/setup-buildx-action@v3
+{%- endmacro %}
+{%- macro restore_cache() %}
+      {%- if cache == 'local' %}
+      - name: Restore Docker layer cache
+        uses: actions/cache@v4
+        with:
+          path: {{ cache_dir }}
+          key: {% raw %}${{ runner.os }}{% endraw %}-buildx{{ suffix }}-{% raw %}${{ hashFiles('requirements.txt', 'Dockerfile') }}-${{ github.sha }}{% endraw %}
+          restore-keys: |
+            {% raw %}${{ runner.os }}{% endraw %}-buildx{{ suffix }}-{% raw %}${{ hashFiles('requirements.txt', 'Dockerfile') }}{% endraw %}-
+            {% raw %}${{ runner.os }}{% endraw %}-buildx{{ suffix }}-
+      {%- endif %}
+{%- endmacro %}
+{%- macro cache_options() %}
+          {%- if cache == 'gha' %}
+          cache-from: type=gha,scope={{ cache_scope }}{{ suffix }}
+          cache-to: type=gha,mode=max,scope={{ cache_scope }}{{ suffix }}
+          {%- elif cache == 'registry' %}
+          cache-from: type=registry,ref={{ image }}:{{ cache_tag }}{{ suffix }}
+          cache-to: type=registry,ref={{ image }}:{{ cache_tag }}{{ suffix }},mode=max{% if require_ecr %},image-manifest=true,oci-mediatypes=true{% endif %}
+          {%- elif cache == 'inline' %}
+          cache-from: type=registry,ref={{ image }}:{{ tags[0] }}
+          cache-to: type=inline
+          {%- elif cache == 'local' %}
+          cache-from: type=local,src={{ cache_dir }}
+          cache-to: type=local,dest={{ cache_dir }}-new,mode=max
+          {%- endif %}
+{%- endmacro %}
+{%- macro save_cache() %}
+      {%- if cache == 'local' %}
+      # cache-to writes a new dir, so old layers don't pile up in the cache
+      - name: Replace Docker layer cache
+        run: |
+          rm -rf {{ cache_dir }}
+          mv {{ cache_dir }}-new {{ cache_dir }}
+      {%- endif %}
+{%- endmacro %}
 
 name: Build {{ app_name }} Docker Image
 on:
@@ -248,64 +450,270 @@ on:
       - '.github/workflows/docker-build.yaml'
 
 env:
-  {%- if require_ecr %}
-  IMG_REPO: {{ ecr_options.repo }}
-  {% else %}
-  IMG_REPO: {{ docker_options.repo }}
-  {%- endif %}
+  IMG_REPO: {{ img_repo }}
 
 jobs:
-  build-latest-docker-image:
+  {%- if use_matrix %}
+  build-docker-image:
     runs-on: ubuntu-latest
     permissions:
       contents: read
       packages: write
+    strategy:
+      fail-fast: false
+      matrix:
+        platform:
+          {%- for platform in platforms %}
+          - {{ platform }}
+          {%- endfor %}
     steps:
-      - name: Checkout repository
-        uses: actions/checkout@v2
+      - name: Prepare
+        run: echo "PLATFORM_PAIR=$(echo {% raw %}${{ matrix.platform }}{% endraw %} | tr / -)" >> $GITHUB_ENV
 
-      - name: Set up Docker Buildx
-        id: buildx
-        uses: docker/setup-buildx-action@v1
-      {%- if require_ecr %}
-      - name: Configure AWS credentials
-        uses: aws-actions/configure-aws-credentials@v1
+      - name: Checkout repository
+        uses: actions/checkout@v4
+      {{- setup_buildx() }}
+      {{- login() }}
+      {{- restore_cache() }}
+
+      - name: 'Build {{ app_name }} for {% raw %}${{ matrix.platform }}{% endraw %}'
+        id: build
+        uses: docker/build-push-action@v6
         with:
-          aws-access-key-id: ${{ secrets.AWS_ACCESS_KEY_ID }}
-          aws-secret-access-key: ${{ secrets.AWS_SECRET_ACCESS_KEY }}
-          aws-region: ${{ secrets.AWS_REGION }}
-
-      - name: Login to Amazon ECR
-        id: login-ecr
-        uses: aws-actions/amazon-ecr-login@v1
-      
-      - name: Create ECR Repo if not Exists
-        uses: int128/create-ecr-repository-action@v1
-        id: ecr
+          context: .
+          file: Dockerfile
+          platforms: {% raw %}${{ matrix.platform }}{% endraw %}
+          outputs: type=image,name={{ image }},push-by-digest=true,name-canonical=true,push=true
+          {{- cache_options() }}
+      {{- save_cache() }}
+
+      - name: Export digest
+        run: |
+          mkdir -p /tmp/digests
+          digest="{% raw %}${{ steps.build.outputs.digest }}{% endraw %}"
+          touch "/tmp/digests/${digest#sha256:}"
+
+      - name: Upload digest
+        uses: actions/upload-artifact@v4
         with:
-          repository: ${{ env.IMG_REPO }}
-      - name: Build and Push Docker Image: {{ app_name }}
-        uses: docker/build-push-action@v2
+          name: digests{{ suffix }}
+          path: /tmp/digests/*
+          if-no-files-found: error
+          retention-days: 1
+
+  merge-docker-image:
+    runs-on: ubuntu-latest
+    needs: build-docker-image
+    permissions:
+      contents: read
+      packages: write
+    steps:
+      - name: Download digests
+        uses: actions/download-artifact@v4
         with:
-          file: Dockerfile
-          platforms: linux/amd64
-          push: true
-          tags: |
-            ${{ steps.ecr.outputs.repository-uri }}:latest
-          cache-from: type=gha
-          cache-to: type=gha,mode=max
-      {% else %}
-      - name: Build and Push Docker Image: {{ app_name }}
-        uses: docker/build-push-action@v2
+          path: /tmp/digests
+          pattern: digests-*
+          merge-multiple: true
+
+      - name: Set up Docker Buildx
+        uses: docker/setup-buildx-action@v3
+      {{- login() }}
+
+      - name: 'Push {{ app_name }} manifest list'
+        working-directory: /tmp/digests
+        run: |
+          docker buildx imagetools create {% for tag in tags %}-t {{ image }}:{{ tag }} {% endfor %}$(printf '{{ image }}@sha256:%s ' *)
+  {%- else %}
+  build-latest-docker-image:
+    runs-on: ubuntu-latest
+    permissions:
+      contents: read
+      packages: write
+    steps:
+      - name: Checkout repository
+        uses: actions/checkout@v4
+      {{- setup_buildx() }}
+      {{- login() }}
+      {{- restore_cache() }}
+
+      - name: 'Build and Push Docker Image: {{ app_name }}'
+        uses: docker/build-push-action@v6
         with:
+          context: .
           file: Dockerfile
-          platforms: linux/amd64
+          platforms: {{ platforms|join(',') }}
           push: true
           tags: |
-            ${{ env.IMG_REPO }}:latest
-          cache-from: type=gha
-          cache-to: type=gha,mode=max
-      {%- endif %}
+            {%- for tag in tags %}
+            {{ image }}:{{ tag }}
+            {%- endfor %}
+          {{- cache_options() }}
+      {{- save_cache() }}
+  {%- endif %}
+"""
+
+benchmark_runner_template = """
+## Autogenerated from Pylibup
+# Times every bench_* function in benchmarks/bench_*.py and writes the results as JSON.
+#
+#   python -m benchmarks.run --json results.json
+#   python -m benchmarks.run --json results.json --compare baseline.json --threshold 0.2
+#
+# With --compare, exits with 1 when a benchmark's median is more than
+# `threshold` slower than in the baseline.
+
+import sys
+import json
+import time
+import platform
+import argparse
+import importlib
+import statistics
+from pathlib import Path
+
+
+def discover(pattern: str = None):
+    for path in sorted(Path(__file__).parent.glob('bench_*.py')):
+        module = importlib.import_module(f'{__package__ or "benchmarks"}.{path.stem}')
+        for name, func in vars(module).items():
+            if not name.startswith('bench_') or not callable(func): continue
+            key = f'{path.stem}.{name}'
+            if pattern and pattern not in key: continue
+            yield key, func
+
+
+def measure(func, repeat: int = 5, min_time: float = 0.1) -> dict:
+    # Loops are calibrated so each sample runs for at least min_time, which keeps timer noise out of fast benchmarks
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number): func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1_000_000: break
+        number *= 10 if elapsed < min_time / 10 else 2
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number): func()
+        samples.append((time.perf_counter() - start) / number)
+    return {'median': statistics.median(samples), 'min': min(samples), 'number': number, 'repeat': repeat}
+
+
+def compare(results: dict, baseline: dict, threshold: float, noise_floor: float) -> list:
+    # Results below the noise floor aren't compared, their relative changes are mostly timer jitter
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or base['median'] < noise_floor: continue
+        change = result['median'] / base['median'] - 1
+        result['change'] = change
+        if change > threshold: regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Runs the benchmarks')
+    parser.add_argument('-k', dest = 'pattern', default = None, help = 'Only run benchmarks whose name contains this')
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--min-time', type = float, default = 0.1, help = 'Minimum seconds per sample')
+    parser.add_argument('--json', dest = 'json_path', default = None, help = 'Write the results to this file')
+    parser.add_argument('--compare', default = None, help = 'Baseline results to compare against')
+    parser.add_argument('--threshold', type = float, default = 0.2, help = 'Allowed slowdown against the baseline, 0.2 = 20%%')
+    parser.add_argument('--noise-floor', type = float, default = 1e-6, help = 'Baseline medians below this many seconds are not compared')
+    opts = parser.parse_args()
+
+    results = {name: measure(func, repeat = opts.repeat, min_time = opts.min_time) for name, func in discover(opts.pattern)}
+    regressions = []
+    if opts.compare:
+        baseline = json.loads(Path(opts.compare).read_text()).get('results', {})
+        regressions = compare(results, baseline, opts.threshold, opts.noise_floor)
+
+    print(f'{"benchmark":<48}{"median us":>12}{"min us":>12}{"change":>10}')
+    for name, result in results.items():
+        change = f'{result["change"]:+.1%}' if 'change' in result else ''
+        print(f'{name:<48}{result["median"] * 1e6:>12.2f}{result["min"] * 1e6:>12.2f}{change:>10}')
+    if opts.json_path:
+        data = {'python': platform.python_version(), 'machine': platform.machine(), 'results': results}
+        Path(opts.json_path).write_text(json.dumps(data, indent = 2))
+    if regressions:
+        print(f'{len(regressions)} benchmarks regressed by more than {opts.threshold:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
+"""
+
+benchmark_module_template = """
+## Autogenerated from Pylibup
+# Benchmarks for {{ lib_name }}.{{ module }}. Every bench_* function here is timed by `python -m benchmarks.run`
+
+from {{ lib_name }} import {{ module }}
+
+
+def bench_{{ module }}():
+    # Replace with a call into the hot path of {{ module }}
+    return {{ module }}
+"""
+
+github_action_template_benchmarks = """
+## Autogenerated from Pylibup
+
+name: Benchmarks
+on:
+  pull_request:
+  push:
+    branches:
+      - '{{ default_branch }}'
+concurrency:
+  group: benchmarks-{% raw %}${{ github.ref }}{% endraw %}
+  cancel-in-progress: true
+jobs:
+  benchmarks:
+    runs-on: ubuntu-latest
+    steps:
+    - uses: actions/checkout@v4
+    - name: Set up Python
+      uses: actions/setup-python@v5
+      with:
+        python-version: '{{ python_version }}'
+        cache: 'pip'
+        cache-dependency-path: |
+          setup.py
+          requirements.txt
+    - name: Install {{ pkg_name }}
+      run: python -m pip install -e .
+    - name: Restore the baseline
+      if: github.event_name == 'pull_request'
+      uses: actions/cache/restore@v4
+      with:
+        path: benchmark-baseline.json
+        key: benchmarks-{% raw %}${{ github.base_ref }}-${{ github.event.pull_request.base.sha }}{% endraw %}
+        restore-keys: benchmarks-{% raw %}${{ github.base_ref }}{% endraw %}-
+    - name: Run benchmarks
+      run: |
+        ARGS="--repeat {{ repeat }} --json benchmark-results.json"
+        if [ -f benchmark-baseline.json ]; then
+          ARGS="$ARGS --compare benchmark-baseline.json --threshold {{ threshold }}"
+        else
+          echo "No baseline for this branch yet, only recording results"
+        fi
+        python -m benchmarks.run $ARGS
+    - uses: actions/upload-artifact@v4
+      if: always()
+      with:
+        name: benchmark-results
+        path: benchmark-results.json
+        retention-days: 14
+    # Results from the default branch become the baseline pull requests compare against
+    - name: Store the baseline
+      if: github.event_name == 'push'
+      run: cp benchmark-results.json benchmark-baseline.json
+    - uses: actions/cache/save@v4
+      if: github.event_name == 'push'
+      with:
+        path: benchmark-baseline.json
+        key: benchmarks-{% raw %}${{ github.ref_name }}-${{ github.sha }}{% endraw %}
 """
 
 dockerfile_fastapi_template = """
@@ -325,6 +733,64 @@ ENV PYTHONPATH=/app:$PYTHONPATH
 """
 
 
+# The syntax directive is only honored on the very first line, so no leading newline
+dockerfile_multistage_template = """# syntax=docker/dockerfile:1
+## Autogenerated from Pylibup
+
+ARG PYTHON_VERSION={{ python_version }}
+
+# Compiles every requirement into a wheelhouse. Only requirement changes invalidate it
+FROM {{ builder_image or 'python:${PYTHON_VERSION}' }} AS deps
+WORKDIR /src
+{%- if requirements_file %}
+COPY requirements.txt /wheels/requirements.txt
+RUN --mount=type=cache,target=/root/.cache/pip \\
+    pip wheel --wheel-dir /wheels -r /wheels/requirements.txt{% for item in extra_requirements %} '{{ item }}'{% endfor %}
+{%- else %}
+RUN --mount=type=cache,target=/root/.cache/pip \\
+    pip wheel --wheel-dir /wheels{% for item in requirements + extra_requirements %} '{{ item }}'{% endfor %}
+{%- endif %}
+
+# Builds {{ pkg_name }} itself, without its dependencies
+FROM {{ builder_image or 'python:${PYTHON_VERSION}' }} AS package
+WORKDIR /src
+COPY setup.py README.md ./
+COPY {{ lib_name }} ./{{ lib_name }}
+RUN --mount=type=cache,target=/root/.cache/pip \\
+    pip wheel --no-deps --wheel-dir /dist .
+
+FROM {{ base_image or 'python:${PYTHON_VERSION}-slim' }} AS runtime
+ENV PYTHONDONTWRITEBYTECODE=1 \\
+    PYTHONUNBUFFERED=1 \\
+    PIP_DISABLE_PIP_VERSION_CHECK=1
+WORKDIR /app
+
+# The wheels are bind mounted, so neither they nor pip's cache end up in the image
+RUN --mount=type=bind,from=deps,source=/wheels,target=/wheels \\
+    pip install --no-cache-dir --no-index --find-links /wheels /wheels/*.whl
+RUN --mount=type=bind,from=package,source=/dist,target=/dist \\
+    pip install --no-cache-dir --no-deps /dist/*.whl
+
+COPY ./app /app/app
+ENV PYTHONPATH=/app
+EXPOSE {{ port }}
+CMD [{% for item in cmd %}"{{ item }}"{% if not loop.last %}, {% endif %}{% endfor %}]
+"""
+
+dockerignore_template = """
+## Autogenerated from Pylibup
+.git
+.github
+**/__pycache__
+**/*.py[cod]
+*.egg-info
+build
+dist
+.venv
+.pylibstate.yaml
+"""
+
+
 pylib_metadata_template = """
 # Autogenerated by Pylib
 
@@ -433,16 +899,20 @@ default_metadata_secrets = {
 default_metadata_options = {
   'default_branch': 'main',
   'include_init': True,
+  'lazy_init': False,
   'include_app': True,
   'include_dockerfile': True,
   'include_buildscript': True,
   'include_reqtext': True,
   'private': True,
+  'dockerfile_mode': 'fastapi',
 }
 
 default_metadata_dockerbuild_options = {
   'app_name':'',
   'require_ecr': True,
+  'cache': 'gha',
+  'platforms': ['linux/amd64'],
   'ecr_options': {
     'img_repo': ''
   },
@@ -451,8 +921,18 @@ default_metadata_dockerbuild_options = {
   }
 }
 
+default_metadata_pypi_publish_options = {
+  'cached': False,
+  'python_version': '3.x',
+  'paths': ['setup.py'],
+  'concurrency': True,
+  'skip_published': True,
+}
+
 default_metadata_workflows = {
   'pypi_publish': True,
+  'pypi_publish_options': default_metadata_pypi_publish_options,
+  'benchmarks': False,
   'docker_build': False,
   'docker_build_options': default_metadata_dockerbuild_options
 }
@@ -463,7 +943,7 @@ default_pylib_metadata = {
   'readme_text': '',
   'project_description': '',
   'gitignores': default_metadata_gitignores,
-  'structure': {'modules': default_metadata_modules},
+  'structure': {'modules': default_metadata_modules, 'benchmarks': False},
   'secrets': default_metadata_secrets,
   'options': default_metadata_options,
   'workflows': default_metadata_workflows
@@ -0,0 +1,64 @@
+"""
+Shared Jinja Environment for all the templates in static.py
+
+Templates are compiled at most once per process (Environment cache)
+and the compiled bytecode is persisted under the global state dir,
+so repeated builds only recompile once static.py changes.
+"""
+from jinja2 import Environment, FunctionLoader, FileSystemBytecodeCache, Template
+
+from .config import StateConfig
+from .trace import span
+from .types import *
+
+
+def load_static_template(name: str):
+    # static.py is only loaded once a template is actually needed
+    from . import static
+    source = getattr(static, name, None)
+    if not isinstance(source, str): return None
+    # static.py is only loaded once per process, so the source is always uptodate
+    return source, static.__file__, lambda: True
+
+
+class PylibTemplates:
+    env: Environment = None
+
+    @classmethod
+    def get_bytecode_cache(cls) -> Optional[FileSystemBytecodeCache]:
+        cache_dir = StateConfig.get_cache_dir('templates')
+        if cache_dir is None: return None
+        return FileSystemBytecodeCache(directory = cache_dir.as_posix(), pattern = 'pylibup_%s.cache')
+
+    @classmethod
+    def get_env(cls) -> Environment:
+        if cls.env is None:
+            cls.env = Environment(loader = FunctionLoader(load_static_template), bytecode_cache = cls.get_bytecode_cache(), auto_reload = False)
+        return cls.env
+
+    @classmethod
+    def get(cls, name: str) -> Template:
+        return cls.get_env().get_template(name)
+
+    @classmethod
+    def render(cls, name: str, data: Dict[str, Any] = None, **kwargs) -> str:
+        data = dict(data or {}, **kwargs)
+        with span(name, 'render'): return cls.get(name).render(data)
+
+    @classmethod
+    def warmup(cls, *names: str):
+        """
+        Compiles the given templates (or every template in static.py)
+        so that the bytecode cache is populated
+        """
+        from . import static
+        if not names: names = [k for k, v in vars(static).items() if 'template' in k and isinstance(v, str)]
+        for name in names: cls.get(name)
+
+
+render_template = PylibTemplates.render
+
+__all__ = [
+    'PylibTemplates',
+    'render_template',
+]
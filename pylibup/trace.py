@@ -0,0 +1,161 @@
+"""
+Build tracing in the Chrome trace event format (chrome://tracing, ui.perfetto.dev).
+
+Tracing is off by default. While it's off `span` returns a shared no-op
+context manager and `traced` calls straight through, so instrumented code
+pays a global lookup and a branch. `enable_tracing()` (or `pylibup --profile
+trace.json ...`) starts collecting complete ('X') events per thread.
+
+Categories used by pylibup: phase, render, write, git, subprocess, http.
+"""
+import os
+import json
+import time
+import threading
+import functools
+from typing import Any, Callable, Dict, List, Optional, Union
+from pathlib import Path
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+    def set(self, **args): pass
+
+
+_noop_span = _NoopSpan()
+
+
+class Span:
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start_ns')
+
+    def __init__(self, tracer: 'Tracer', name: str, cat: str, args: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def set(self, **args):
+        """
+        Attaches extra args, e.g. a status code known only at the end of the span
+        """
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None: self.args['error'] = exc_type.__name__
+        self.tracer.add(self.name, self.cat, self.start_ns, time.perf_counter_ns() - self.start_ns, self.args)
+        return False
+
+
+class Tracer:
+    def __init__(self):
+        self.pid = os.getpid()
+        self.start_ns = time.perf_counter_ns()
+        self.events: List[Dict[str, Any]] = []
+        self.thread_names: Dict[int, str] = {}
+        self.lock = threading.Lock()
+
+    def span(self, name: str, cat: str = 'pylibup', **args) -> Span:
+        return Span(self, name, cat, args)
+
+    def add(self, name: str, cat: str, start_ns: int, dur_ns: int, args: Dict[str, Any] = None):
+        thread = threading.current_thread()
+        event = {'name': name, 'cat': cat, 'ph': 'X', 'ts': (start_ns - self.start_ns) / 1000, 'dur': dur_ns / 1000, 'pid': self.pid, 'tid': thread.ident}
+        if args: event['args'] = {k: v if isinstance(v, (str, int, float, bool)) or v is None else str(v) for k, v in args.items()}
+        with self.lock:
+            self.events.append(event)
+            self.thread_names.setdefault(thread.ident, thread.name)
+
+    def to_chrome(self) -> Dict[str, Any]:
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': 'pylibup'}}]
+        metadata += [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}} for tid, name in self.thread_names.items()]
+        return {'traceEvents': metadata + sorted(self.events, key = lambda e: e['ts']), 'displayTimeUnit': 'ms'}
+
+    def save(self, path: Union[str, Path]) -> Path:
+        path = Path(path).expanduser()
+        path.parent.mkdir(parents = True, exist_ok = True)
+        path.write_text(json.dumps(self.to_chrome()))
+        return path
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        Aggregates the spans by category and name, slowest total first
+        """
+        rows: Dict[tuple, Dict[str, Any]] = {}
+        for e in self.events:
+            row = rows.setdefault((e['cat'], e['name']), {'cat': e['cat'], 'name': e['name'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            row['count'] += 1
+            row['total_ms'] += e['dur'] / 1000
+            row['max_ms'] = max(row['max_ms'], e['dur'] / 1000)
+        return sorted(rows.values(), key = lambda r: r['total_ms'], reverse = True)
+
+    def format_summary(self, limit: int = 30) -> str:
+        rows = self.summary()
+        headers = ['category', 'name', 'count', 'total ms', 'mean ms', 'max ms']
+        table = [[r['cat'], r['name'], str(r['count']), f"{r['total_ms']:.2f}", f"{r['total_ms'] / r['count']:.2f}", f"{r['max_ms']:.2f}"] for r in rows[:limit]]
+        widths = [max(len(row[i]) for row in table + [headers]) for i in range(len(headers))]
+        lines = ['  '.join(h.ljust(w) for h, w in zip(headers, widths))]
+        lines.append('  '.join('-' * w for w in widths))
+        lines.extend('  '.join(c.ljust(w) for c, w in zip(row, widths)) for row in table)
+        if len(rows) > limit: lines.append(f'... {len(rows) - limit} more')
+        wall_ms = (time.perf_counter_ns() - self.start_ns) / 1e6
+        lines.append(f'{len(self.events)} spans, {wall_ms:.1f}ms since tracing started')
+        return '\n'.join(lines)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def enable_tracing() -> Tracer:
+    global _tracer
+    if _tracer is None: _tracer = Tracer()
+    return _tracer
+
+
+def disable_tracing() -> Optional[Tracer]:
+    """
+    Stops tracing and returns the tracer with the collected events
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+def span(name: str, cat: str = 'pylibup', **args) -> Union[Span, _NoopSpan]:
+    if _tracer is None: return _noop_span
+    return _tracer.span(name, cat, **args)
+
+
+def traced(name: str = None, cat: str = 'phase') -> Callable:
+    """
+    Decorator that wraps every call of the function in a span
+    """
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__name__
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None: return func(*args, **kwargs)
+            with _tracer.span(span_name, cat): return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+__all__ = [
+    'Span',
+    'Tracer',
+    'enable_tracing',
+    'disable_tracing',
+    'get_tracer',
+    'span',
+    'traced',
+]
@@ -1,8 +1,13 @@
 import os
+import re
+import functools
 from pathlib import Path
 from logz import get_cls_logger
+from typing import List, Any, Optional, Union, TYPE_CHECKING
 
-from .types import *
+# types pulls in pydantic, which the lightweight CLI commands don't need
+if TYPE_CHECKING:
+    from .types import TextMany, AnyMany, ValidatorArgs
 
 get_logger = get_cls_logger('pylib', 'info')
 
@@ -15,29 +20,133 @@ def to_path(path: Union[str, Path], resolve: bool = True) -> Path:
     if resolve: path.resolve()
     return path
 
-def set_to_many(value: AnyMany) -> List[Any]:
+def set_to_many(value: 'AnyMany') -> List[Any]:
     if not isinstance(value, list): value = [value]
     return value
 
+def _trie_regex(words: List[str]) -> str:
+    """
+    Builds a regex from a trie of `words`, so shared prefixes are only
+    matched once instead of trying every alternative at each position
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word: node = node.setdefault(char, {})
+        node[''] = {}
+    def emit(node) -> str:
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches: return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' not in node: return body
+        return f'(?:{body})?' if len(branches) == 1 else body + '?'
+    return emit(trie)
+
+
+class TextMatcher:
+    """
+    Matches texts against a fixed list of patterns, compiled once.
+
+    - exact: the text equals one of the patterns (a set lookup)
+    - substring: a pattern is contained in the text (one search over a
+      trie-shaped regex), or the text is contained in a pattern (one find
+      over the joined patterns)
+    """
+    sep: str = '\0'
+    # words longer than this would nest the trie regex too deeply
+    max_trie_length: int = 200
+    def __init__(self, patterns: 'TextMany', exact: bool = False):
+        self.patterns = [p for p in set_to_many(patterns) if p is not None]
+        self.exact = exact
+        self.pattern_set = frozenset(self.patterns)
+        self.regex = None
+        if not exact and self.patterns:
+            words = sorted(self.pattern_set)
+            body = _trie_regex(words) if max(map(len, words)) <= self.max_trie_length else '|'.join(re.escape(w) for w in sorted(words, key = len, reverse = True))
+            self.regex = re.compile(body)
+            self.joined = self.sep.join(words)
+
+    def __bool__(self) -> bool:
+        return bool(self.patterns)
+
+    def _contains_pattern(self, text: str) -> bool:
+        return self.regex.search(text) is not None
+
+    def _in_pattern(self, text: str) -> bool:
+        if self.sep in text: return any(text in p for p in self.patterns)
+        return text in self.joined
+
+    def match(self, text: str) -> bool:
+        if not self.patterns: return False
+        if self.exact: return text in self.pattern_set
+        return self._contains_pattern(text) or self._in_pattern(text)
+
+    def match_item(self, item: str, text: str) -> bool:
+        """
+        Whether a single pattern matches `text`, with the same rules as `match`
+        """
+        if self.exact: return item == text
+        return item in text or text in item
+
+    def match_many(self, texts: List[str]) -> List[bool]:
+        return [self.match(text) for text in texts]
+
+    def filter(self, texts: List[str]) -> List[str]:
+        return [text for text in texts if self.match(text)]
+
+    def first_match(self, text: str) -> Optional[str]:
+        """
+        Returns the first pattern (in the given order) that matches `text`
+        """
+        if not self.match(text): return None
+        return next(p for p in self.patterns if self.match_item(p, text))
+
+
+class TextValidator:
+    """
+    Include/exclude validation built from two TextMatchers.
+    Excludes win, then includes. When only excludes are set, anything
+    not excluded is valid.
+    """
+    def __init__(self, include: List[str] = None, exclude: List[str] = None, exact: bool = False):
+        self.include = get_text_matcher(include or [], exact = exact)
+        self.exclude = get_text_matcher(exclude or [], exact = exact)
+
+    def validate(self, text: str) -> bool:
+        if not self.include and not self.exclude: return True
+        if self.exclude.match(text): return False
+        if self.include and self.include.match(text): return True
+        return bool(self.exclude)
+
+    def validate_many(self, texts: List[str]) -> List[bool]:
+        return [self.validate(text) for text in texts]
+
+    def filter(self, texts: List[str]) -> List[str]:
+        return [text for text in texts if self.validate(text)]
+
+
+@functools.lru_cache(maxsize = 256)
+def _get_text_matcher(patterns: tuple, exact: bool) -> TextMatcher:
+    return TextMatcher(list(patterns), exact = exact)
+
+
+def get_text_matcher(patterns: 'TextMany', exact: bool = False) -> TextMatcher:
+    """
+    Returns a compiled matcher, shared between calls with the same patterns
+    """
+    return _get_text_matcher(tuple(set_to_many(patterns)), exact)
+
+
 def does_text_validate(text: str, include: List[str] = [], exclude: List[str] = [], exact: bool = False, **kwargs) -> bool:
-    if not include and not exclude: return True
-    _valid = False
-    if exclude:
-        for ex in exclude:
-            if ((exact and ex == text)  or not exact and (ex in text or text in ex)): return False
-        _valid = True
-    if include:
-        for inc in include:
-            if ((exact and inc == text) or not exact and (inc in text or text in inc)): return True
-    return _valid
-
-def does_text_match(text: str, items: TextMany, exact: bool = False, valArgs: ValidatorArgs = None, **kwargs):
-    items = set_to_many(items)
-    for i in items:
-        if exact and i == text or (text in i or i in text):
-            if valArgs: return does_text_validate(i, exact=exact, **ValidatorArgs.dict())
-            return True
-    return False
+    return TextValidator(include, exclude, exact = exact).validate(text)
+
+def does_text_match(text: str, items: 'TextMany', exact: bool = False, valArgs: 'ValidatorArgs' = None, **kwargs):
+    matcher = get_text_matcher(items, exact = exact)
+    if not valArgs: return matcher.match(text)
+    item = matcher.first_match(text)
+    if item is None: return False
+    valArgs = valArgs.dict() if hasattr(valArgs, 'dict') else dict(valArgs)
+    return does_text_validate(item, exact = exact, **valArgs)
 
 
 __all__ = [
@@ -48,6 +157,9 @@ __all__ = [
     'to_path',
     'Path',
     'set_to_many',
+    'TextMatcher',
+    'TextValidator',
+    'get_text_matcher',
     'does_text_match',
     'does_text_validate'
 ]
@@ -0,0 +1,302 @@
+"""
+Watch mode: regenerates a project's files as its metadata file is edited.
+
+- Changes are picked up with inotify on the parent dirs (editors and the
+  state store replace files instead of writing them in place), or by
+  polling the files' stat where inotify isn't available.
+- Bursts of events are debounced: a sync runs once no event arrived for
+  `debounce` seconds.
+- The previous and new metadata are diffed into dotted key paths
+  (`setup.requirements`) and only the artifacts whose inputs
+  (`artifact_inputs`) overlap them are rendered and written, through the
+  same manifest hash check as incremental builds.
+- Commits are optional and batched: the written files are staged and
+  committed every `commit_every` syncs, and once more on exit.
+- A change to the state files re-resolves which metadata file is watched.
+"""
+import os
+import sys
+import time
+import fnmatch
+import select
+import struct
+import ctypes
+import ctypes.util
+
+from typing import Iterable, Set
+
+from .types import *
+from .utils import get_logger, to_path, Path
+from .config_cache import read_config_file
+from .trace import span
+
+
+logger = get_logger()
+
+# (artifact group, filename pattern, metadata keys the file is rendered from).
+# Groups map to PylibConfigData.get_<group>_artifacts, the first matching pattern wins.
+artifact_inputs: List[Tuple[str, str, Tuple[str, ...]]] = [
+    ('base', 'setup.py', ('setup',)),
+    ('base', 'build.sh', ('options.include_buildscript',)),
+    ('base', 'requirements.txt', ('setup.requirements', 'options.include_reqtext')),
+    ('base', 'README.md', ('setup.pkg_name', 'setup.lib_name', 'setup.git_repo', 'setup.description', 'setup.require_py3_version', 'setup.requirements', 'readme_text')),
+    ('base', '.gitignore', ('gitignores',)),
+    ('structure', 'benchmarks/run.py', ('structure.benchmarks',)),
+    ('structure', 'benchmarks/*', ('structure', 'setup.lib_name', 'setup.pkg_name', 'repo')),
+    ('structure', '*/__init__.py', ('structure', 'options.include_init', 'options.lazy_init', 'options.lazy_init_stubs', 'setup.lib_name', 'setup.pkg_name', 'repo')),
+    ('structure', '*', ('structure', 'setup.lib_name', 'setup.pkg_name', 'repo')),
+    ('workflow', '.github/workflows/docker-build.yaml', ('workflows', 'setup.lib_name', 'setup.pkg_name', 'repo')),
+    ('workflow', '.github/workflows/python-publish.yaml', ('workflows', 'setup.pkg_name')),
+    ('workflow', '.github/workflows/benchmarks.yaml', ('workflows', 'structure.benchmarks', 'setup.pkg_name', 'options.default_branch')),
+    ('workflow', '*', ('workflows',)),
+    ('app', 'Dockerfile', ('options.include_app', 'options.include_dockerfile', 'options.include_reqtext', 'options.dockerfile_mode', 'options.dockerfile_options', 'setup.requirements', 'setup.lib_name', 'setup.pkg_name', 'repo')),
+    ('app', '.dockerignore', ('options.include_app', 'options.dockerfile_mode')),
+    ('app', '*', ('options.include_app',)),
+]
+
+
+def get_changed_keys(old: Any, new: Any, prefix: str = '') -> Set[str]:
+    """
+    Returns the dotted key paths that differ between two metadata dicts
+    """
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return set() if old == new else {prefix}
+    changed = set()
+    for key in old.keys() | new.keys():
+        path = f'{prefix}.{key}' if prefix else str(key)
+        if key not in old or key not in new: changed.add(path)
+        else: changed |= get_changed_keys(old[key], new[key], path)
+    return changed
+
+
+def is_affected(inputs: Iterable[str], changed: Set[str]) -> bool:
+    # `setup` changing affects `setup.requirements` and vice versa
+    return any(c == i or c.startswith(f'{i}.') or i.startswith(f'{c}.') for i in inputs for c in changed)
+
+
+def get_inputs(group: str, filename: str) -> Tuple[str, ...]:
+    for g, pattern, inputs in artifact_inputs:
+        if g == group and fnmatch.fnmatchcase(filename, pattern): return inputs
+    return ('',)
+
+
+def get_affected_artifacts(config: Any, changed: Set[str]) -> List[Any]:
+    """
+    Renders the artifacts whose inputs overlap the changed keys. Groups
+    with no affected inputs aren't rendered at all
+    """
+    if '' in changed: return config.get_artifacts()
+    artifacts = []
+    for group in dict.fromkeys(g for g, _, _ in artifact_inputs):
+        if not is_affected({i for g, _, inputs in artifact_inputs if g == group for i in inputs}, changed): continue
+        artifacts.extend(a for a in getattr(config, f'get_{group}_artifacts')() if a.enabled and is_affected(get_inputs(group, a.filename), changed))
+    return artifacts
+
+
+class _Inotify:
+    # From <sys/inotify.h>
+    IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x2, 0x4, 0x8, 0x40, 0x80, 0x100, 0x200
+    IN_NONBLOCK, IN_CLOEXEC = 0o4000, 0o2000000
+    mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    header = struct.Struct('iIII')
+
+    def __init__(self, libc: ctypes.CDLL, dirs: Iterable[Path]):
+        self.libc = libc
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0: raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.dirs: Dict[int, Path] = {}
+        for path in dirs:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(path.as_posix()), self.mask)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {path}')
+            self.dirs[wd] = path
+
+    def read(self, timeout: Optional[float]) -> Set[Path]:
+        if not select.select([self.fd], [], [], timeout)[0]: return set()
+        try: data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError: return set()
+        paths, offset = set(), 0
+        while offset < len(data):
+            wd, _, _, length = self.header.unpack_from(data, offset)
+            name = data[offset + self.header.size:offset + self.header.size + length].rstrip(b'\0')
+            offset += self.header.size + length
+            if wd in self.dirs and name: paths.add(self.dirs[wd].joinpath(os.fsdecode(name)))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+def load_libc_inotify() -> Optional[ctypes.CDLL]:
+    if not sys.platform.startswith('linux'): return None
+    try: libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno = True)
+    except OSError: return None
+    return libc if hasattr(libc, 'inotify_init1') else None
+
+
+class FileWatcher:
+    """
+    Waits for changes to a set of files, with inotify when available, else by polling their stat
+    """
+    def __init__(self, paths: Iterable[Union[str, Path]], poll_interval: float = 0.5, use_inotify: bool = True):
+        self.paths = {to_path(p).absolute() for p in paths}
+        self.poll_interval = poll_interval
+        self.inotify: Optional[_Inotify] = None
+        libc = load_libc_inotify() if use_inotify else None
+        if libc is not None:
+            try: self.inotify = _Inotify(libc, {p.parent for p in self.paths if p.parent.is_dir()})
+            except OSError as e: logger.warning(f'inotify unavailable, polling instead: {e}')
+        self.stats = self.get_stats()
+
+    @property
+    def mode(self) -> str:
+        return 'inotify' if self.inotify else 'poll'
+
+    def get_stats(self) -> Dict[Path, Optional[Tuple[int, int, int]]]:
+        stats = {}
+        for path in self.paths:
+            try: st = path.stat()
+            except FileNotFoundError: st = None
+            stats[path] = (st.st_mtime_ns, st.st_size, st.st_ino) if st else None
+        return stats
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        """
+        Returns the watched files that changed, or an empty set once `timeout` passes
+        """
+        if self.inotify: return self.inotify.read(timeout) & self.paths
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            stats = self.get_stats()
+            changed = {p for p in self.paths if stats[p] != self.stats[p]}
+            self.stats = stats
+            if changed: return changed
+            remaining = self.poll_interval if deadline is None else min(self.poll_interval, deadline - time.monotonic())
+            if remaining <= 0: return set()
+            time.sleep(remaining)
+
+    def close(self):
+        if self.inotify: self.inotify.close()
+        self.inotify = None
+
+
+class WatchSync(BaseModel):
+    changed_keys: List[str] = []
+    written: List[str] = []
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+class ProjectWatcher:
+    """
+    Keeps a project's managed files in sync with its metadata file
+    """
+    def __init__(self, cfg: Any, state_files: Iterable[Union[str, Path]] = (), get_config_file: Callable[[], Optional[str]] = None, debounce: float = 0.3, commit: bool = False, commit_every: int = 0, commit_msg: str = 'Regenerate from metadata', poll_interval: float = 0.5, use_inotify: bool = True):
+        self.cfg = cfg
+        self.state_files = [to_path(p).absolute() for p in state_files]
+        self.get_config_file = get_config_file
+        self.debounce = debounce
+        self.commit = commit
+        self.commit_every = commit_every
+        self.commit_msg = commit_msg
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.config_file = to_path(cfg.config_file).absolute()
+        self.data = read_config_file(self.config_file)
+        self.syncs: List[WatchSync] = []
+        self.uncommitted = 0
+        self.watcher: Optional[FileWatcher] = None
+
+    def start_watcher(self):
+        if self.watcher: self.watcher.close()
+        self.watcher = FileWatcher([self.config_file] + self.state_files, poll_interval = self.poll_interval, use_inotify = self.use_inotify)
+
+    def resolve_config_file(self) -> bool:
+        """
+        Switches to the metadata file the state now points to. Returns True if it changed
+        """
+        config_file = self.get_config_file() if self.get_config_file else None
+        if not config_file or to_path(config_file).absolute() == self.config_file: return False
+        self.config_file = to_path(config_file).absolute()
+        self.cfg.config_file = self.config_file.as_posix()
+        logger.info(f'Watching {self.config_file.as_posix()}')
+        self.start_watcher()
+        return True
+
+    def sync(self) -> WatchSync:
+        """
+        Renders and writes the artifacts affected by the metadata changes since the last sync
+        """
+        start = time.perf_counter()
+        result = WatchSync()
+        try:
+            with span('watch sync', 'phase'):
+                data = read_config_file(self.config_file)
+                changed = get_changed_keys(self.data, data)
+                result.changed_keys = sorted(changed)
+                if changed:
+                    config = self.cfg.load_config_data(data)
+                    artifacts = get_affected_artifacts(config, changed)
+                    self.cfg.config, self.data = config, data
+                    result.written = [a.filename for a in artifacts if self.cfg.build_artifact(a, incremental = True)]
+                    self.cfg.manifest.save()
+                    if not self.commit: self.cfg.repo_files.clear()
+        except Exception as e:
+            # Usually a half-saved or invalid file, the next save retries
+            result.error = f'{type(e).__name__}: {e}'.splitlines()[0]
+        result.seconds = time.perf_counter() - start
+        self.syncs.append(result)
+        if result.written and self.commit:
+            self.uncommitted += 1
+            if self.commit_every and self.uncommitted >= self.commit_every: self.commit_changes()
+        return result
+
+    def commit_changes(self) -> bool:
+        if not self.cfg.repo_files: return False
+        files = list(dict.fromkeys(self.cfg.repo_files))
+        logger.info(f'Committing {len(files)} Files: {self.commit_msg}')
+        with span('git add', 'git', files = len(files)): self.cfg.repo.index.add(files)
+        with span('git commit', 'git'): self.cfg.repo.index.commit(self.commit_msg)
+        self.cfg.repo_files.clear()
+        self.uncommitted = 0
+        return True
+
+    def log_sync(self, result: WatchSync):
+        if result.error: logger.error(f'Sync failed: {result.error}')
+        elif not result.changed_keys: logger.info('No metadata changes')
+        else: logger.info(f'Changed {", ".join(result.changed_keys)}: wrote {", ".join(result.written) or "nothing"} ({result.seconds * 1000:.1f}ms)')
+
+    def run(self, max_syncs: int = None):
+        """
+        Watches until interrupted (or `max_syncs` syncs ran), then commits what's left when committing
+        """
+        self.start_watcher()
+        logger.info(f'Watching {self.config_file.as_posix()} ({self.watcher.mode})')
+        pending, deadline = set(), None
+        try:
+            while max_syncs is None or len(self.syncs) < max_syncs:
+                changed = self.watcher.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+                if changed:
+                    pending |= changed
+                    deadline = time.monotonic() + self.debounce
+                    continue
+                if deadline is None or time.monotonic() < deadline: continue
+                edited = self.config_file in pending
+                if pending & set(self.state_files) and self.resolve_config_file(): edited = True
+                pending, deadline = set(), None
+                if edited: self.log_sync(self.sync())
+        except KeyboardInterrupt: pass
+        finally:
+            self.watcher.close()
+            if self.commit: self.commit_changes()
+
+
+__all__ = [
+    'artifact_inputs',
+    'get_changed_keys',
+    'get_affected_artifacts',
+    'FileWatcher',
+    'WatchSync',
+    'ProjectWatcher',
+]
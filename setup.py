@@ -6,10 +6,10 @@ from setuptools import setup, find_packages
 if sys.version_info.major != 3:
     raise RuntimeError("This package requires Python 3+")
 
-version = '0.0.3'
 pkg_name = 'pylibup'
 gitrepo = 'trisongz/pylibup'
 root = Path(__file__).parent
+version = root.joinpath(pkg_name, 'version.py').read_text().split('=')[-1].strip().strip("'")
 
 requirements = [
     'typer',
@@ -27,8 +27,8 @@ args = {
     'long_description': root.joinpath('README.md').read_text(encoding='utf-8'),
     'entry_points': {
         'console_scripts': [
-            'pylibup = pylibup.cli:baseCli',
-            'pylib = pylibup.cli:baseCli'
+            'pylibup = pylibup.daemon:main',
+            'pylib = pylibup.daemon:main'
         ]
     }
 }